@@ -1,5 +1,5 @@
 import os
-from septa.core.utils import get_today_date, get_timestamp
+from septa.core.utils import get_timestamp
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data")
@@ -10,30 +10,126 @@ API_URLS = {
     "train_view": "https://www3.septa.org/api/TrainView/index.php",
     "rr_schedules": "https://www3.septa.org/api/RRSchedules/index.php?req1=",
     "trip_updates": "https://www3.septa.org/gtfsrt/septarail-pa-us/Trip/rtTripUpdates.pb",
-    "rss_url": "https://github.com/septadev/GTFS/releases.atom",
     "gtfs_public": "https://www3.septa.org/developer/gtfs_public.zip"
 }
 
-TRAIN_VIEW_LOG_DIR = os.path.join(LOGS_DIR, "train-view", get_today_date())
+RR_SCHEDULES_CONCURRENCY = 8       # requests in flight at once
+RR_SCHEDULES_POOL_SIZE = 8         # keep-alive connections in the aiohttp pool
+RR_SCHEDULES_TIMEOUT = 15          # seconds per request
+RR_SCHEDULES_RETRIES = 3           # retries on 5xx, timeouts and dropped connections
+RR_SCHEDULES_BACKOFF = 0.5         # base seconds for jittered exponential backoff
 
-RR_SCHEDULES_DIR = os.path.join(LOGS_DIR, "rr-schedules", get_today_date())
-RR_SCHEDULES_JSON = os.path.join(SCRAPING_DIR, f"rr_schedules_{get_timestamp()}.json")
-
-TRIP_UPDATES_LOG_DIR = os.path.join(LOGS_DIR, "trip-updates", get_today_date())
+# Shared HTTP client (see septa.core.http). Timeouts are seconds per request
+# (per socket read for streamed downloads).
+HTTP_TIMEOUTS = {
+    "train_view": 15,
+    "trip_updates": 15,
+    "rr_schedules": RR_SCHEDULES_TIMEOUT,
+    "gtfs_public": 30,
+}
+HTTP_DEFAULT_TIMEOUT = 30
+HTTP_POOL_SIZE = 8                # keep-alive connections per host
+HTTP_BREAKER_FAILURES = 5         # consecutive failures that open a feed's circuit
+HTTP_BREAKER_COOLDOWN = 30        # seconds before the first probe; doubles per failed probe
+HTTP_BREAKER_MAX_COOLDOWN = 900
 
 GTFS_ZIP_PATH = os.path.join(DATA_DIR, "septa_gtfs.zip")
 GTFS_RAIL_PATH = os.path.join(DATA_DIR, "google_rail.zip")
 GTFS_DB_PATH = os.path.join(DATA_DIR, "septa.sqlite")
+GTFS_DB_URL = f"sqlite:///{GTFS_DB_PATH}"
+# Validators and per-table hashes from the last GTFS refresh.
+GTFS_STATE_PATH = os.path.join(DATA_DIR, "gtfs_state.json")
+# Nested feed inside gtfs_public.zip that gets loaded into septa.sqlite.
+GTFS_FEED_MEMBER = "google_rail.zip"
+
+# Per-feed HTTP validators, payload hash and feed version of the last
+# stored TrainView/TripUpdates response (see septa.core.fetcher).
+FETCH_STATE_PATH = os.path.join(DATA_DIR, "fetch_state.json")
 
 TRAIN_VIEW_DB_PATH = os.path.join(DATA_DIR, "train_view.db")
 TRAIN_VIEW_DB_URL = f"sqlite:///{TRAIN_VIEW_DB_PATH}"
+# "wide" stores snapshots as-is in `train_view`; "compact" stores them in
+# `train_view_compact` with strings replaced by dictionary keys, readable in
+# the wide shape through the `train_view_decoded` view.
+TRAIN_VIEW_STORAGE_MODE = "wide"
 
 TRIP_UPDATES_DB_PATH = os.path.join(DATA_DIR, "trip_updates.db")
 TRIP_UPDATES_DB_URL = f"sqlite:///{TRIP_UPDATES_DB_PATH}"
+# "full" stores every stop update of every poll in `trip_updates`; "delta"
+# stores only changes as intervals in `trip_update_intervals`, readable per
+# poll through the `trip_updates_replayed` view.
+TRIP_UPDATES_STORAGE_MODE = "full"
+
+# Per-stop RRSchedules times, one row per (service_date, block_id, station).
+RR_SCHEDULES_DB_PATH = os.path.join(DATA_DIR, "rr_schedules.db")
+RR_SCHEDULES_DB_URL = f"sqlite:///{RR_SCHEDULES_DB_PATH}"
+
+# Delay rollups derived from trip_updates.
+ANALYTICS_DB_PATH = os.path.join(DATA_DIR, "analytics.db")
+ANALYTICS_DB_URL = f"sqlite:///{ANALYTICS_DB_PATH}"
+
+# Pragmas applied to every SQLite connection (see septa.core.storage).
+SQLITE_PRAGMAS = {
+    "auto_vacuum": "INCREMENTAL",  # must precede journal_mode to apply to new files
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 10000,        # ms to wait for a lock before failing
+    "mmap_size": 268435456,       # 256 MiB memory-mapped reads
+    "cache_size": -65536,         # 64 MiB page cache
+    "temp_store": "MEMORY",
+}
+# septa.sqlite is replaced as a whole file on every GTFS load, so it keeps a
+# rollback journal: a WAL sidecar would outlive the file it belongs to.
+GTFS_SQLITE_PRAGMAS = dict(SQLITE_PRAGMAS, journal_mode="DELETE")
+
+# Daily Parquet partitions of closed train_view/trip_updates days.
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archive")
+
+# Per-job Prometheus text files and JSON summaries (see septa.core.metrics).
+METRICS_DIR = os.path.join(DATA_DIR, "metrics")
+
+# Raw responses of the feeds listed in RECORD_FEEDS (e.g. ("train_view",
+# "trip_updates")) are kept as rotating segments for `python -m septa.replay`.
+RECORD_DIR = os.path.join(DATA_DIR, "recordings")
+RECORD_FEEDS = ()
+RECORD_SEGMENT_BYTES = 64 * 1024 * 1024
+
+# Retention of the history tables, per feed: (age in days, seconds between
+# kept rows) tiers, youngest first. Rows older than a tier's age are thinned
+# to one per train (trip_updates: per trip and stop) per interval, or deleted
+# when it is None. Rows are folded into hourly summaries (train_view_hourly,
+# the analytics rollups) before they are thinned.
+RETENTION_TIERS = {
+    "train_view": ((7, 600), (30, None)),
+    "trip_updates": ((7, 600), (30, None)),
+}
+RETENTION_BATCH_ROWS = 5000       # rows per delete transaction
+RETENTION_BATCH_PAUSE = 0.05      # seconds between delete batches, for the scrapers
+RETENTION_VACUUM_PAGES = 1024     # pages per incremental_vacuum step
+RETENTION_VACUUM_SECONDS = 5.0    # time budget per database for freeing pages
+
+# Per-day shard databases of `python -m septa.backfill` and their .done markers.
+BACKFILL_DIR = os.path.join(DATA_DIR, "backfill")
+
+# Polling schedule for `python -m septa.daemon`. Each window is
+# (start_hour, end_hour, seconds) in local time and must not wrap midnight;
+# hours outside every window poll at the default interval.
+DAEMON_SCHEDULES = {
+    "train_view": {"default": 60, "windows": [(6, 10, 30), (15, 19, 30), (1, 5, 600)]},
+    "trip_updates": {"default": 60, "windows": [(6, 10, 30), (15, 19, 30), (1, 5, 600)]},
+}
+
+# Read API served by the daemon (see septa.api) from an in-memory snapshot
+# of the latest polls. Bodies are cached per snapshot for API_CACHE_TTL seconds.
+API_ENABLED = True
+API_HOST = os.environ.get("SEPTA_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("SEPTA_API_PORT", "8642"))
+API_CACHE_TTL = 30
+API_CACHE_SIZE = 256              # cached bodies, least recently used evicted first
+API_HISTORY_MINUTES = 120         # positions kept per train for /trains/{id}/history
+
 
-os.makedirs(LOGS_DIR, exist_ok=True)
-os.makedirs(SCRAPING_DIR, exist_ok=True)
-os.makedirs(TRAIN_VIEW_LOG_DIR, exist_ok=True)
-os.makedirs(RR_SCHEDULES_DIR, exist_ok=True)
-os.makedirs(TRIP_UPDATES_LOG_DIR, exist_ok=True)
+def get_rr_schedules_path():
+    """Return a fresh timestamped path for one gzip NDJSON RRSchedules snapshot."""
+    return os.path.join(SCRAPING_DIR, f"rr_schedules_{get_timestamp()}.ndjson.gz")
 
@@ -5,10 +5,9 @@ echo "🚀 Starting SEPTA Scraper..."
 # Get the correct Python path dynamically
 PYTHON_PATH=$(which python3)
 
-# Write cron jobs to a file using the correct Python path
+# rrschedules still runs once a day from cron; retention trims history hourly
 echo "45 23,0-1 * * * cd /septa-delay && $PYTHON_PATH -m septa.rrschedules >> /septa-delay/logs/rrschedules_cron.log 2>&1" > mycron
-echo "*/10 4-23,0-1 * * * cd /septa-delay && $PYTHON_PATH -m septa.train_view >> /septa-delay/logs/train_view_cron.log 2>&1" >> mycron
-echo "*/10 4-23,0-1 * * * cd /septa-delay && $PYTHON_PATH -m septa.trip_updates >> /septa-delay/logs/trip_updates_cron.log 2>&1" >> mycron
+echo "20 * * * * cd /septa-delay && $PYTHON_PATH -m septa.retention >> /septa-delay/logs/retention_cron.log 2>&1" >> mycron
 
 # Install the cron jobs
 crontab mycron
@@ -16,4 +15,8 @@ crontab mycron
 # Start cron
 service cron start
 
-echo "✅ Cron jobs installed with Python path: $PYTHON_PATH"
\ No newline at end of file
+echo "✅ Cron jobs installed with Python path: $PYTHON_PATH"
+
+# Train View and Trip Updates are polled by the long-running daemon
+cd /septa-delay
+exec $PYTHON_PATH -m septa.daemon >> /septa-delay/logs/daemon.log 2>&1
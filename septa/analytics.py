@@ -0,0 +1,223 @@
+"""Delay statistics rolled up incrementally from `trip_updates`.
+
+Run with `python -m septa.analytics` to fold the trip updates fetched since
+the last run into the rollup tables in analytics.db and print per-line
+statistics.
+
+Each `trip_updates` row counts as one delay observation (in delta storage
+mode, each row of the `trip_updates_replayed` view). Rollups are kept
+per (UTC hour, route, stop): `delay_rollup` holds counts and sums, and
+`delay_histogram` holds counts per `DELAY_BIN_SECONDS` bin. Both can be
+added up across runs, so percentiles for any grouping come from summing
+histograms rather than rescanning raw rows.
+"""
+import pandas as pd
+from sqlalchemy import Column, Integer, String, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from septa.core.database import Base, get_engine, trip_update_polls_source, trip_updates_range_sql
+from septa.core.gtfs import trip_routes
+from septa.core.logger import setup_logging
+
+logger = setup_logging("analytics")
+
+DELAY_BIN_SECONDS = 60
+ON_TIME_THRESHOLD_SECONDS = 360  # SEPTA counts a train on time below six minutes late
+ROLLUP_CHUNK_SIZE = 200_000
+UNKNOWN_ROUTE = "unknown"
+ROLLUP_KEYS = ("hour", "route_id", "stop_id")
+
+
+class DelayRollup(Base):
+    __tablename__ = "delay_rollup"
+
+    hour = Column(String, primary_key=True)
+    route_id = Column(String, primary_key=True)
+    stop_id = Column(String, primary_key=True)
+    observations = Column(Integer, nullable=False)
+    delay_sum = Column(Integer, nullable=False)
+    on_time = Column(Integer, nullable=False)
+
+
+class DelayHistogram(Base):
+    __tablename__ = "delay_histogram"
+
+    hour = Column(String, primary_key=True)
+    route_id = Column(String, primary_key=True)
+    stop_id = Column(String, primary_key=True)
+    bin = Column(Integer, primary_key=True)
+    observations = Column(Integer, nullable=False)
+
+
+class RollupState(Base):
+    __tablename__ = "rollup_state"
+
+    name = Column(String, primary_key=True)
+    high_water = Column(String, nullable=False)  # newest processed fetched_at, as stored
+
+
+def init_analytics_db():
+    Base.metadata.create_all(
+        bind=get_engine("analytics"),
+        tables=[DelayRollup.__table__, DelayHistogram.__table__, RollupState.__table__],
+    )
+
+
+def _additive_upsert(table, key_columns):
+    """INSERT that adds to the counters of an existing row instead of failing."""
+    stmt = sqlite_insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=list(key_columns),
+        set_={
+            column.name: column + stmt.excluded[column.name]
+            for column in table.columns if column.name not in key_columns
+        },
+    )
+
+
+def _aggregate(df, routes):
+    """Vectorised per-chunk rollup and histogram rows."""
+    df = df.dropna(subset=["delay"])
+    delay = df["delay"].astype("int64")
+    frame = pd.DataFrame({
+        "hour": df["fetched_at"].str.slice(0, 13) + ":00:00",
+        "route_id": df["trip_id"].map(routes).fillna(UNKNOWN_ROUTE),
+        "stop_id": df["stop_id"],
+        "delay": delay,
+        "on_time": (delay < ON_TIME_THRESHOLD_SECONDS).astype("int64"),
+        "bin": (delay // DELAY_BIN_SECONDS) * DELAY_BIN_SECONDS,
+    })
+
+    grouped = frame.groupby(list(ROLLUP_KEYS))
+    rollup = pd.DataFrame({
+        "observations": grouped.size(),
+        "delay_sum": grouped["delay"].sum(),
+        "on_time": grouped["on_time"].sum(),
+    }).reset_index()
+    histogram = frame.groupby([*ROLLUP_KEYS, "bin"]).size().rename("observations").reset_index()
+    return rollup, histogram
+
+
+def _fold(target, start_op, start, end, chunk_size):
+    """Add trip updates with `fetched_at {start_op} start` and `<= end` to the rollups; return the row count."""
+    routes = trip_routes()
+    query = text(trip_updates_range_sql(("fetched_at", "trip_id", "stop_id", "delay"), start_op=start_op, end_op="<="))
+    rollup_stmt = _additive_upsert(DelayRollup.__table__, ROLLUP_KEYS)
+    histogram_stmt = _additive_upsert(DelayHistogram.__table__, (*ROLLUP_KEYS, "bin"))
+
+    processed = 0
+    with get_engine("trip_updates").connect() as source:
+        for chunk in pd.read_sql(query, source, params={"start": start, "end": end}, chunksize=chunk_size):
+            rollup, histogram = _aggregate(chunk, routes)
+            if not rollup.empty:
+                target.execute(rollup_stmt, rollup.to_dict("records"))
+                target.execute(histogram_stmt, histogram.to_dict("records"))
+            processed += len(chunk)
+    return processed
+
+
+def _high_water():
+    with get_engine("analytics").connect() as conn:
+        return conn.execute(text("SELECT high_water FROM rollup_state WHERE name = 'trip_updates'")).scalar()
+
+
+def update_rollups(chunk_size=ROLLUP_CHUNK_SIZE):
+    """Fold trip updates newer than the stored high-water mark into the rollups.
+
+    Rows with `fetched_at` in (high water, newest fetched_at] are processed
+    in chunks. The rollups and the new high-water mark are committed in one
+    transaction, so a failed run is simply repeated next time. Returns the
+    number of rows processed.
+    """
+    init_analytics_db()
+    high_water = _high_water()
+    with get_engine("trip_updates").connect() as conn:
+        newest = conn.execute(text(f"SELECT MAX(fetched_at) FROM {trip_update_polls_source()}")).scalar()
+    if newest is None or (high_water is not None and newest <= high_water):
+        logger.info("Delay rollups are up to date.")
+        return 0
+
+    with get_engine("analytics").begin() as target:
+        processed = _fold(target, ">", high_water or "", newest, chunk_size)
+        target.exec_driver_sql(
+            "INSERT INTO rollup_state (name, high_water) VALUES ('trip_updates', ?) "
+            "ON CONFLICT (name) DO UPDATE SET high_water = excluded.high_water",
+            (newest,),
+        )
+
+    logger.info(f"Rolled up {processed} trip updates up to {newest}.")
+    return processed
+
+
+def fold_merged(start, end, chunk_size=ROLLUP_CHUNK_SIZE):
+    """Fold trip updates merged in with `fetched_at` in [start, end] behind the high-water mark.
+
+    `update_rollups` only reads past the mark, so rows that `septa.backfill`
+    merges at or below it would never be counted. The part of [start, end]
+    above the mark is left to `update_rollups`. Returns the number of rows
+    processed.
+    """
+    init_analytics_db()
+    high_water = _high_water()
+    if high_water is None or start > high_water:
+        return 0
+
+    with get_engine("analytics").begin() as target:
+        processed = _fold(target, ">=", start, min(end, high_water), chunk_size)
+    logger.info(f"Rolled up {processed} merged trip updates from {start} behind the high-water mark.")
+    return processed
+
+
+def _histogram_percentiles(histogram, keys, percentiles):
+    """Per-group delay percentiles (bin lower bounds) from summed histograms."""
+    histogram = histogram.sort_values([*keys, "bin"])
+    grouped = histogram.groupby(keys, sort=False)["observations"]
+    cumulative = grouped.cumsum()
+    total = grouped.transform("sum")
+
+    result = {}
+    for p in percentiles:
+        reached = histogram[cumulative >= p * total]
+        result[f"p{round(p * 100)}"] = reached.groupby(keys)["bin"].first()
+    return pd.DataFrame(result)
+
+
+def delay_stats(by=("route_id",), start=None, end=None, percentiles=(0.5, 0.9, 0.95)):
+    """Delay distribution per group from the rollup tables.
+
+    `by` can combine "route_id", "stop_id", "hour" (UTC hour bucket) and
+    "hour_of_day". `start`/`end` bound the hour buckets, as
+    "YYYY-MM-DD HH:00:00" strings. Returns observations, mean delay and
+    on-time share in seconds/fractions plus the requested percentiles.
+    """
+    keys = list(by)
+    where = []
+    params = {}
+    if start:
+        where.append("hour >= :start")
+        params["start"] = start
+    if end:
+        where.append("hour < :end")
+        params["end"] = end
+    condition = f"WHERE {' AND '.join(where)}" if where else ""
+
+    with get_engine("analytics").connect() as conn:
+        rollup = pd.read_sql(text(f"SELECT * FROM delay_rollup {condition}"), conn, params=params)
+        histogram = pd.read_sql(text(f"SELECT * FROM delay_histogram {condition}"), conn, params=params)
+
+    for frame in (rollup, histogram):
+        frame["hour_of_day"] = frame["hour"].str.slice(11, 13).astype("int64")
+
+    totals = rollup.groupby(keys)[["observations", "delay_sum", "on_time"]].sum()
+    stats = pd.DataFrame({
+        "observations": totals["observations"],
+        "mean_delay": totals["delay_sum"] / totals["observations"],
+        "on_time_share": totals["on_time"] / totals["observations"],
+    })
+    summed = histogram.groupby([*keys, "bin"], as_index=False)["observations"].sum()
+    return stats.join(_histogram_percentiles(summed, keys, percentiles)).reset_index()
+
+
+if __name__ == "__main__":
+    update_rollups()
+    print(delay_stats().to_string(index=False))
@@ -0,0 +1,314 @@
+"""Local read API over a live in-memory snapshot of the polled feeds.
+
+Served by `python -m septa.daemon` on API_HOST:API_PORT when API_ENABLED:
+
+- `GET /positions`: latest position of every train
+- `GET /delays/lines`: trains, mean and max minutes late per line
+- `GET /delays/stops`: predictions, mean and max delay seconds per stop
+- `GET /trains/{train_id}/history`: the train's positions over the last
+  API_HISTORY_MINUTES
+
+The store functions call back into this module once a poll has committed
+(`database.add_store_listener`), and each callback swaps in a new immutable
+`Snapshot` built from the rows just stored, so requests never touch the
+databases. Only the start-up warm-up reads them, for positions and history;
+delays by stop fill in with the first Trip Updates poll. Response bodies
+are serialized once per snapshot version and kept in a TTL/LRU cache.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from statistics import fmean
+from types import MappingProxyType
+
+from septa.core import database
+from septa.core.metrics import increment
+from config import API_HOST, API_PORT, API_CACHE_TTL, API_CACHE_SIZE, API_HISTORY_MINUTES
+
+logger = logging.getLogger("api")
+
+HISTORY_COLUMNS = ("timestamp", "lat", "lon", "heading", "current_stop", "next_stop", "late")
+
+
+class Snapshot:
+    """One read-only view of the feeds; replaced, never modified."""
+
+    __slots__ = ("version", "positions", "position_time", "stop_delays", "delay_time", "history")
+
+    def __init__(self, version=0, positions=(), position_time=None, stop_delays=(), delay_time=None,
+                 history=MappingProxyType({})):
+        self.version = version
+        # Rows are MappingProxyType views, sequences are tuples.
+        self.positions = positions
+        self.position_time = position_time
+        self.stop_delays = stop_delays
+        self.delay_time = delay_time
+        self.history = history
+
+    def replace(self, **changes):
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes, version=self.version + 1)
+        return Snapshot(**fields)
+
+
+class ResponseCache:
+    """LRU cache of serialized bodies whose entries expire after `ttl` seconds."""
+
+    def __init__(self, ttl=None, size=None):
+        self.ttl = API_CACHE_TTL if ttl is None else ttl
+        self.size = size or API_CACHE_SIZE
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, body = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_snapshot = Snapshot()
+# Serializes the read-modify-write of `_snapshot`; readers just take the reference.
+_lock = threading.Lock()
+_cache = ResponseCache()
+
+
+def current():
+    """Return the current snapshot."""
+    return _snapshot
+
+
+def _swap(changes):
+    """Replace the snapshot with one updated by `changes(snapshot) -> {field: value}`."""
+    global _snapshot
+    with _lock:
+        _snapshot = _snapshot.replace(**changes(_snapshot))
+
+
+def _history_window(timestamp):
+    return timestamp - timedelta(minutes=API_HISTORY_MINUTES)
+
+
+def _history_point(row):
+    return MappingProxyType({column: row[column] for column in HISTORY_COLUMNS})
+
+
+def _with_history(history, rows, since):
+    """`history` with `rows` appended and points older than `since` dropped."""
+    added = {}
+    for row in rows:
+        added.setdefault(row["train_id"], []).append(_history_point(row))
+
+    merged = {}
+    for train_id in history.keys() | added.keys():
+        points = tuple(
+            point for point in history.get(train_id, ()) + tuple(added.get(train_id, ()))
+            if point["timestamp"] >= since
+        )
+        if points:
+            merged[train_id] = points
+    return MappingProxyType(merged)
+
+
+def on_train_view_stored(rows):
+    """Store listener: make the stored poll the current positions."""
+    timestamp = max(row["timestamp"] for row in rows)
+    positions = tuple(MappingProxyType(dict(row)) for row in rows if row["timestamp"] == timestamp)
+    _swap(lambda snapshot: {
+        "positions": positions,
+        "position_time": timestamp,
+        "history": _with_history(snapshot.history, rows, _history_window(timestamp)),
+    })
+
+
+def on_trip_updates_stored(rows):
+    """Store listener: make the stored poll the current stop delays."""
+    fetched_at = max(row[0] for row in rows)
+    stop_delays = tuple(
+        MappingProxyType(dict(zip(database.TRIP_UPDATE_COLUMNS, row))) for row in rows if row[0] == fetched_at
+    )
+    _swap(lambda snapshot: {"stop_delays": stop_delays, "delay_time": fetched_at})
+
+
+def warm(now=None):
+    """Seed positions and history from train_view; the only database read."""
+    from septa.core.queries import latest_snapshot, recent_positions
+
+    now = now or datetime.utcnow()
+    since = _history_window(now)
+    # Stored datetimes come back as strings; the snapshot keeps datetimes.
+    positions = tuple(
+        MappingProxyType({**row, "timestamp": _as_datetime(row["timestamp"])}) for row in latest_snapshot(now=now)
+    )
+    recent = [{**row, "timestamp": _as_datetime(row["timestamp"])} for row in recent_positions(since)]
+    _swap(lambda snapshot: {
+        "positions": positions,
+        "position_time": max((row["timestamp"] for row in positions), default=None),
+        "history": _with_history(snapshot.history, recent, since),
+    })
+    logger.info(f"API snapshot warmed with {len(positions)} trains.")
+
+
+def _as_datetime(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, MappingProxyType):
+        return dict(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _dumps(payload):
+    return json.dumps(payload, default=_default, separators=(",", ":")).encode()
+
+
+def positions_body(snapshot):
+    return _dumps({"as_of": snapshot.position_time, "trains": snapshot.positions})
+
+
+def line_delays_body(snapshot):
+    lines = {}
+    for row in snapshot.positions:
+        lines.setdefault(row["line"], []).append(row["late"])
+
+    summaries = []
+    for line, late in sorted(lines.items(), key=lambda item: item[0] or ""):
+        known = [minutes for minutes in late if minutes is not None]
+        summaries.append({
+            "line": line,
+            "trains": len(late),
+            "mean_late": round(fmean(known), 1) if known else None,
+            "max_late": max(known, default=None),
+        })
+    return _dumps({"as_of": snapshot.position_time, "lines": summaries})
+
+
+def stop_delays_body(snapshot):
+    stops = {}
+    for row in snapshot.stop_delays:
+        if row["delay"] is not None:
+            stops.setdefault(row["stop_id"], []).append(row["delay"])
+    return _dumps({
+        "as_of": snapshot.delay_time,
+        "stops": [
+            {"stop_id": stop_id, "predictions": len(delays), "mean_delay": round(fmean(delays), 1),
+             "max_delay": max(delays)}
+            for stop_id, delays in sorted(stops.items())
+        ],
+    })
+
+
+def history_body(snapshot, train_id):
+    points = snapshot.history.get(train_id)
+    if points is None:
+        return None
+    return _dumps({"train_id": train_id, "positions": points})
+
+
+def cached_body(endpoint, build, *args):
+    """Serialized body of `endpoint` for the current snapshot, built at most once per version."""
+    snapshot = _snapshot
+    key = (endpoint, snapshot.version, *args)
+    body = _cache.get(key)
+    if body is None:
+        increment("api_cache", endpoint=endpoint, result="miss")
+        body = build(snapshot, *args)
+        _cache.put(key, body)
+    else:
+        increment("api_cache", endpoint=endpoint, result="hit")
+    return snapshot, body
+
+
+def _respond(endpoint, build, *args):
+    from aiohttp import web
+
+    snapshot, body = cached_body(endpoint, build, *args)
+    if body is None:
+        raise web.HTTPNotFound(text=f"No recent positions for train {args[0]}\n")
+    return web.Response(body=body, content_type="application/json",
+                        headers={"X-Snapshot-Version": str(snapshot.version)})
+
+
+async def handle_positions(request):
+    return _respond("positions", positions_body)
+
+
+async def handle_line_delays(request):
+    return _respond("delays_lines", line_delays_body)
+
+
+async def handle_stop_delays(request):
+    return _respond("delays_stops", stop_delays_body)
+
+
+async def handle_history(request):
+    return _respond("history", history_body, request.match_info["train_id"])
+
+
+def make_app():
+    from aiohttp import web
+
+    app = web.Application()
+    app.router.add_get("/positions", handle_positions)
+    app.router.add_get("/delays/lines", handle_line_delays)
+    app.router.add_get("/delays/stops", handle_stop_delays)
+    app.router.add_get("/trains/{train_id}/history", handle_history)
+    return app
+
+
+def install():
+    """Refresh the snapshot after every committed Train View and Trip Updates store."""
+    database.add_store_listener("train_view", on_train_view_stored)
+    database.add_store_listener("trip_updates", on_trip_updates_stored)
+
+
+def uninstall():
+    database.remove_store_listener("train_view", on_train_view_stored)
+    database.remove_store_listener("trip_updates", on_trip_updates_stored)
+
+
+async def start(host=None, port=None):
+    """Install the store listeners, warm the snapshot and serve; return the AppRunner."""
+    import asyncio
+    from aiohttp import web
+
+    install()
+    try:
+        await asyncio.to_thread(warm)
+    except Exception as e:
+        logger.error(f"Warming the API snapshot failed: {e}")
+
+    runner = web.AppRunner(make_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host or API_HOST, port or API_PORT)
+    await site.start()
+    logger.info(f"Read API listening on http://{host or API_HOST}:{port or API_PORT}.")
+    return runner
+
+
+async def stop(runner):
+    uninstall()
+    await runner.cleanup()
@@ -0,0 +1,176 @@
+"""Columnar archive of closed days of train_view and trip_updates history.
+
+Run with `python -m septa.archive` to export every closed (UTC) day that is
+not archived yet. Each day is written as zstd-compressed Parquet files laid
+out as::
+
+    ARCHIVE_DIR/<feed>/date=YYYY-MM-DD/line=<line>/part.parquet
+
+`read_archive` only opens the partitions inside the requested date range
+and lines. Trip updates carry no line of their own; their `line` is the
+GTFS `route_id` of the trip, or "unknown" when the trip is not in
+septa.sqlite.
+"""
+import os
+import shutil
+from datetime import date, datetime, timedelta
+from urllib.parse import quote, unquote
+
+import pandas as pd
+from sqlalchemy import text
+
+from septa.core.database import (
+    db_datetime, get_engine, train_view_source, trip_update_polls_source, trip_updates_range_sql,
+)
+from septa.core.gtfs import trip_routes
+from septa.core.logger import setup_logging
+from config import ARCHIVE_DIR
+
+logger = setup_logging("archive")
+
+FEEDS = {
+    "train_view": {"time_column": "timestamp"},
+    "trip_updates": {"time_column": "fetched_at"},
+}
+
+UNKNOWN_LINE = "unknown"
+
+
+def _feed_dir(feed):
+    return os.path.join(ARCHIVE_DIR, feed)
+
+
+def archived_days(feed):
+    """Return the sorted dates that have a partition directory for `feed`."""
+    feed_dir = _feed_dir(feed)
+    if not os.path.isdir(feed_dir):
+        return []
+    return sorted(
+        date.fromisoformat(name[len("date="):])
+        for name in os.listdir(feed_dir)
+        if name.startswith("date=")
+    )
+
+
+def _sources(feed):
+    """(day query, time column, bound, poll times relation) of `feed` in the configured storage mode.
+
+    The day query selects rows with the time column in [:start, :end);
+    `bound` turns a naive-UTC datetime into a value comparable with it.
+    """
+    if feed == "trip_updates":
+        return trip_updates_range_sql(), FEEDS[feed]["time_column"], db_datetime, trip_update_polls_source()
+    source, time_column, bound = train_view_source()
+    query = f"SELECT * FROM {source} WHERE {time_column} >= :start AND {time_column} < :end"
+    return query, time_column, bound, source
+
+
+def _first_day(feed):
+    """First day not archived yet, or the day of the oldest row in the database."""
+    days = archived_days(feed)
+    if days:
+        return days[-1] + timedelta(days=1)
+
+    spec = FEEDS[feed]
+    _, time_column, _, polls = _sources(feed)
+    with get_engine(feed).connect() as conn:
+        oldest = conn.execute(text(
+            f"SELECT {spec['time_column']} FROM {polls} ORDER BY {time_column} LIMIT 1"
+        )).scalar()
+    return datetime.fromisoformat(oldest).date() if oldest else None
+
+
+def _read_day(feed, day):
+    spec = FEEDS[feed]
+    query, time_column, bound, _ = _sources(feed)
+    params = {
+        "start": bound(datetime.combine(day, datetime.min.time())),
+        "end": bound(datetime.combine(day + timedelta(days=1), datetime.min.time())),
+    }
+    with get_engine(feed).connect() as conn:
+        df = pd.read_sql(text(query), conn, params=params, parse_dates=[spec["time_column"]])
+    # The compact view's integer `ts` only serves the range filter.
+    return df.drop(columns=[time_column]) if time_column != spec["time_column"] else df
+
+
+def compact_day(feed, day, trip_lines=None):
+    """Export one day of `feed` into its partition directory; return the row count.
+
+    The partition is written next to its final location and renamed into
+    place, so readers never see a half-written day. An already archived
+    day is replaced.
+    """
+    df = _read_day(feed, day)
+    if feed == "trip_updates":
+        df["line"] = df["trip_id"].map(trip_lines or {})
+    df["line"] = df["line"].fillna(UNKNOWN_LINE).replace("", UNKNOWN_LINE)
+
+    final_dir = os.path.join(_feed_dir(feed), f"date={day.isoformat()}")
+    staging_dir = os.path.join(_feed_dir(feed), f".staging-{day.isoformat()}")
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+
+    for line, group in df.groupby("line", sort=False):
+        line_dir = os.path.join(staging_dir, f"line={quote(line, safe='')}")
+        os.makedirs(line_dir)
+        group.drop(columns="line").to_parquet(
+            os.path.join(line_dir, "part.parquet"), index=False, compression="zstd"
+        )
+
+    # os.replace cannot overwrite a non-empty directory: a re-archived day
+    # moves the old partition aside first and drops it once replaced.
+    previous_dir = os.path.join(_feed_dir(feed), f".previous-{day.isoformat()}")
+    shutil.rmtree(previous_dir, ignore_errors=True)
+    if os.path.isdir(final_dir):
+        os.replace(final_dir, previous_dir)
+    os.replace(staging_dir, final_dir)
+    shutil.rmtree(previous_dir, ignore_errors=True)
+    return len(df)
+
+
+def compact(feeds=tuple(FEEDS), until=None):
+    """Archive every closed day of `feeds` before `until` (default: today, UTC)."""
+    until = until or datetime.utcnow().date()
+    for feed in feeds:
+        day = _first_day(feed)
+        if day is None:
+            logger.info(f"No {feed} rows to archive.")
+            continue
+
+        trip_lines = trip_routes() if feed == "trip_updates" else None
+        while day < until:
+            count = compact_day(feed, day, trip_lines)
+            logger.info(f"Archived {count} {feed} rows for {day}.")
+            day += timedelta(days=1)
+
+
+def read_archive(feed, start, end, lines=None, columns=None):
+    """Load archived `feed` rows for days in [start, end], optionally only some lines.
+
+    Partitions outside the date range or line list are never opened, and
+    `columns` limits the Parquet columns that are read.
+    """
+    wanted_lines = {quote(line, safe="") for line in lines} if lines else None
+    file_columns = [column for column in columns if column != "line"] if columns else None
+    frames = []
+
+    for day in archived_days(feed):
+        if not start <= day <= end:
+            continue
+        day_dir = os.path.join(_feed_dir(feed), f"date={day.isoformat()}")
+        for name in sorted(os.listdir(day_dir)):
+            encoded = name[len("line="):]
+            if wanted_lines is not None and encoded not in wanted_lines:
+                continue
+            frame = pd.read_parquet(os.path.join(day_dir, name, "part.parquet"), columns=file_columns)
+            if columns is None or "line" in columns:
+                frame["line"] = unquote(encoded)
+            frames.append(frame)
+
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+if __name__ == "__main__":
+    compact()
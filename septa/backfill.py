@@ -0,0 +1,388 @@
+"""Rebuild history databases from raw inputs, one day per worker process.
+
+Run with `python -m septa.backfill [--feeds train_view trip_updates rr_schedules]
+[--start YYYY-MM-DD] [--end YYYY-MM-DD] [--jobs N] [--train-view-url URL]
+[--trip-updates-url URL] [--rr-schedules-url URL]`. Inputs are the recorded
+TrainView/TripUpdates segments (see septa.core.recorder) and the RRSchedules
+snapshots in `scraping/`.
+
+Each (feed, day) is parsed by its own process into a shard database under
+`BACKFILL_DIR`, through the same store functions the scrapers use, and
+marked done with a `.done` file. Shards are then merged into the target
+databases in day order; a merged shard is recorded in the target's
+`backfill_merged` table in the same transaction, so an interrupted run can
+be started again with the same arguments and only redoes unfinished work.
+Point the database URLs at fresh files to rebuild history offline.
+"""
+import argparse
+import contextlib
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+
+from septa.core import database
+from septa.core.database import (
+    RR_SCHEDULE_COLUMNS, TRAIN_VIEW_STRING_COLUMNS, TRAIN_VIEW_UPDATE_COLUMNS, TRIP_UPDATE_COLUMNS,
+    configure_engines, get_engine, init_db, init_rr_schedules_db, init_trip_updates_db, trip_update_polls_source,
+)
+from septa.core.logger import setup_logging
+from septa.core.recorder import read_segment, segments
+from septa.core.utils import create_dir
+from config import BACKFILL_DIR, RECORD_DIR, SCRAPING_DIR, SQLITE_PRAGMAS
+
+logger = setup_logging("backfill")
+
+FEEDS = ("train_view", "trip_updates", "rr_schedules")
+INITIALIZERS = {
+    "train_view": init_db,
+    "trip_updates": init_trip_updates_db,
+    "rr_schedules": init_rr_schedules_db,
+}
+# A shard is rebuilt from scratch after a crash, so it needs no journal.
+SHARD_PRAGMAS = dict(SQLITE_PRAGMAS, journal_mode="OFF", synchronous="OFF")
+
+
+def _segment_day(path):
+    # Segments are named after their first record and never span a UTC day.
+    return datetime.strptime(os.path.basename(path)[:8], "%Y%m%d").date()
+
+
+def _snapshot_time(path):
+    stamp = os.path.basename(path)[len("rr_schedules_"):].split(".")[0]
+    return datetime.strptime(stamp, "%Y-%m-%d-%H-%M-%S")
+
+
+def find_inputs(feeds, start=None, end=None, record_dir=None, scraping_dir=None):
+    """Return {(feed, day): [input paths in order]} for days in [start, end)."""
+    inputs = {}
+    for feed in feeds:
+        if feed == "rr_schedules":
+            pattern = os.path.join(scraping_dir or SCRAPING_DIR, "rr_schedules_*")
+            paths = [(path, _snapshot_time(path).date()) for path in sorted(glob.glob(pattern))]
+        else:
+            paths = [(path, _segment_day(path)) for path in segments(feed, record_dir or RECORD_DIR)]
+        for path, day in paths:
+            if (start is None or day >= start) and (end is None or day < end):
+                inputs.setdefault((feed, day), []).append(path)
+    return inputs
+
+
+def _fingerprint(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def _shard_path(work_dir, feed, day):
+    return os.path.join(work_dir, feed, f"{day.isoformat()}.db")
+
+
+def _read_marker(shard_path):
+    try:
+        with open(f"{shard_path}.done") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _snapshot_results(path):
+    """Yield {block_id: response} dicts from a gzip NDJSON or legacy JSON snapshot."""
+    if path.endswith(".ndjson.gz"):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path) as f:
+            yield from json.load(f)
+
+
+def _ingest_recordings(feed, paths):
+    if feed == "train_view":
+        from septa.train_view import process_train_view as process
+    else:
+        from septa.trip_updates import process_trip_updates as process
+
+    records = failed = 0
+    for path in paths:
+        for fetched_at, payload in read_segment(path):
+            try:
+                ok = process(payload, fetched_at)
+            except Exception as e:
+                logger.error(f"Failed to backfill {feed} record from {fetched_at}: {e}")
+                ok = False
+            records += 1
+            failed += not ok
+    return records, failed
+
+
+def _ingest_snapshots(paths):
+    from septa.rrschedules import schedule_rows
+
+    records = failed = 0
+    for path in paths:
+        fetched_at = _snapshot_time(path)
+        rows = []
+        try:
+            for result in _snapshot_results(path):
+                for block_id, stops in result.items():
+                    rows.extend(schedule_rows(block_id, stops, fetched_at.date(), fetched_at))
+        except (OSError, ValueError, EOFError) as e:
+            logger.error(f"Failed to read RRSchedules snapshot {path}: {e}")
+        records += 1
+        failed += bool(rows) and not database.store_rr_schedule_rows(rows)
+    return records, failed
+
+
+def build_shard(feed, day, paths, shard_path, fingerprint):
+    """Parse the inputs of one (feed, day) into a fresh shard database; return its marker."""
+    started = time.perf_counter()
+    for suffix in ("", ".done"):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(f"{shard_path}{suffix}")
+    create_dir(os.path.dirname(shard_path))
+
+    database.DATABASE_PRAGMAS[feed] = SHARD_PRAGMAS
+    configure_engines(**{feed: f"sqlite:///{shard_path}"})
+    INITIALIZERS[feed]()
+    if feed == "rr_schedules":
+        records, failed = _ingest_snapshots(paths)
+    else:
+        records, failed = _ingest_recordings(feed, paths)
+    get_engine(feed).dispose()
+
+    marker = {
+        "feed": feed, "day": day.isoformat(), "fingerprint": fingerprint,
+        "records": records, "failed": failed, "seconds": round(time.perf_counter() - started, 3),
+    }
+    tmp_path = f"{shard_path}.done.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(marker, f)
+    os.replace(tmp_path, f"{shard_path}.done")
+    return marker
+
+
+def _init_worker():
+    # Per-record progress from the scrapers' loggers would drown the pool.
+    for name in ("train_view", "trip_updates", "rr_schedules"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+def _columns(names):
+    return ", ".join(names)
+
+
+_string_joins = "\n".join(
+    f"LEFT JOIN shard.train_view_strings s_{name} ON s_{name}.id = c.{name}_key "
+    f"LEFT JOIN main.train_view_strings m_{name} ON m_{name}.value = s_{name}.value"
+    for name in TRAIN_VIEW_STRING_COLUMNS
+)
+_TRAIN_VIEW_WIDE_COLUMNS = ("timestamp", "train_id", *TRAIN_VIEW_UPDATE_COLUMNS)
+
+_INTERVAL_COLUMNS = ("trip_id", "stop_id", "stop_sequence", "delay", "uncertainty", "update_timestamp")
+_SHARD_FIRST_POLL = "(SELECT MIN(fetched_at) FROM shard.trip_update_polls)"
+# Run before the shard's polls are copied, so this is the target's own.
+_TARGET_NEXT_POLL = (
+    "(SELECT MIN(fetched_at) FROM main.trip_update_polls "
+    "WHERE fetched_at > (SELECT MAX(fetched_at) FROM shard.trip_update_polls))"
+)
+
+# Statements copying an attached shard into the target database, per feed.
+MERGE_SQL = {
+    "train_view": [
+        # The WHERE keeps SQLite from reading ON CONFLICT as a join constraint.
+        f"INSERT INTO main.train_view ({_columns(_TRAIN_VIEW_WIDE_COLUMNS)}) "
+        f"SELECT {_columns(_TRAIN_VIEW_WIDE_COLUMNS)} FROM shard.train_view WHERE true "
+        f"ON CONFLICT (train_id, timestamp) DO UPDATE SET "
+        + ", ".join(f"{name} = excluded.{name}" for name in TRAIN_VIEW_UPDATE_COLUMNS),
+        "INSERT OR IGNORE INTO main.train_view_strings (value) SELECT value FROM shard.train_view_strings",
+        # String keys differ between shards; map them through the values.
+        "INSERT OR REPLACE INTO main.train_view_compact "
+        f"(train_id, ts, lat_e5, lon_e5, heading, late, "
+        f"{', '.join(f'{name}_key' for name in TRAIN_VIEW_STRING_COLUMNS)}) "
+        f"SELECT c.train_id, c.ts, c.lat_e5, c.lon_e5, c.heading, c.late, "
+        f"{', '.join(f'm_{name}.id' for name in TRAIN_VIEW_STRING_COLUMNS)} "
+        f"FROM shard.train_view_compact c\n{_string_joins}",
+    ],
+    "trip_updates": [
+        f"INSERT INTO main.trip_updates ({_columns(TRIP_UPDATE_COLUMNS)}) "
+        f"SELECT {_columns(TRIP_UPDATE_COLUMNS)} FROM shard.trip_updates ORDER BY id",
+        # The shard's polls supersede the target intervals valid at its first
+        # poll: those end there and, if they ran past the shard, resume at the
+        # target's next poll. The shard's open intervals end at that poll too.
+        "CREATE TEMP TABLE superseded AS SELECT * FROM main.trip_update_intervals "
+        f"WHERE valid_from < {_SHARD_FIRST_POLL} AND COALESCE(valid_to, '9999-12-31') > {_SHARD_FIRST_POLL}",
+        f"UPDATE main.trip_update_intervals SET valid_to = {_SHARD_FIRST_POLL} "
+        "WHERE id IN (SELECT id FROM temp.superseded)",
+        f"INSERT INTO main.trip_update_intervals ({_columns(_INTERVAL_COLUMNS)}, valid_from, valid_to) "
+        f"SELECT {_columns(_INTERVAL_COLUMNS)}, {_TARGET_NEXT_POLL}, valid_to FROM temp.superseded "
+        f"WHERE COALESCE(valid_to, '9999-12-31') > COALESCE({_TARGET_NEXT_POLL}, '9999-12-31')",
+        f"INSERT INTO main.trip_update_intervals ({_columns(_INTERVAL_COLUMNS)}, valid_from, valid_to) "
+        f"SELECT {_columns(_INTERVAL_COLUMNS)}, valid_from, COALESCE(valid_to, {_TARGET_NEXT_POLL}) "
+        "FROM shard.trip_update_intervals ORDER BY id",
+        "DROP TABLE temp.superseded",
+        "INSERT OR IGNORE INTO main.trip_update_polls (fetched_at) SELECT fetched_at FROM shard.trip_update_polls",
+    ],
+    "rr_schedules": [
+        f"INSERT OR REPLACE INTO main.rr_schedule_stops ({_columns(RR_SCHEDULE_COLUMNS)}) "
+        f"SELECT {_columns(RR_SCHEDULE_COLUMNS)} FROM shard.rr_schedule_stops",
+    ],
+}
+
+_CREATE_MERGED = (
+    "CREATE TABLE IF NOT EXISTS backfill_merged "
+    "(shard TEXT PRIMARY KEY, fingerprint TEXT, merged_at TEXT NOT NULL)"
+)
+
+
+def merged_shards(feed):
+    """Return the shard names already merged into the target database of `feed`."""
+    with get_engine(feed).begin() as conn:
+        conn.exec_driver_sql(_CREATE_MERGED)
+        return {row[0] for row in conn.exec_driver_sql("SELECT shard FROM backfill_merged")}
+
+
+def merge_shard(feed, day, shard_path, fingerprint):
+    """Copy one shard into the target database and record it, in one transaction.
+
+    Trip updates are only merged into a stretch the target has no polls for,
+    and rows merged behind the analytics high-water mark are rolled up here.
+    """
+    window = None
+    with get_engine(feed).connect() as conn:
+        conn.exec_driver_sql("ATTACH DATABASE ? AS shard", (shard_path,))
+        try:
+            if feed == "trip_updates":
+                window = _merge_window(conn)
+            for statement in MERGE_SQL[feed]:
+                conn.exec_driver_sql(statement)
+            conn.exec_driver_sql(
+                "INSERT INTO backfill_merged (shard, fingerprint, merged_at) VALUES (?, ?, ?)",
+                (f"{feed}/{day.isoformat()}", fingerprint, datetime.utcnow().isoformat()),
+            )
+            conn.commit()
+        finally:
+            conn.rollback()
+            conn.exec_driver_sql("DETACH DATABASE shard")
+    # The target's open intervals changed behind the delta-mode cache.
+    database._open_intervals.pop(database.DATABASE_URLS["trip_updates"], None)
+
+    if window:
+        from septa.analytics import fold_merged
+        fold_merged(*window)
+
+
+def _merge_window(conn):
+    """(first, last) poll of the attached trip updates shard, or None when it is empty.
+
+    Raises ValueError when the target already has polls in that stretch:
+    the two would interleave instead of one superseding the other.
+    """
+    polls = trip_update_polls_source()
+    first, last = conn.exec_driver_sql(f"SELECT MIN(fetched_at), MAX(fetched_at) FROM shard.{polls}").one()
+    if first is None:
+        return None
+    overlap = conn.exec_driver_sql(
+        f"SELECT 1 FROM main.{polls} WHERE fetched_at BETWEEN ? AND ? LIMIT 1", (first, last)
+    ).scalar()
+    if overlap:
+        raise ValueError(f"target already has trip updates between {first} and {last}")
+    return first, last
+
+
+def backfill(inputs, work_dir=None, jobs=None, keep_shards=False):
+    """Build missing shards for `inputs` in a process pool, then merge them in day order.
+
+    Returns {"built": n, "merged": n, "records": n, "failed": n}.
+    """
+    work_dir = work_dir or BACKFILL_DIR
+    tasks = {}
+    for (feed, day), paths in inputs.items():
+        shard_path = _shard_path(work_dir, feed, day)
+        tasks[(feed, day)] = (paths, shard_path, _fingerprint(paths))
+
+    for feed in {feed for feed, _ in tasks}:
+        INITIALIZERS[feed]()
+    merged = {feed: merged_shards(feed) for feed in {feed for feed, _ in tasks}}
+    todo = [
+        key for key, (_, shard_path, fingerprint) in sorted(tasks.items())
+        if f"{key[0]}/{key[1].isoformat()}" not in merged[key[0]]
+        and (_read_marker(shard_path) or {}).get("fingerprint") != fingerprint
+    ]
+    logger.info(f"{len(tasks)} shards, {len(tasks) - len(todo)} already built or merged, {len(todo)} to build.")
+
+    stats = {"built": 0, "merged": 0, "records": 0, "failed": 0}
+    started = time.perf_counter()
+    if todo:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(jobs or os.cpu_count(), mp_context=context, initializer=_init_worker) as pool:
+            futures = {pool.submit(build_shard, *key, *tasks[key]): key for key in todo}
+            for done, future in enumerate(as_completed(futures), start=1):
+                feed, day = futures[future]
+                try:
+                    marker = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to build {feed} shard for {day}: {e}")
+                    continue
+                stats["built"] += 1
+                stats["records"] += marker["records"]
+                stats["failed"] += marker["failed"]
+                elapsed = time.perf_counter() - started
+                remaining = elapsed / done * (len(todo) - done)
+                logger.info(f"[{done}/{len(todo)}] {feed} {day}: {marker['records']} records "
+                            f"({marker['failed']} failed) in {marker['seconds']:.1f}s, ~{remaining:.0f}s left.")
+
+    for (feed, day), (_, shard_path, fingerprint) in sorted(tasks.items(), key=lambda item: item[0][1]):
+        if f"{feed}/{day.isoformat()}" in merged[feed] or _read_marker(shard_path) is None:
+            continue
+        try:
+            merge_shard(feed, day, shard_path, fingerprint)
+        except ValueError as e:
+            logger.error(f"Skipped merging {feed} shard for {day}: {e}")
+            continue
+        stats["merged"] += 1
+        logger.info(f"Merged {feed} shard for {day}.")
+        if not keep_shards:
+            os.remove(shard_path)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--feeds", nargs="+", choices=FEEDS, default=list(FEEDS))
+    parser.add_argument("--start", type=date.fromisoformat, help="first day (UTC for recordings)")
+    parser.add_argument("--end", type=date.fromisoformat, help="stop before this day")
+    parser.add_argument("--jobs", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--record-dir")
+    parser.add_argument("--scraping-dir")
+    parser.add_argument("--work-dir", help=f"shard directory (default: {BACKFILL_DIR})")
+    parser.add_argument("--keep-shards", action="store_true")
+    parser.add_argument("--train-view-url")
+    parser.add_argument("--trip-updates-url")
+    parser.add_argument("--rr-schedules-url")
+    args = parser.parse_args(argv)
+
+    urls = {"train_view": args.train_view_url, "trip_updates": args.trip_updates_url,
+            "rr_schedules": args.rr_schedules_url}
+    configure_engines(**{name: url for name, url in urls.items() if url})
+
+    inputs = find_inputs(args.feeds, args.start, args.end, args.record_dir, args.scraping_dir)
+    started = time.perf_counter()
+    stats = backfill(inputs, args.work_dir, args.jobs, args.keep_shards)
+    logger.info(f"Backfill done in {time.perf_counter() - started:.1f}s: {stats['built']} shards built, "
+                f"{stats['merged']} merged, {stats['records']} records ({stats['failed']} failed).")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""Time the septa.core.queries API against large synthetic history tables.
+
+Run with `python -m septa.benchmarks.queries [rows] [workdir]`. The tables
+are generated inside SQLite and kept in `workdir`, so a 100M-row database
+only has to be built once (expect several GB and a few minutes per
+100M rows).
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from septa.core import database, queries
+
+TRAINS = 200
+SNAPSHOT_SECONDS = 30
+TRIPS = 150
+STOPS = 20
+BASE_TIME = datetime(2024, 1, 1)
+
+FILL_TRAIN_VIEW = f"""
+WITH RECURSIVE n(i) AS (SELECT :first UNION ALL SELECT i + 1 FROM n WHERE i + 1 < :last)
+INSERT INTO train_view (timestamp, train_id, lat, lon, line, late, heading)
+SELECT strftime('%Y-%m-%d %H:%M:%S', '{BASE_TIME}', '+' || ((i / {TRAINS}) * {SNAPSHOT_SECONDS}) || ' seconds')
+       || '.000000',
+       CAST(1000 + i % {TRAINS} AS TEXT), 39.9 + (i % 97) / 1000.0, -75.2 + (i % 89) / 1000.0,
+       'Line ' || (i % 13), i % 11, (i * 7) % 360
+FROM n
+"""
+
+FILL_TRIP_UPDATES = f"""
+WITH RECURSIVE n(i) AS (SELECT :first UNION ALL SELECT i + 1 FROM n WHERE i + 1 < :last)
+INSERT INTO trip_updates (fetched_at, trip_id, stop_id, stop_sequence, delay, uncertainty, update_timestamp)
+SELECT ts, 'TRIP_' || ((i / {STOPS}) % {TRIPS}), CAST(90000 + i % {STOPS} AS TEXT), i % {STOPS} + 1,
+       (i % 17) * 60, 0, ts
+FROM (SELECT i, strftime('%Y-%m-%d %H:%M:%S', '{BASE_TIME}',
+                         '+' || ((i / ({TRIPS} * {STOPS})) * {SNAPSHOT_SECONDS}) || ' seconds') || '.000000' AS ts
+      FROM n)
+"""
+
+
+def populate(name, fill_sql, rows, batch=1_000_000):
+    """Append generated rows until `name` holds `rows` rows."""
+    engine = database.get_engine(name)
+    with engine.connect() as conn:
+        present = conn.execute(text(f"SELECT COALESCE(MAX(id), 0) FROM {name}")).scalar()
+    for first in range(present, rows, batch):
+        with engine.begin() as conn:
+            conn.execute(text(fill_sql), {"first": first, "last": min(first + batch, rows)})
+        print(f"  {name}: {min(first + batch, rows):,} rows", flush=True)
+
+
+def timed(func, *args, repeat=20, **kwargs):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples), len(result) if isinstance(result, list) else int(result is not None)
+
+
+def main(rows=1_000_000, workdir=None):
+    workdir = workdir or tempfile.mkdtemp(prefix="septa-queries-")
+    database.configure_engines(
+        train_view=f"sqlite:///{os.path.join(workdir, 'train_view.db')}",
+        trip_updates=f"sqlite:///{os.path.join(workdir, 'trip_updates.db')}",
+    )
+    database.init_db()
+    database.init_trip_updates_db()
+    print(f"Populating {rows:,} rows per table in {workdir}")
+    populate("train_view", FILL_TRAIN_VIEW, rows)
+    populate("trip_updates", FILL_TRIP_UPDATES, rows)
+
+    newest = BASE_TIME + timedelta(seconds=(rows // TRAINS) * SNAPSHOT_SECONDS)
+    fetched = BASE_TIME + timedelta(seconds=(rows // (TRIPS * STOPS)) * SNAPSHOT_SECONDS)
+    hour = timedelta(hours=1)
+    cases = {
+        "latest_position": lambda: queries.latest_position("1042"),
+        "latest_snapshot": lambda: queries.latest_snapshot(now=newest),
+        "trajectory (1h)": lambda: queries.trajectory("1042", newest - hour, newest),
+        "trip delay at stop (1h)": lambda: queries.delay_history("TRIP_7", "90003", fetched - hour, fetched),
+        "trip delay history (1h)": lambda: queries.delay_history("TRIP_7", start=fetched - hour, end=fetched),
+        "stop delay history (1h)": lambda: queries.delay_history(stop_id="90003", start=fetched - hour, end=fetched),
+        "late_trains by line": lambda: queries.late_trains("Line 3", now=newest),
+    }
+    for name, case in cases.items():
+        seconds, count = timed(case)
+        print(f"{name:<26} {seconds * 1000:8.2f} ms  ({count} rows)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000, sys.argv[2] if len(sys.argv) > 2 else None)
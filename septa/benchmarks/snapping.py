@@ -0,0 +1,80 @@
+"""Time trajectory building and network snapping for a synthetic day of positions.
+
+Run with `python -m septa.benchmarks.snapping [trains] [snapshot_seconds]`.
+The network has 13 lines of 25 km with a stop every ~1.5 km and a shape
+point every ~50 m, radiating from one centre like SEPTA's regional rail.
+"""
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from septa.trajectories import METERS_PER_DEGREE, RailNetwork, build_trajectories
+
+LINES = 13
+LINE_METERS = 25_000
+CENTER = (39.952, -75.165)
+
+
+def network(seed=0):
+    rng = np.random.default_rng(seed)
+    stops, shapes = [], []
+    for line in range(LINES):
+        angle = 2 * np.pi * line / LINES + rng.uniform(-0.1, 0.1)
+        along = np.linspace(0, LINE_METERS, LINE_METERS // 50 + 1)
+        lat = CENTER[0] + along * np.sin(angle) / METERS_PER_DEGREE
+        lon = CENTER[1] + along * np.cos(angle) / (METERS_PER_DEGREE * np.cos(np.radians(CENTER[0])))
+        shapes.append(pd.DataFrame({
+            "shape_id": f"S{line}", "shape_pt_lat": lat, "shape_pt_lon": lon,
+            "shape_pt_sequence": np.arange(len(along)),
+        }))
+        stops.append(pd.DataFrame({
+            "stop_id": [f"{line}_{i}" for i in range(0, len(along), 30)],
+            "stop_lat": lat[::30], "stop_lon": lon[::30],
+        }))
+    return pd.concat(stops, ignore_index=True), pd.concat(shapes, ignore_index=True)
+
+
+def positions(shapes, trains, snapshot_seconds, seed=0):
+    """Trains shuttling along random lines with GPS noise, one snapshot every `snapshot_seconds` for a day."""
+    rng = np.random.default_rng(seed)
+    ticks = 86_400 // snapshot_seconds
+    points = shapes[["shape_pt_lat", "shape_pt_lon"]].to_numpy()
+    per_line = len(points) // LINES
+    line = rng.integers(0, LINES, trains)
+    phase = rng.uniform(0, 2 * np.pi, trains)
+    t = np.arange(ticks)
+    progress = (np.sin(phase[:, None] + t[None, :] * snapshot_seconds / 5400) + 1) / 2
+    index = line[:, None] * per_line + (progress * (per_line - 1)).astype(int)
+    lat = points[index.ravel(), 0] + rng.normal(0, 0.0001, index.size)
+    lon = points[index.ravel(), 1] + rng.normal(0, 0.0001, index.size)
+    base = pd.Timestamp(datetime(2025, 3, 3, 9))
+    return pd.DataFrame({
+        "timestamp": np.tile(base + pd.to_timedelta(t * snapshot_seconds, unit="s"), trains),
+        "train_id": np.repeat([str(1000 + train) for train in range(trains)], ticks),
+        "lat": lat,
+        "lon": lon,
+    })
+
+
+def main(trains=250, snapshot_seconds=30):
+    stops, shapes = network()
+    started = time.perf_counter()
+    rail = RailNetwork(stops, shapes)
+    build = time.perf_counter() - started
+
+    day = positions(shapes, trains, snapshot_seconds)
+    started = time.perf_counter()
+    trajectory = build_trajectories(day, rail)
+    elapsed = time.perf_counter() - started
+
+    snapped = trajectory["shape_id"].notna().mean()
+    print(f"index build      {build * 1000:8.1f} ms ({len(stops)} stops, {len(shapes)} shape points)")
+    print(f"trajectories     {elapsed:8.2f} s  for {len(day):,} positions "
+          f"({len(day) / elapsed:,.0f}/s, {snapped:.1%} on a shape)")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
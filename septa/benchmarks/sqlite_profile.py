@@ -0,0 +1,46 @@
+"""Compare train_view write throughput with SQLite defaults and the storage profile.
+
+Run with `python -m septa.benchmarks.sqlite_profile [snapshots] [trains]`.
+Each snapshot is one `store_train_view` commit, like one scraper tick.
+"""
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from septa.benchmarks.synthetic import train_view_snapshot
+from septa.core import database
+from config import SQLITE_PRAGMAS
+
+PROFILES = {
+    "sqlite defaults": {},
+    "storage profile": SQLITE_PRAGMAS,
+}
+
+
+def measure(pragmas, workdir, snapshots, trains):
+    database.DATABASE_PRAGMAS["train_view"] = pragmas
+    database.configure_engines(train_view=f"sqlite:///{workdir}/train_view_{len(pragmas)}.db")
+    database.init_db()
+
+    data = train_view_snapshot(trains)
+    start = datetime(2025, 1, 1)
+    started = time.perf_counter()
+    for tick in range(snapshots):
+        database.store_train_view(data, start + timedelta(seconds=30 * tick))
+    elapsed = time.perf_counter() - started
+    database.get_engine("train_view").dispose()
+    return elapsed
+
+
+def main(snapshots=300, trains=250):
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, pragmas in PROFILES.items():
+            elapsed = measure(pragmas, workdir, snapshots, trains)
+            print(f"{name:<16} {snapshots / elapsed:8.1f} snapshots/s  "
+                  f"{snapshots * trains / elapsed:10.0f} rows/s", file=sys.stderr)
+    database.DATABASE_PRAGMAS.pop("train_view", None)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
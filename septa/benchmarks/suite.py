@@ -0,0 +1,218 @@
+"""Throughput benchmarks for the ingestion and GTFS paths, written as JSON.
+
+Run with `python -m septa.benchmarks.suite [--scales small medium] [--output results.json]`
+and compare two result files with
+`python -m septa.benchmarks.suite --compare baseline.json results.json`.
+
+Each scale times `store_train_view`, `store_trip_updates`,
+`store_trip_update_rows`, `update_database` and `get_realtime_queries` on
+synthetic data. The store benchmarks run twice per scale: against empty
+tables and against tables pre-filled with `history` rows, since index
+maintenance slows down as the tables grow.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from google.protobuf.json_format import MessageToDict
+
+from septa.benchmarks import queries as query_benchmark
+from septa.benchmarks.synthetic import gtfs_tables, train_view_snapshot, trip_updates_feed
+from septa.core import database, gtfs
+from septa.core.gtfs_rt import trip_update_rows
+from config import BASE_DIR, DATA_DIR
+
+SCALES = {
+    "small": {"trains": 50, "trips": 40, "stops_per_trip": 15, "gtfs_trips_per_route": 20, "history": 20_000},
+    "medium": {"trains": 250, "trips": 150, "stops_per_trip": 20, "gtfs_trips_per_route": 60, "history": 200_000},
+    "large": {"trains": 500, "trips": 400, "stops_per_trip": 25, "gtfs_trips_per_route": 200, "history": 2_000_000},
+}
+
+# Relative slowdown reported as a regression by `compare`.
+REGRESSION_THRESHOLD = 1.2
+
+FIRST_SNAPSHOT = datetime(2025, 6, 1)
+# A weekday inside the synthetic calendar, so the lookup finds running blocks.
+GTFS_SERVICE_DATE = date(2025, 6, 4)
+
+
+def _timed(func, repeat):
+    """Call `func(run)` `repeat` times; return the wall-clock seconds of each call."""
+    samples = []
+    for run in range(repeat):
+        started = time.perf_counter()
+        func(run)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def _result(benchmark, scale, history, rows, samples):
+    median = statistics.median(samples)
+    return {
+        "benchmark": benchmark,
+        "scale": scale,
+        "history_rows": history,
+        "rows": rows,
+        "runs": len(samples),
+        "median_s": median,
+        "min_s": min(samples),
+        "max_s": max(samples),
+        "rows_per_s": rows / median if median else None,
+    }
+
+
+def _use_databases(workdir, label):
+    database.configure_engines(
+        train_view=f"sqlite:///{os.path.join(workdir, f'train_view_{label}.db')}",
+        trip_updates=f"sqlite:///{os.path.join(workdir, f'trip_updates_{label}.db')}",
+    )
+    database.init_db()
+    database.init_trip_updates_db()
+
+
+def bench_stores(scale, params, history, workdir, repeat):
+    _use_databases(workdir, f"{scale}_{history}")
+    if history:
+        query_benchmark.populate("train_view", query_benchmark.FILL_TRAIN_VIEW, history)
+        query_benchmark.populate("trip_updates", query_benchmark.FILL_TRIP_UPDATES, history)
+
+    snapshot = train_view_snapshot(params["trains"])
+    feed = trip_updates_feed(params["trips"], params["stops_per_trip"])
+    entities = MessageToDict(feed).get("entity", [])
+    stop_updates = params["trips"] * params["stops_per_trip"]
+
+    def tick(run):
+        return FIRST_SNAPSHOT + timedelta(minutes=run)
+
+    cases = {
+        "store_train_view": (len(snapshot), lambda run: database.store_train_view(snapshot, tick(run))),
+        "store_trip_updates": (stop_updates, lambda run: database.store_trip_updates(entities, tick(run))),
+        "store_trip_update_rows": (
+            stop_updates, lambda run: database.store_trip_update_rows(trip_update_rows(feed, tick(run + repeat))),
+        ),
+    }
+    results = [_result(name, scale, history, rows, _timed(func, repeat)) for name, (rows, func) in cases.items()]
+    for name in ("train_view", "trip_updates"):
+        database.get_engine(name).dispose()
+    return results
+
+
+def bench_gtfs(scale, params, workdir, repeat):
+    feed_dir = os.path.join(workdir, f"gtfs_{scale}")
+    os.makedirs(feed_dir, exist_ok=True)
+    for name, content in gtfs_tables(trips_per_route=params["gtfs_trips_per_route"]).items():
+        with open(os.path.join(feed_dir, name), "w") as f:
+            f.write(content)
+    with open(os.path.join(feed_dir, "stop_times.txt")) as f:
+        stop_times = sum(1 for _ in f) - 1
+
+    db_path = os.path.join(workdir, f"septa_{scale}.sqlite")
+    load = _timed(lambda run: gtfs.update_database(feed_dir, db_path), max(1, repeat // 5))
+
+    database.configure_engines(gtfs=f"sqlite:///{db_path}")
+    if not gtfs.get_realtime_queries(GTFS_SERVICE_DATE):
+        raise RuntimeError(f"Synthetic GTFS feed has no service on {GTFS_SERVICE_DATE}")
+    lookups = _timed(lambda run: gtfs.get_realtime_queries(GTFS_SERVICE_DATE), repeat)
+    database.get_engine("gtfs").dispose()
+    return [
+        _result("update_database", scale, 0, stop_times, load),
+        _result("get_realtime_queries", scale, 0, 1, lookups),
+    ]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scales=("small", "medium"), repeat=10, workdir=None):
+    """Run the suite; return the results document written by `main`."""
+    results = []
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for scale in scales:
+            params = SCALES[scale]
+            for history in (0, params["history"]):
+                results.extend(bench_stores(scale, params, history, tmp, repeat))
+            results.extend(bench_gtfs(scale, params, tmp, repeat))
+
+    return {
+        "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """Yield (benchmark, scale, history_rows, baseline s, current s, ratio, regressed) per shared case."""
+    def key(result):
+        return result["benchmark"], result["scale"], result["history_rows"]
+
+    before = {key(result): result for result in baseline["results"]}
+    for result in current["results"]:
+        old = before.get(key(result))
+        if old is None:
+            continue
+        ratio = result["median_s"] / old["median_s"]
+        yield (*key(result), old["median_s"], result["median_s"], ratio, ratio > threshold)
+
+
+def _print_compare(baseline_path, current_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(current_path) as f:
+        current = json.load(f)
+
+    regressions = 0
+    for benchmark, scale, history, old, new, ratio, regressed in compare(baseline, current):
+        regressions += regressed
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{benchmark:<24} {scale:<7} history={history:<9} "
+              f"{old * 1000:9.2f} ms -> {new * 1000:9.2f} ms  x{ratio:5.2f}{flag}")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", nargs="+", choices=SCALES, default=["small", "medium"])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="result file (default: data/benchmarks/<time>-<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return _print_compare(*args.compare)
+
+    document = run(args.scales, args.repeat)
+    output = args.output or os.path.join(
+        DATA_DIR, "benchmarks",
+        f"{datetime.utcnow():%Y%m%dT%H%M%S}-{(document['commit'] or 'unknown')[:10]}.json",
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(document, f, indent=2)
+
+    for result in document["results"]:
+        print(f"{result['benchmark']:<24} {result['scale']:<7} history={result['history_rows']:<9} "
+              f"{result['median_s'] * 1000:9.2f} ms  {result['rows_per_s'] or 0:12.0f} rows/s", file=sys.stderr)
+    print(f"Results written to {output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
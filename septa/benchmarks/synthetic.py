@@ -0,0 +1,140 @@
+import csv
+import io
+import random
+import zipfile
+from datetime import date, datetime, timedelta
+
+from google.transit import gtfs_realtime_pb2
+
+
+def trip_updates_feed(trips=150, stops_per_trip=20, timestamp=None, seed=0):
+    """Build a GTFS-RT `FeedMessage` shaped like SEPTA's rail trip updates."""
+    rng = random.Random(seed)
+    if timestamp is None:
+        timestamp = datetime.utcnow()
+    epoch = int(timestamp.timestamp())
+
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = "2.0"
+    feed.header.timestamp = epoch
+
+    for trip in range(trips):
+        entity = feed.entity.add()
+        entity.id = str(trip)
+        trip_update = entity.trip_update
+        trip_update.trip.trip_id = f"CHW_{1000 + trip}_V{rng.randint(1, 9)}_M"
+        trip_update.timestamp = epoch - rng.randint(0, 120)
+        delay = rng.choice((0, 0, 0, 60, 120, 300, 600))
+
+        for sequence in range(1, stops_per_trip + 1):
+            stop = trip_update.stop_time_update.add()
+            stop.stop_sequence = sequence
+            stop.stop_id = str(90000 + rng.randint(1, 160))
+            stop.arrival.delay = delay
+            stop.arrival.uncertainty = 0
+
+    return feed
+
+
+def train_view_snapshot(trains=250, seed=0):
+    """Build one TrainView API response (a list of train dicts)."""
+    rng = random.Random(seed)
+    lines = ("Paoli/Thorndale", "Airport", "Media/Wawa", "Lansdale/Doylestown", "Trenton", "West Trenton")
+    stations = ("Suburban Station", "30th Street Station", "Jefferson Station", "Temple U", "Ardmore", "Bryn Mawr")
+    return [
+        {
+            "lat": f"{39.9 + rng.random() / 5:.6f}",
+            "lon": f"{-75.3 + rng.random() / 5:.6f}",
+            "trainno": str(1000 + train),
+            "service": rng.choice(("LOCAL", "EXPRESS")),
+            "dest": rng.choice(stations),
+            "currentstop": rng.choice(stations),
+            "nextstop": rng.choice(stations),
+            "line": rng.choice(lines),
+            "consist": ",".join(str(rng.randint(100, 900)) for _ in range(rng.randint(2, 6))),
+            "heading": f"{rng.uniform(0, 360):.2f}",
+            "late": str(rng.choice((0, 0, 0, 1, 3, 7, 12))),
+            "SOURCE": rng.choice(stations),
+            "TRACK": str(rng.randint(1, 6)),
+            "TRACK_CHANGE": "",
+        }
+        for train in range(trains)
+    ]
+
+
+def _csv(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def gtfs_tables(routes=13, trips_per_route=60, stops_per_trip=20, start=None, seed=0):
+    """Build a rail GTFS feed as {file name: CSV text}.
+
+    Every route gets weekday, Saturday and Sunday services; each trip runs
+    its own block, and calendar_dates adds a holiday exception per service.
+    """
+    rng = random.Random(seed)
+    start = start or date(2025, 1, 1)
+    end = start + timedelta(days=365)
+    stations = [
+        (str(90000 + stop), f"Station {stop}", f"{39.8 + rng.random() / 3:.6f}", f"{-75.4 + rng.random() / 3:.6f}")
+        for stop in range(1, 160)
+    ]
+    services = {"M": (1, 1, 1, 1, 1, 0, 0), "SA": (0, 0, 0, 0, 0, 1, 0), "SU": (0, 0, 0, 0, 0, 0, 1)}
+
+    route_rows, calendar_rows, calendar_date_rows, trip_rows, stop_time_rows = [], [], [], [], []
+    for route in range(routes):
+        route_id = f"R{route:02d}"
+        route_rows.append((route_id, "SEPTA", route_id, f"Route {route}", 2))
+        for suffix, days in services.items():
+            service_id = f"{route_id}_{suffix}"
+            calendar_rows.append((service_id, *days, start.strftime("%Y%m%d"), end.strftime("%Y%m%d")))
+            calendar_date_rows.append((service_id, (start + timedelta(days=150)).strftime("%Y%m%d"), 2))
+
+        line_stops = rng.sample(stations, stops_per_trip)
+        for trip in range(trips_per_route):
+            service_id = f"{route_id}_{rng.choice(tuple(services))}"
+            trip_id = f"{route_id}_{1000 + trip}"
+            trip_rows.append((route_id, service_id, trip_id, line_stops[-1][1], str(route * 1000 + trip), trip % 2))
+            departure = 5 * 3600 + rng.randint(0, 19 * 3600)
+            for sequence, stop in enumerate(line_stops, start=1):
+                seconds = departure + sequence * 180
+                clock = f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+                stop_time_rows.append((trip_id, clock, clock, stop[0], sequence))
+
+    return {
+        "agency.txt": _csv(("agency_id", "agency_name", "agency_url", "agency_timezone"),
+                           [("SEPTA", "SEPTA", "https://www.septa.org", "America/New_York")]),
+        "routes.txt": _csv(("route_id", "agency_id", "route_short_name", "route_long_name", "route_type"),
+                           route_rows),
+        "stops.txt": _csv(("stop_id", "stop_name", "stop_lat", "stop_lon"), stations),
+        "calendar.txt": _csv(("service_id", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday",
+                              "sunday", "start_date", "end_date"), calendar_rows),
+        "calendar_dates.txt": _csv(("service_id", "date", "exception_type"), calendar_date_rows),
+        "trips.txt": _csv(("route_id", "service_id", "trip_id", "trip_headsign", "block_id", "direction_id"),
+                          trip_rows),
+        "stop_times.txt": _csv(("trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"),
+                               stop_time_rows),
+    }
+
+
+def gtfs_zip(path, member="google_rail.zip", **kwargs):
+    """Write a `gtfs_public.zip`-style archive with the rail feed nested as `member`.
+
+    Pass `member=None` for a flat feed. Extra arguments go to `gtfs_tables`.
+    """
+    inner = io.BytesIO()
+    with zipfile.ZipFile(inner, "w", zipfile.ZIP_DEFLATED) as feed:
+        for name, content in gtfs_tables(**kwargs).items():
+            feed.writestr(name, content)
+
+    if member is None:
+        with open(path, "wb") as f:
+            f.write(inner.getvalue())
+        return path
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as wrapper:
+        wrapper.writestr(member, inner.getvalue())
+    return path
@@ -0,0 +1,63 @@
+"""Compare the on-disk size and read times of wide and compact train_view storage.
+
+Both modes are read the way the readers do, through `train_view_source()`:
+a full scan aggregated by line and a `queries.latest_snapshot` range read.
+
+Run with `python -m septa.benchmarks.train_view_storage [snapshots] [trains]`.
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from septa.benchmarks.synthetic import train_view_snapshot
+from septa.core import database, queries
+
+MODES = ("wide", "compact")
+
+SCAN_SQL = "SELECT line, AVG(late) FROM {source} GROUP BY line"
+
+
+def measure(mode, workdir, snapshots, trains):
+    path = os.path.join(workdir, f"train_view_{mode}.db")
+    database.TRAIN_VIEW_STORAGE_MODE = mode
+    database.configure_engines(train_view=f"sqlite:///{path}")
+    database.init_db()
+
+    start = datetime(2025, 1, 1)
+    last = start + timedelta(minutes=snapshots - 1)
+    for tick in range(snapshots):
+        database.store_train_view(train_view_snapshot(trains, seed=tick), start + timedelta(minutes=tick))
+
+    engine = database.get_engine("train_view")
+    source, _, _ = database.train_view_source()
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.exec_driver_sql("VACUUM")
+        started = time.perf_counter()
+        conn.exec_driver_sql(SCAN_SQL.format(source=source)).fetchall()
+        scan = time.perf_counter() - started
+
+    started = time.perf_counter()
+    queries.latest_snapshot(now=last)
+    snapshot = time.perf_counter() - started
+    engine.dispose()
+    return os.path.getsize(path), scan, snapshot
+
+
+def main(snapshots=500, trains=250):
+    mode = database.TRAIN_VIEW_STORAGE_MODE
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in MODES:
+            size, scan, snapshot = measure(name, workdir, snapshots, trains)
+            print(
+                f"{name:<8} {size / 2**20:8.2f} MiB  scan {scan * 1000:8.1f} ms  "
+                f"latest snapshot {snapshot * 1000:8.1f} ms",
+                file=sys.stderr,
+            )
+    database.TRAIN_VIEW_STORAGE_MODE = mode
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
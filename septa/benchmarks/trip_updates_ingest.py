@@ -0,0 +1,82 @@
+"""Compare trip_updates ingestion through `MessageToDict` with the protobuf row path.
+
+Run with `python -m septa.benchmarks.trip_updates_ingest [trips] [stops_per_trip]`.
+"""
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from google.protobuf.json_format import MessageToDict
+from sqlalchemy.orm import Session
+
+from septa.benchmarks.synthetic import trip_updates_feed
+from septa.core import database
+from septa.core.gtfs_rt import trip_update_rows
+
+
+def legacy_dict_path(feed, timestamp):
+    """The original ingestion: `MessageToDict` plus one ORM object per stop update."""
+    session = Session(database.get_engine("trip_updates"))
+    try:
+        for entity in MessageToDict(feed).get("entity", []):
+            trip_info = entity.get("tripUpdate", {})
+            trip_id = trip_info.get("trip", {}).get("tripId")
+            for stop_update in trip_info.get("stopTimeUpdate", []):
+                session.add(database.TripUpdate(
+                    trip_id=trip_id,
+                    stop_id=stop_update.get("stopId"),
+                    stop_sequence=stop_update.get("stopSequence"),
+                    delay=int(stop_update["arrival"]["delay"]) if "arrival" in stop_update else None,
+                    uncertainty=int(stop_update["arrival"]["uncertainty"]) if "arrival" in stop_update else None,
+                    update_timestamp=datetime.utcfromtimestamp(int(trip_info.get("timestamp", timestamp.timestamp()))),
+                ))
+        session.commit()
+    finally:
+        session.close()
+
+
+def dict_path(feed, timestamp):
+    database.store_trip_updates(MessageToDict(feed).get("entity", []), timestamp)
+
+
+def protobuf_path(feed, timestamp):
+    database.store_trip_update_rows(trip_update_rows(feed, timestamp))
+
+
+def measure(func, payload, workdir):
+    """Run `func` against a fresh trip_updates database; return (cpu seconds, peak bytes)."""
+    database.configure_engines(trip_updates=f"sqlite:///{workdir}/{func.__name__}.db")
+    database.init_trip_updates_db()
+
+    feed = trip_updates_feed()
+    feed.ParseFromString(payload)
+    timestamp = datetime.utcnow()
+
+    tracemalloc.start()
+    started = time.process_time()
+    func(feed, timestamp)
+    elapsed = time.process_time() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    database.get_engine("trip_updates").dispose()
+    return elapsed, peak
+
+
+def main(trips=600, stops_per_trip=25):
+    payload = trip_updates_feed(trips, stops_per_trip).SerializeToString()
+    print(f"Feed: {trips} trips x {stops_per_trip} stops ({len(payload) / 1024:.0f} KiB)")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = {func.__name__: measure(func, payload, workdir)
+                   for func in (legacy_dict_path, dict_path, protobuf_path)}
+
+    base_cpu, base_peak = results["legacy_dict_path"]
+    for name, (cpu, peak) in results.items():
+        print(f"{name:<18} cpu {cpu * 1000:8.1f} ms ({base_cpu / cpu:4.1f}x)   "
+              f"peak {peak / 1024 / 1024:7.2f} MiB ({base_peak / peak:4.1f}x)")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
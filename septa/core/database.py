@@ -1,20 +1,92 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime
-from sqlalchemy.orm import sessionmaker, declarative_base
-import sqlite3
+from sqlalchemy import Column, Integer, String, Float, DateTime, Index, func, literal_column, text
+from sqlalchemy.dialects import sqlite as sqlite_dialect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import declarative_base
 import logging
-from datetime import datetime
-import pandas as pd
-import os
+import math
+from datetime import datetime, timezone
 
-from config import GTFS_DB_PATH, TRAIN_VIEW_DB_URL, TRIP_UPDATES_DB_URL
+from septa.core.metrics import stage
+from septa.core.storage import create_sqlite_engine
+from septa.core.utils import create_dir
+from config import (
+    DATA_DIR, TRAIN_VIEW_DB_URL, TRIP_UPDATES_DB_URL, RR_SCHEDULES_DB_URL, ANALYTICS_DB_URL, GTFS_DB_URL,
+    SQLITE_PRAGMAS, GTFS_SQLITE_PRAGMAS, TRAIN_VIEW_STORAGE_MODE, TRIP_UPDATES_STORAGE_MODE,
+)
 
 logger = logging.getLogger("database")
-engine = create_engine(TRAIN_VIEW_DB_URL, echo=False, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-trip_updates_engine = create_engine(TRIP_UPDATES_DB_URL, echo=False, connect_args={"check_same_thread": False})
-TripUpdatesSession = sessionmaker(autocommit=False, autoflush=False, bind=trip_updates_engine)
 Base = declarative_base()
 
+# Engines are created on first use so importing this module stays cheap.
+DATABASE_URLS = {
+    "train_view": TRAIN_VIEW_DB_URL,
+    "trip_updates": TRIP_UPDATES_DB_URL,
+    "rr_schedules": RR_SCHEDULES_DB_URL,
+    "analytics": ANALYTICS_DB_URL,
+    "gtfs": GTFS_DB_URL,
+}
+# Connection pragmas per database; anything not listed uses SQLITE_PRAGMAS.
+DATABASE_PRAGMAS = {
+    "gtfs": GTFS_SQLITE_PRAGMAS,
+}
+_engines = {}
+
+
+def get_engine(name="train_view"):
+    """Return the pooled engine for database `name`, creating it on first use."""
+    engine = _engines.get(name)
+    if engine is None:
+        create_dir(DATA_DIR)
+        engine = _engines[name] = create_sqlite_engine(
+            DATABASE_URLS[name], DATABASE_PRAGMAS.get(name, SQLITE_PRAGMAS)
+        )
+    return engine
+
+
+def configure_engines(**urls):
+    """Point databases at other URLs, e.g. `configure_engines(train_view="sqlite:///...")`."""
+    for name, url in urls.items():
+        DATABASE_URLS[name] = url
+        engine = _engines.pop(name, None)
+        if engine is not None:
+            engine.dispose()
+
+
+_sqlite = sqlite_dialect.dialect()
+_datetime_to_db = DateTime().dialect_impl(_sqlite).bind_processor(_sqlite)
+
+
+def db_datetime(value):
+    """Format a datetime the way SQLAlchemy stores `DateTime` columns in SQLite."""
+    return _datetime_to_db(value)
+
+
+# Callbacks run after a store function has committed, e.g. septa.api's snapshot refresh.
+_store_listeners = {"train_view": [], "trip_updates": []}
+
+
+def add_store_listener(feed, callback):
+    """Call `callback(rows)` after every committed store of `feed`.
+
+    `feed` is "train_view" (rows as `_train_view_row` dicts) or
+    "trip_updates" (rows as `TRIP_UPDATE_COLUMNS` tuples). Callbacks run on
+    the storing thread; their errors are logged, never raised.
+    """
+    _store_listeners[feed].append(callback)
+
+
+def remove_store_listener(feed, callback):
+    if callback in _store_listeners[feed]:
+        _store_listeners[feed].remove(callback)
+
+
+def _notify_stored(feed, rows):
+    for callback in list(_store_listeners[feed]):
+        try:
+            callback(rows)
+        except Exception as e:
+            logger.error(f"{feed} store listener failed: {e}")
+
 
 class TrainView(Base):
     __tablename__ = "train_view"
@@ -37,54 +109,258 @@ class TrainView(Base):
     track_change = Column(String)
 
     __table_args__ = (
+        Index("ix_train_view_train_id_timestamp", "train_id", "timestamp", unique=True),
+        Index("ix_train_view_timestamp", "timestamp"),
         {"sqlite_autoincrement": True},
     )
 
 
+# Columns refreshed when a (train_id, timestamp) snapshot row is written twice.
+TRAIN_VIEW_UPDATE_COLUMNS = (
+    "lat", "lon", "service", "destination", "current_stop", "next_stop", "line",
+    "consist", "heading", "late", "source", "track", "track_change",
+)
+
+
+def _ensure_indexes(bind, table):
+    """Create indexes declared on `table` that an existing database is missing."""
+    with bind.connect() as conn:
+        existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA index_list({table.name})")}
+    for index in table.indexes:
+        if index.name in existing:
+            continue
+
+        with bind.begin() as conn:
+            if index.unique:
+                # Older databases may hold duplicate snapshots; keep the latest
+                # write. A partial index only constrains the rows it covers.
+                keys = ", ".join(column.name for column in index.columns)
+                where = index.dialect_options["sqlite"]["where"]
+                covered = str(where) if where is not None else "true"
+                conn.execute(text(
+                    f"DELETE FROM {table.name} WHERE {covered} AND id NOT IN "
+                    f"(SELECT MAX(id) FROM {table.name} WHERE {covered} GROUP BY {keys})"
+                ))
+            index.create(conn)
+        logger.info(f"Created index {index.name} on {table.name}.")
+
+
+class TrainViewString(Base):
+    """Dictionary of the repeated strings in compact `train_view` rows."""
+    __tablename__ = "train_view_strings"
+
+    id = Column(Integer, primary_key=True)
+    value = Column(String, nullable=False, unique=True)
+
+
+class TrainViewCompact(Base):
+    """`train_view` rows with strings as `train_view_strings` keys, the time as
+    epoch seconds, coordinates in 1e-5 degrees (~1 m) and heading in degrees."""
+    __tablename__ = "train_view_compact"
+
+    train_id = Column(String, primary_key=True)
+    ts = Column(Integer, primary_key=True)
+    lat_e5 = Column(Integer)
+    lon_e5 = Column(Integer)
+    heading = Column(Integer)
+    late = Column(Integer)
+    service_key = Column(Integer)
+    destination_key = Column(Integer)
+    current_stop_key = Column(Integer)
+    next_stop_key = Column(Integer)
+    line_key = Column(Integer)
+    consist_key = Column(Integer)
+    source_key = Column(Integer)
+    track_key = Column(Integer)
+    track_change_key = Column(Integer)
+
+    __table_args__ = (
+        Index("ix_train_view_compact_ts", "ts"),
+        {"sqlite_with_rowid": False},
+    )
+
+
+# String columns of the wide layout that compact rows store as dictionary keys.
+TRAIN_VIEW_STRING_COLUMNS = (
+    "service", "destination", "current_stop", "next_stop", "line",
+    "consist", "source", "track", "track_change",
+)
+COORDINATE_SCALE = 100_000
+
+_decoded_joins = "\n".join(
+    f"LEFT JOIN train_view_strings s_{name} ON s_{name}.id = c.{name}_key" for name in TRAIN_VIEW_STRING_COLUMNS
+)
+
+# The compact rows in the wide `train_view` shape (without `id`), plus the
+# stored `ts` for range filters that can use the compact indexes.
+TRAIN_VIEW_DECODED_VIEW = f"""
+CREATE VIEW IF NOT EXISTS train_view_decoded AS
+SELECT strftime('%Y-%m-%d %H:%M:%S', c.ts, 'unixepoch') || '.000000' AS timestamp, c.train_id,
+       c.lat_e5 / {COORDINATE_SCALE}.0 AS lat, c.lon_e5 / {COORDINATE_SCALE}.0 AS lon,
+       s_service.value AS service, s_destination.value AS destination,
+       s_current_stop.value AS current_stop, s_next_stop.value AS next_stop,
+       s_line.value AS line, s_consist.value AS consist, CAST(c.heading AS REAL) AS heading, c.late,
+       s_source.value AS source, s_track.value AS track, s_track_change.value AS track_change,
+       c.ts
+FROM train_view_compact c
+{_decoded_joins}
+"""
+
+
+def epoch_bound(moment):
+    """First whole epoch second at or after naive-UTC `moment`, to compare with `ts`."""
+    return math.ceil(moment.replace(tzinfo=timezone.utc).timestamp())
+
+
+def train_view_source():
+    """(relation, time column, bound) for reading wide `train_view` rows.
+
+    Readers select from the relation instead of naming `train_view`, which
+    stays empty with `TRAIN_VIEW_STORAGE_MODE = "compact"`, and filter and
+    sort on the time column with `bound(datetime)` parameters. In compact
+    mode that is the integer `ts` of `train_view_decoded`, so range reads
+    use the `train_view_compact` indexes instead of decoding every row.
+    """
+    if TRAIN_VIEW_STORAGE_MODE == "compact":
+        return "train_view_decoded", "ts", epoch_bound
+    return "train_view", "timestamp", db_datetime
+
+
+_UPSERT_TRAIN_VIEW_COMPACT = (
+    "INSERT INTO train_view_compact (train_id, ts, lat_e5, lon_e5, heading, late, "
+    f"{', '.join(f'{name}_key' for name in TRAIN_VIEW_STRING_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in range(6 + len(TRAIN_VIEW_STRING_COLUMNS)))}) "
+    "ON CONFLICT (train_id, ts) DO UPDATE SET "
+    + ", ".join(
+        f"{column} = excluded.{column}"
+        for column in ("lat_e5", "lon_e5", "heading", "late", *(f"{name}_key" for name in TRAIN_VIEW_STRING_COLUMNS))
+    )
+)
+
+# value -> key of `train_view_strings`, per train_view database URL. Filled
+# lazily; keys never change once assigned, so the cache never goes stale.
+_string_keys = {}
+
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    engine = get_engine("train_view")
+    tables = [TrainView.__table__, TrainViewString.__table__, TrainViewCompact.__table__]
+    Base.metadata.create_all(bind=engine, tables=tables)
+    _ensure_indexes(engine, TrainView.__table__)
+    with engine.begin() as conn:
+        columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(train_view_decoded)")}
+        if columns and "ts" not in columns:
+            conn.exec_driver_sql("DROP VIEW train_view_decoded")
+        conn.exec_driver_sql(TRAIN_VIEW_DECODED_VIEW)
+
+
+def _train_view_row(train, timestamp):
+    """Convert one TrainView API record into a `train_view` row."""
+    return {
+        "timestamp": timestamp,
+        "train_id": train.get("trainno"),
+        "lat": float(train["lat"]) if train["lat"] else None,
+        "lon": float(train["lon"]) if train["lon"] else None,
+        "service": train.get("service"),
+        "destination": train.get("dest"),
+        "current_stop": train.get("currentstop"),
+        "next_stop": train.get("nextstop"),
+        "line": train.get("line"),
+        "consist": train.get("consist"),
+        "heading": float(train["heading"]) if train["heading"] else None,
+        "late": int(train["late"]) if train["late"] else None,
+        "source": train.get("SOURCE"),
+        "track": train.get("TRACK"),
+        "track_change": train.get("TRACK_CHANGE"),
+    }
+
+
+def _intern_strings(conn, values):
+    """Return {value: key} for `values`, adding unseen ones to `train_view_strings`.
+
+    The returned mapping includes the cached keys; the caller installs it as
+    the cache once the transaction has committed.
+    """
+    keys = _string_keys.get(DATABASE_URLS["train_view"], {})
+    missing = sorted({value for value in values if value is not None and value not in keys})
+    if not missing:
+        return keys
+
+    keys = dict(keys)
+    conn.exec_driver_sql(
+        "INSERT OR IGNORE INTO train_view_strings (value) VALUES (?)", [(value,) for value in missing]
+    )
+    # Stay below SQLite's bound-parameter limit on the lookup.
+    for start in range(0, len(missing), 500):
+        batch = missing[start:start + 500]
+        result = conn.exec_driver_sql(
+            f"SELECT value, id FROM train_view_strings WHERE value IN ({', '.join('?' for _ in batch)})",
+            tuple(batch),
+        )
+        keys.update(result.fetchall())
+    return keys
+
+
+def _scaled(value, scale):
+    return round(value * scale) if value is not None else None
+
+
+def _store_train_view_compact(conn, rows):
+    """Upsert wide `rows` into `train_view_compact`; return the new string keys."""
+    keys = _intern_strings(conn, [row[name] for row in rows for name in TRAIN_VIEW_STRING_COLUMNS])
+    ts = int(rows[0]["timestamp"].replace(tzinfo=timezone.utc).timestamp())
+    conn.exec_driver_sql(_UPSERT_TRAIN_VIEW_COMPACT, [
+        (
+            row["train_id"], ts,
+            _scaled(row["lat"], COORDINATE_SCALE), _scaled(row["lon"], COORDINATE_SCALE),
+            _scaled(row["heading"], 1), row["late"],
+            *(keys.get(row[name]) for name in TRAIN_VIEW_STRING_COLUMNS),
+        )
+        for row in rows
+    ])
+    return keys
 
 
 def store_train_view(data, timestamp=None):
-    session = SessionLocal()
+    """Upsert one TrainView snapshot in a single batched statement; True once committed.
+
+    With `TRAIN_VIEW_STORAGE_MODE = "compact"` the snapshot goes to
+    `train_view_compact` instead (timestamps truncated to whole seconds).
+    """
     if timestamp is None:
         timestamp = datetime.utcnow()
 
     try:
-        for train in data:
-            train_entry = TrainView(
-                timestamp=timestamp,
-                train_id=train.get("trainno"),
-                lat=float(train["lat"]) if train["lat"] else None,
-                lon=float(train["lon"]) if train["lon"] else None,
-                service=train.get("service"),
-                destination=train.get("dest"),
-                current_stop=train.get("currentstop"),
-                next_stop=train.get("nextstop"),
-                line=train.get("line"),
-                consist=train.get("consist"),
-                heading=float(train["heading"]) if train["heading"] else None,
-                late=int(train["late"]) if train["late"] else None,
-                source=train.get("SOURCE"),
-                track=train.get("TRACK"),
-                track_change=train.get("TRACK_CHANGE"),
-            )
-            existing_entry = session.query(TrainView).filter_by(
-                train_id=train_entry.train_id, timestamp=train_entry.timestamp
-            ).first()
-            if existing_entry:
-                session.merge(train_entry)
-            else:
-                session.add(train_entry)
-
-        session.commit()
-        print("✅ Train View data stored in SQLite successfully.")
+        with stage("store_train_view", step="rows") as timing:
+            rows = [_train_view_row(train, timestamp) for train in data]
+            timing.rows = len(rows)
+        if not rows:
+            return
+
+        if TRAIN_VIEW_STORAGE_MODE == "compact":
+            with stage("store_train_view", step="commit") as timing, get_engine("train_view").begin() as conn:
+                keys = _store_train_view_compact(conn, rows)
+                timing.rows = len(rows)
+            _string_keys[DATABASE_URLS["train_view"]] = keys
+            logger.info("Train View data stored in SQLite successfully.")
+            _notify_stored("train_view", rows)
+            return True
+
+        table = TrainView.__table__
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.train_id, table.c.timestamp],
+            set_={column: stmt.excluded[column] for column in TRAIN_VIEW_UPDATE_COLUMNS},
+        )
+        with stage("store_train_view", step="commit") as timing, get_engine("train_view").begin() as conn:
+            conn.execute(stmt, rows)
+            timing.rows = len(rows)
+        logger.info("Train View data stored in SQLite successfully.")
+        _notify_stored("train_view", rows)
+        return True
 
     except Exception as e:
-        session.rollback()
-        print(f"❌ Failed to store Train View data: {e}")
-    finally:
-        session.close()
+        logger.error(f"Failed to store Train View data: {e}")
 
 
 class TripUpdate(Base):
@@ -99,113 +375,294 @@ class TripUpdate(Base):
     uncertainty = Column(Integer)
     update_timestamp = Column(DateTime, nullable=False)
 
-    __table_args__ = ({"sqlite_autoincrement": True},)
+    __table_args__ = (
+        Index("ix_trip_updates_fetched_at", "fetched_at"),
+        Index("ix_trip_updates_trip_stop_fetched_at", "trip_id", "stop_id", "fetched_at"),
+        Index("ix_trip_updates_stop_fetched_at", "stop_id", "fetched_at"),
+        {"sqlite_autoincrement": True},
+    )
+
+
+class TripUpdateInterval(Base):
+    """One (trip_id, stop_id) prediction, valid from the poll that first saw it
+    until the poll that saw it change or disappear (NULL while current)."""
+    __tablename__ = "trip_update_intervals"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    trip_id = Column(String, nullable=False)
+    stop_id = Column(String, nullable=False)
+    stop_sequence = Column(Integer)
+    delay = Column(Integer)
+    uncertainty = Column(Integer)
+    update_timestamp = Column(DateTime, nullable=False)
+    valid_from = Column(DateTime, nullable=False)
+    valid_to = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_trip_update_intervals_open", "trip_id", "stop_id", unique=True,
+              sqlite_where=text("valid_to IS NULL")),
+        Index("ix_trip_update_intervals_trip_stop_valid_from", "trip_id", "stop_id", "valid_from"),
+        {"sqlite_autoincrement": True},
+    )
+
+
+# End of validity with open intervals sorted last, for "valid at time t" lookups.
+Index(
+    "ix_trip_update_intervals_valid_to",
+    func.coalesce(TripUpdateInterval.valid_to, literal_column("'9999-12-31'")),
+)
+
+
+class TripUpdatePoll(Base):
+    __tablename__ = "trip_update_polls"
+
+    fetched_at = Column(DateTime, primary_key=True)
+
+
+# Rebuilds the full-mode `trip_updates` rows of every poll from the intervals:
+# `SELECT * FROM trip_updates_replayed WHERE fetched_at = ?`.
+TRIP_UPDATES_REPLAYED_VIEW = """
+CREATE VIEW IF NOT EXISTS trip_updates_replayed AS
+SELECT p.fetched_at, i.trip_id, i.stop_id, i.stop_sequence, i.delay, i.uncertainty, i.update_timestamp
+FROM trip_update_polls p
+JOIN trip_update_intervals i
+  ON i.valid_from <= p.fetched_at AND COALESCE(i.valid_to, '9999-12-31') > p.fetched_at
+"""
+
+
+def trip_updates_source():
+    """Relation holding full-mode `trip_updates` rows in the configured storage mode.
+
+    Readers select from it instead of naming `trip_updates`, which stays
+    empty with `TRIP_UPDATES_STORAGE_MODE = "delta"`.
+    """
+    return "trip_updates_replayed" if TRIP_UPDATES_STORAGE_MODE == "delta" else "trip_updates"
+
+
+def trip_update_polls_source():
+    """Relation whose `fetched_at` lists the stored polls, for cheap MIN/MAX."""
+    return "trip_update_polls" if TRIP_UPDATES_STORAGE_MODE == "delta" else "trip_updates"
+
+
+def trip_updates_range_sql(columns=None, start_op=">=", end_op="<"):
+    """SELECT of full-mode `trip_updates` rows whose `fetched_at` lies between `:start` and `:end`.
+
+    `columns` defaults to every column; `start_op`/`end_op` pick open or
+    closed bounds. In delta mode the polls are joined to the intervals with
+    the window pushed into the interval side too, so the scan is bounded by
+    the `valid_to` index rather than reading every interval.
+    """
+    if TRIP_UPDATES_STORAGE_MODE != "delta":
+        return (
+            f"SELECT {', '.join(columns) if columns else '*'} FROM trip_updates "
+            f"WHERE fetched_at {start_op} :start AND fetched_at {end_op} :end"
+        )
+    selected = ", ".join(
+        f"p.{column}" if column == "fetched_at" else f"i.{column}" for column in columns or TRIP_UPDATE_COLUMNS
+    )
+    return (
+        f"SELECT {selected} FROM trip_update_polls p JOIN trip_update_intervals i "
+        "ON i.valid_from <= p.fetched_at AND COALESCE(i.valid_to, '9999-12-31') > p.fetched_at "
+        f"WHERE p.fetched_at {start_op} :start AND p.fetched_at {end_op} :end "
+        "AND COALESCE(i.valid_to, '9999-12-31') > :start AND i.valid_from <= :end"
+    )
 
 
 def init_trip_updates_db():
-    Base.metadata.create_all(bind=trip_updates_engine)
+    engine = get_engine("trip_updates")
+    tables = [TripUpdate.__table__, TripUpdateInterval.__table__, TripUpdatePoll.__table__]
+    Base.metadata.create_all(bind=engine, tables=tables)
+    for table in tables:
+        _ensure_indexes(engine, table)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(TRIP_UPDATES_REPLAYED_VIEW)
+
+
+# Column order of the tuples accepted by `store_trip_update_rows`.
+TRIP_UPDATE_COLUMNS = (
+    "fetched_at", "trip_id", "stop_id", "stop_sequence", "delay", "uncertainty", "update_timestamp",
+)
+
+_INSERT_TRIP_UPDATES = (
+    f"INSERT INTO trip_updates ({', '.join(TRIP_UPDATE_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in TRIP_UPDATE_COLUMNS)})"
+)
+
+
+_CLOSE_INTERVAL = (
+    "UPDATE trip_update_intervals SET valid_to = ? "
+    "WHERE trip_id = ? AND stop_id = ? AND valid_to IS NULL"
+)
+
+_OPEN_INTERVAL = (
+    "INSERT INTO trip_update_intervals "
+    "(trip_id, stop_id, stop_sequence, delay, uncertainty, update_timestamp, valid_from) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+
+# (trip_id, stop_id) -> (stop_sequence, delay, uncertainty) of the open
+# intervals, per trip_updates database URL. Loaded from the database on first
+# use; assumes this process is the only writer in delta mode.
+_open_intervals = {}
+
+
+def _load_open_intervals(conn):
+    url = DATABASE_URLS["trip_updates"]
+    if url not in _open_intervals:
+        result = conn.exec_driver_sql(
+            "SELECT trip_id, stop_id, stop_sequence, delay, uncertainty "
+            "FROM trip_update_intervals WHERE valid_to IS NULL"
+        )
+        _open_intervals[url] = {(row[0], row[1]): tuple(row[2:]) for row in result}
+    return _open_intervals[url]
+
+
+def _store_trip_update_deltas(conn, rows):
+    """Write only the (trip_id, stop_id) predictions that changed since the last poll.
+
+    Returns the state after these rows, which the caller installs once the
+    transaction has committed.
+    """
+    state = dict(_load_open_intervals(conn))
+    polls = {}
+    for row in rows:
+        polls.setdefault(row[0], {})[(row[1], row[2])] = row
+
+    for fetched_at in sorted(polls):
+        current = polls[fetched_at]
+        opened = [row for key, row in current.items() if state.get(key) != row[3:6]]
+        closed = [key for key in state if key not in current or state[key] != current[key][3:6]]
+
+        if closed:
+            conn.exec_driver_sql(_CLOSE_INTERVAL, [(fetched_at, *key) for key in closed])
+        if opened:
+            conn.exec_driver_sql(_OPEN_INTERVAL, [(*row[1:], fetched_at) for row in opened])
+        conn.exec_driver_sql("INSERT OR IGNORE INTO trip_update_polls (fetched_at) VALUES (?)", (fetched_at,))
+        state = {key: row[3:6] for key, row in current.items()}
+
+    return state
+
+
+def store_trip_update_rows(rows):
+    """Bulk insert `trip_updates` rows in one executemany; True once committed.
+
+    Rows are tuples in `TRIP_UPDATE_COLUMNS` order with datetimes already
+    formatted by `db_datetime`. With `TRIP_UPDATES_STORAGE_MODE = "delta"`
+    only changed predictions are written, as intervals in
+    `trip_update_intervals`.
+    """
+    try:
+        if not rows:
+            return
+
+        with stage("store_trip_updates", step="commit") as timing, get_engine("trip_updates").begin() as conn:
+            if TRIP_UPDATES_STORAGE_MODE == "delta":
+                state = _store_trip_update_deltas(conn, rows)
+            else:
+                conn.exec_driver_sql(_INSERT_TRIP_UPDATES, rows)
+            timing.rows = len(rows)
+        if TRIP_UPDATES_STORAGE_MODE == "delta":
+            _open_intervals[DATABASE_URLS["trip_updates"]] = state
+        logger.info("Trip Update data stored in SQLite successfully.")
+        _notify_stored("trip_updates", rows)
+        return True
+
+    except Exception as e:
+        logger.error(f"Failed to store Trip Update data: {e}")
 
 
 def store_trip_updates(data, timestamp=None):
-    session = TripUpdatesSession()
+    """Store GTFS-RT entities given as `MessageToDict` dicts."""
     if timestamp is None:
         timestamp = datetime.utcnow()
 
     try:
-        for entity in data:
-            trip_info = entity.get("tripUpdate", {})
-            trip_id = trip_info.get("trip", {}).get("tripId")
-
-            for stop_update in trip_info.get("stopTimeUpdate", []):
-                trip_entry = TripUpdate(
-                    trip_id=trip_id,
-                    stop_id=stop_update.get("stopId"),
-                    stop_sequence=stop_update.get("stopSequence"),
-                    delay=int(stop_update["arrival"]["delay"]) if "arrival" in stop_update else None,
-                    uncertainty=int(stop_update["arrival"]["uncertainty"]) if "arrival" in stop_update else None,
-                    update_timestamp=datetime.utcfromtimestamp(int(trip_info.get("timestamp", timestamp.timestamp()))),
+        with stage("store_trip_updates", step="rows") as timing:
+            fetched_at = db_datetime(timestamp)
+            fallback = db_datetime(timestamp.replace(microsecond=0))
+            rows = []
+
+            for entity in data:
+                trip_info = entity.get("tripUpdate", {})
+                trip_id = trip_info.get("trip", {}).get("tripId")
+                feed_timestamp = trip_info.get("timestamp")
+                update_timestamp = (
+                    db_datetime(datetime.utcfromtimestamp(int(feed_timestamp))) if feed_timestamp else fallback
                 )
 
-                session.add(trip_entry)
-
-        session.commit()
-        print("✅ Trip Update data stored in SQLite successfully.")
+                for stop_update in trip_info.get("stopTimeUpdate", []):
+                    arrival = stop_update.get("arrival", {})
+                    rows.append((
+                        fetched_at,
+                        trip_id,
+                        stop_update.get("stopId"),
+                        stop_update.get("stopSequence"),
+                        int(arrival["delay"]) if "delay" in arrival else None,
+                        int(arrival["uncertainty"]) if "uncertainty" in arrival else None,
+                        update_timestamp,
+                    ))
+            timing.rows = len(rows)
 
     except Exception as e:
-        session.rollback()
-        print(f"❌ Failed to store Trip Update data: {e}")
-    finally:
-        session.close()
-
-
-def get_db_connection():
-    """Create and return a database connection."""
-    try:
-        conn = sqlite3.connect(GTFS_DB_PATH)
-        return conn
-    except Exception as e:
-        logger.error(f"Failed to connect to database: {e}")
-        return None
+        logger.error(f"Failed to store Trip Update data: {e}")
+        return
 
+    return store_trip_update_rows(rows)
 
-def update_database(data_dir):
-    """Store GTFS data in SQLite database."""
-    conn = get_db_connection()
-    if not conn:
-        return
 
-    try:
-        for file in os.listdir(data_dir):
-            if file.endswith(".txt"):
-                file_path = os.path.join(data_dir, file)
-                df = pd.read_csv(file_path)
+class RRScheduleStop(Base):
+    """Scheduled, estimated and actual time of one block at one station, as
+    last reported by RRSchedules on `service_date`."""
+    __tablename__ = "rr_schedule_stops"
 
-                if df.empty:
-                    logger.warning(f"Skipping empty file: {file}")
-                    continue
+    service_date = Column(String, primary_key=True)
+    block_id = Column(String, primary_key=True)
+    station = Column(String, primary_key=True)
+    stop_index = Column(Integer)
+    sched_tm = Column(String)
+    est_tm = Column(String)
+    act_tm = Column(String)
+    fetched_at = Column(DateTime, nullable=False)
 
-                table_name = os.path.splitext(file)[0]
-                df.to_sql(table_name, conn, if_exists="replace", index=False)
+    __table_args__ = (
+        Index("ix_rr_schedule_stops_station_service_date", "station", "service_date"),
+        {"sqlite_with_rowid": False},
+    )
 
-        conn.commit()
-        logger.info("GTFS database updated successfully.")
 
-    except Exception as e:
-        logger.error(f"Database update failed: {e}")
-    finally:
-        conn.close()
+def init_rr_schedules_db():
+    engine = get_engine("rr_schedules")
+    Base.metadata.create_all(bind=engine, tables=[RRScheduleStop.__table__])
+    _ensure_indexes(engine, RRScheduleStop.__table__)
 
 
-def get_realtime_queries():
-    """Fetch block IDs for real-time schedule queries from the database."""
-    conn = get_db_connection()
-    if not conn:
-        return []
+# Column order of the tuples accepted by `store_rr_schedule_rows`.
+RR_SCHEDULE_COLUMNS = (
+    "service_date", "block_id", "station", "stop_index", "sched_tm", "est_tm", "act_tm", "fetched_at",
+)
 
-    try:
-        cursor = conn.cursor()
-        day_of_week = datetime.now().strftime('%A').lower()  # Example: "monday"
+# A second run on the same day replaces that day's rows with fresher times.
+_UPSERT_RR_SCHEDULE_STOPS = (
+    f"INSERT OR REPLACE INTO rr_schedule_stops ({', '.join(RR_SCHEDULE_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in RR_SCHEDULE_COLUMNS)})"
+)
 
-        query = f"""
-        SELECT DISTINCT block_id 
-        FROM trips t 
-        INNER JOIN calendar c 
-        ON t.service_id = c.service_id
-        WHERE c.{day_of_week} = 1;
-        """
-        logger.info(f"Executing query: {query}")
 
-        cursor.execute(query)
-        result = cursor.fetchall()
-        output = [str(row[0]) for row in result]
+def store_rr_schedule_rows(rows):
+    """Bulk insert `rr_schedule_stops` rows in one executemany; True once committed.
 
-        logger.info(f"Query result: {output}")
+    Rows are tuples in `RR_SCHEDULE_COLUMNS` order, with `service_date` as
+    YYYY-MM-DD and `fetched_at` formatted by `db_datetime`.
+    """
+    try:
+        if not rows:
+            return
 
-        cursor.close()
-        return output
+        with stage("store_rr_schedules") as timing, get_engine("rr_schedules").begin() as conn:
+            conn.exec_driver_sql(_UPSERT_RR_SCHEDULE_STOPS, rows)
+            timing.rows = len(rows)
+        logger.info("RRSchedules data stored in SQLite successfully.")
+        return True
 
     except Exception as e:
-        logger.error(f"Error fetching real-time queries: {e}")
-        return []
-    finally:
-        conn.close()
+        logger.error(f"Failed to store RRSchedules data: {e}")
@@ -1,13 +1,106 @@
+import hashlib
+import json
+import os
+import threading
+
 import requests
 import logging
 
+from septa.core import http
+from septa.core.metrics import increment, stage
+from septa.core.utils import create_dir
+from config import FETCH_STATE_PATH
+
+logger = logging.getLogger("fetcher")
+
+# Per-feed state of the last stored response, loaded from FETCH_STATE_PATH on
+# first use. `_pending` holds what a fetch saw until `mark_stored` commits it,
+# so a payload that failed to store is not skipped on the next poll.
+_feed_state = None
+_pending = {}
+_state_lock = threading.Lock()
+
+
+def _load_feed_state():
+    global _feed_state
+    if _feed_state is None:
+        try:
+            with open(FETCH_STATE_PATH) as f:
+                _feed_state = json.load(f)
+        except (OSError, ValueError):
+            _feed_state = {}
+    return _feed_state
+
+
+def _skip(feed, reason):
+    increment("fetch_skipped", feed=feed, reason=reason)
+    logger.info(f"Skipping unchanged {feed} payload ({reason}).")
+
+
+def fetch_if_changed(feed, api_url, session=None, timeout=None, version=None):
+    """Fetch `api_url` and return its body, or None if it failed or nothing changed.
+
+    The request is conditional on the ETag/Last-Modified stored for `feed`.
+    A 200 answer is still skipped when its sha256 matches the last stored
+    payload, or when `version(payload)` (e.g. the GTFS-RT header timestamp)
+    matches the last stored version. Call `mark_stored(feed)` once the
+    returned payload has been stored.
+
+    Requests go through `septa.core.http` with `feed`'s timeout and
+    circuit breaker, on the shared pool unless a `session` is passed.
+    """
+    with _state_lock:
+        state = dict(_load_feed_state().get(feed, {}))
+
+    headers = {}
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
 
-def fetch_data(api_url):
-    """Fetch data from an API and return JSON response."""
     try:
-        response = requests.get(api_url)
-        response.raise_for_status()
-        return response.json()
+        with stage("fetch_data", url=api_url) as timing:
+            response = http.get(feed, api_url, session=session, timeout=timeout, headers=headers)
+            if response.status_code == 304:
+                _skip(feed, "not_modified")
+                return None
+            response.raise_for_status()
+            payload = response.content
+            timing.bytes = len(payload)
     except requests.exceptions.RequestException as e:
-        logging.error(f"Error fetching data from {api_url}: {e}")
+        logger.error(f"Error fetching data from {api_url}: {e}")
+        return None
+
+    fetched = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "sha256": hashlib.sha256(payload).hexdigest(),
+        "version": version(payload) if version else None,
+    }
+    if fetched["sha256"] == state.get("sha256"):
+        _skip(feed, "same_payload")
         return None
+    if fetched["version"] is not None and fetched["version"] == state.get("version"):
+        _skip(feed, "same_version")
+        return None
+
+    _pending[feed] = fetched
+    return payload
+
+
+def mark_stored(feed):
+    """Remember the payload last returned by `fetch_if_changed` for `feed` as stored."""
+    fetched = _pending.pop(feed, None)
+    if fetched is None:
+        return
+    with _state_lock:
+        state = _load_feed_state()
+        state[feed] = fetched
+        try:
+            create_dir(os.path.dirname(FETCH_STATE_PATH))
+            tmp_path = f"{FETCH_STATE_PATH}.{feed}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(state, f, indent=4)
+            os.replace(tmp_path, FETCH_STATE_PATH)
+        except OSError as e:
+            logger.error(f"Failed to save fetch state: {e}")
@@ -0,0 +1,366 @@
+import hashlib
+import io
+import sqlite3
+import logging
+import os
+import shutil
+import zipfile
+from collections import defaultdict
+from datetime import date
+from functools import partial
+
+import pandas as pd
+
+from septa.core.database import get_engine
+from septa.core.metrics import stage
+from septa.core.timetable import build_timetable, publish_timetable, timetable_dir
+from config import GTFS_DB_PATH
+
+logger = logging.getLogger("gtfs")
+
+
+def get_db_connection():
+    """Check out a pooled GTFS database connection; `close()` returns it to the pool."""
+    try:
+        conn = get_engine("gtfs").raw_connection()
+        return conn
+    except Exception as e:
+        logger.error(f"Failed to connect to database: {e}")
+        return None
+
+
+# Rows read per chunk; bounds loader memory regardless of feed size.
+GTFS_CHUNK_SIZE = 50_000
+
+# SQLite column types for the GTFS tables SEPTA publishes. Identifiers, dates
+# and times stay TEXT; columns missing here load as TEXT too.
+GTFS_SCHEMA = {
+    "agency": {},
+    "calendar": {
+        "monday": "INTEGER", "tuesday": "INTEGER", "wednesday": "INTEGER", "thursday": "INTEGER",
+        "friday": "INTEGER", "saturday": "INTEGER", "sunday": "INTEGER",
+    },
+    "calendar_dates": {"exception_type": "INTEGER"},
+    "routes": {"route_type": "INTEGER"},
+    "stops": {
+        "stop_lat": "REAL", "stop_lon": "REAL", "location_type": "INTEGER", "wheelchair_boarding": "INTEGER",
+    },
+    "trips": {"direction_id": "INTEGER", "wheelchair_accessible": "INTEGER", "bikes_allowed": "INTEGER"},
+    "stop_times": {
+        "stop_sequence": "INTEGER", "pickup_type": "INTEGER", "drop_off_type": "INTEGER",
+        "shape_dist_traveled": "REAL", "timepoint": "INTEGER",
+    },
+    "shapes": {
+        "shape_pt_lat": "REAL", "shape_pt_lon": "REAL", "shape_pt_sequence": "INTEGER",
+        "shape_dist_traveled": "REAL",
+    },
+}
+
+# Indexes on the join and lookup keys, created after the bulk load.
+GTFS_INDEXES = {
+    "trips": [("trip_id",), ("service_id",), ("block_id",), ("route_id",)],
+    "stop_times": [("trip_id", "stop_sequence"), ("stop_id",)],
+    "calendar": [("service_id",)],
+    "calendar_dates": [("service_id", "date"), ("date",)],
+    "stops": [("stop_id",)],
+    "routes": [("route_id",)],
+    "shapes": [("shape_id", "shape_pt_sequence")],
+}
+
+_PANDAS_DTYPES = {"INTEGER": "Int64", "REAL": "float64", "TEXT": str}
+
+# Source tables of the derived active_service/active_blocks tables.
+SERVICE_TABLES = ("calendar", "calendar_dates", "trips")
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+
+def _load_table(conn, table_name, source):
+    """Stream one GTFS CSV into `table_name` chunk by chunk; return the row count."""
+    schema = GTFS_SCHEMA.get(table_name, {})
+    dtypes = defaultdict(lambda: str, {column: _PANDAS_DTYPES[kind] for column, kind in schema.items()})
+    reader = pd.read_csv(source, dtype=dtypes, chunksize=GTFS_CHUNK_SIZE, encoding="utf-8-sig")
+
+    count = 0
+    for chunk in reader:
+        if count == 0:
+            columns = ", ".join(f'"{column}" {schema.get(column, "TEXT")}' for column in chunk.columns)
+            conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+            conn.execute(f'CREATE TABLE "{table_name}" ({columns})')
+        chunk.to_sql(table_name, conn, if_exists="append", index=False)
+        count += len(chunk)
+    return count
+
+
+def _create_indexes(conn, tables):
+    for table_name in tables:
+        columns_present = {row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')}
+        for columns in GTFS_INDEXES.get(table_name, []):
+            if not set(columns) <= columns_present:
+                continue
+            index_name = f"ix_{table_name}_{'_'.join(columns)}"
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table_name}" ({", ".join(columns)})')
+
+
+def _table_exists(conn, table_name):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)
+    ).fetchone() is not None
+
+
+def _build_active_service(conn):
+    """Materialise the service IDs and blocks that run on each date of the feed.
+
+    `active_service(date, service_id)` expands `calendar` over its
+    start/end dates and weekdays, then applies the `calendar_dates`
+    additions (1) and removals (2). `active_blocks(date, block_id)` joins it
+    with `trips`. Dates are GTFS `YYYYMMDD` strings.
+    """
+    conn.execute("DROP TABLE IF EXISTS active_service")
+    conn.execute("DROP TABLE IF EXISTS active_blocks")
+    conn.execute(
+        "CREATE TABLE active_service (date TEXT NOT NULL, service_id TEXT NOT NULL, "
+        "PRIMARY KEY (date, service_id)) WITHOUT ROWID"
+    )
+    conn.execute(
+        "CREATE TABLE active_blocks (date TEXT NOT NULL, block_id TEXT NOT NULL, "
+        "PRIMARY KEY (date, block_id)) WITHOUT ROWID"
+    )
+
+    selects = []
+    if _table_exists(conn, "calendar"):
+        # strftime('%w') counts from Sunday; WEEKDAYS starts on Monday.
+        weekday = " ".join(f"WHEN '{(number + 1) % 7}' THEN c.{name}" for number, name in enumerate(WEEKDAYS))
+        iso = "substr({0}, 1, 4) || '-' || substr({0}, 5, 2) || '-' || substr({0}, 7, 2)"
+        selects.append(f"""
+            SELECT replace(d.day, '-', ''), c.service_id
+            FROM calendar c
+            JOIN days d ON d.day BETWEEN {iso.format('c.start_date')} AND {iso.format('c.end_date')}
+            WHERE CASE strftime('%w', d.day) {weekday} END = 1
+        """)
+        days = f"""
+            WITH RECURSIVE days(day) AS (
+                SELECT MIN({iso.format('start_date')}) FROM calendar
+                UNION ALL
+                SELECT date(day, '+1 day') FROM days
+                WHERE day < (SELECT MAX({iso.format('end_date')}) FROM calendar)
+            )
+        """
+    else:
+        days = ""
+    if _table_exists(conn, "calendar_dates"):
+        selects.append("SELECT date, service_id FROM calendar_dates WHERE exception_type = 1")
+        removed = " EXCEPT SELECT date, service_id FROM calendar_dates WHERE exception_type = 2"
+    else:
+        removed = ""
+
+    if selects:
+        conn.execute(f"{days} INSERT INTO active_service (date, service_id) {' UNION '.join(selects)}{removed}")
+    if _table_exists(conn, "trips"):
+        conn.execute(
+            "INSERT INTO active_blocks (date, block_id) "
+            "SELECT DISTINCT a.date, t.block_id FROM active_service a "
+            "JOIN trips t ON t.service_id = a.service_id WHERE t.block_id IS NOT NULL"
+        )
+    dates = conn.execute("SELECT COUNT(DISTINCT date) FROM active_service").fetchone()[0]
+    logger.info(f"Built active service for {dates} dates.")
+
+
+def load_gtfs(sources, db_path=None, incremental=False, drop=()):
+    """Load GTFS tables into a new database and atomically swap it into place.
+
+    `sources` maps table names to zero-argument callables that open the
+    table's CSV as a binary file. The load goes to a temporary file next to
+    `db_path`, so readers keep seeing the previous database until the final
+    `os.replace`. With `incremental`, the temporary file starts as a copy of
+    the current database and only the tables in `sources` (and `drop`) are
+    rewritten. `active_service`/`active_blocks` are rebuilt whenever one of
+    `SERVICE_TABLES` changes, and the memory-mapped timetable (see
+    `septa.core.timetable`) whenever `stop_times` does; it is published
+    right after the swap.
+    """
+    db_path = db_path or GTFS_DB_PATH
+    tmp_path = f"{db_path}.loading"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    timetable = None
+    conn = sqlite3.connect(tmp_path)
+    try:
+        if incremental and os.path.exists(db_path):
+            current = sqlite3.connect(db_path)
+            current.backup(conn)
+            current.close()
+        for table_name in drop:
+            conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+
+        # The temporary file is thrown away on failure, so skip journaling.
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+
+        loaded = []
+        for table_name, open_source in sources.items():
+            with open_source() as source:
+                count = _load_table(conn, table_name, source)
+            if count == 0:
+                conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+                logger.warning(f"Skipping empty table: {table_name}")
+                continue
+            loaded.append(table_name)
+            logger.info(f"Loaded {count} rows into {table_name}.")
+
+        _create_indexes(conn, loaded)
+        if set(SERVICE_TABLES) & (set(loaded) | set(drop)):
+            _build_active_service(conn)
+        rebuild_timetable = not incremental or "stop_times" in loaded or "stop_times" in drop
+        if rebuild_timetable and _table_exists(conn, "stop_times"):
+            timetable = build_timetable(conn, timetable_dir(db_path))
+        conn.commit()
+    except Exception:
+        conn.close()
+        os.remove(tmp_path)
+        if timetable:
+            shutil.rmtree(timetable, ignore_errors=True)
+        raise
+    conn.close()
+
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, db_path)
+    if timetable:
+        publish_timetable(timetable)
+    return loaded
+
+
+def open_feed_zip(path, member=None):
+    """Open a GTFS zip, descending into the nested feed `member` when present.
+
+    SEPTA's `gtfs_public.zip` wraps one zip per mode (`google_rail.zip`,
+    `google_bus.zip`); the nested archive is small enough to hold in memory.
+    """
+    archive = zipfile.ZipFile(path)
+    if member and member in archive.namelist():
+        with archive.open(member) as nested:
+            data = nested.read()
+        archive.close()
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    return archive
+
+
+def zip_table_hashes(archive):
+    """Return {table: (member name, sha256)} for the `.txt` members of `archive`."""
+    hashes = {}
+    for info in archive.infolist():
+        name = os.path.basename(info.filename)
+        if not name.endswith(".txt"):
+            continue
+        digest = hashlib.sha256()
+        with archive.open(info) as source:
+            for block in iter(lambda: source.read(1 << 20), b""):
+                digest.update(block)
+        hashes[os.path.splitext(name)[0]] = (info.filename, digest.hexdigest())
+    return hashes
+
+
+def load_gtfs_zip(zip_path, previous_hashes, db_path=None, member=None):
+    """Reload only the tables whose source file in `zip_path` changed.
+
+    `previous_hashes` maps table names to the sha256 recorded at the last
+    load. Tables stream straight from the archive; nothing is extracted.
+    Returns (new hashes, changed tables).
+    """
+    db_path = db_path or GTFS_DB_PATH
+    if not os.path.exists(db_path):
+        previous_hashes = {}
+
+    with open_feed_zip(zip_path, member) as archive:
+        members = zip_table_hashes(archive)
+        changed = {
+            table: partial(archive.open, name)
+            for table, (name, digest) in members.items()
+            if previous_hashes.get(table) != digest
+        }
+        removed = [table for table in previous_hashes if table not in members]
+
+        if changed or removed:
+            load_gtfs(changed, db_path, incremental=True, drop=removed)
+
+    hashes = {table: digest for table, (_, digest) in members.items()}
+    return hashes, sorted(changed) + removed
+
+
+def update_database(data_dir, db_path=None):
+    """Store the GTFS `.txt` files in `data_dir` in the SQLite database."""
+    sources = {
+        os.path.splitext(file)[0]: partial(open, os.path.join(data_dir, file), "rb")
+        for file in sorted(os.listdir(data_dir))
+        if file.endswith(".txt")
+    }
+    try:
+        with stage("update_database") as timing:
+            timing.bytes = sum(os.path.getsize(os.path.join(data_dir, f"{table}.txt")) for table in sources)
+            load_gtfs(sources, db_path)
+        logger.info("GTFS database updated successfully.")
+    except Exception as e:
+        logger.error(f"Database update failed: {e}")
+
+
+def trip_routes():
+    """Map GTFS trip_id to route_id; empty when no GTFS database is loaded."""
+    if not os.path.exists(GTFS_DB_PATH):
+        return {}
+    conn = get_db_connection()
+    if not conn:
+        return {}
+    try:
+        return dict(conn.execute("SELECT trip_id, route_id FROM trips"))
+    except sqlite3.Error as e:
+        logger.error(f"Failed to read GTFS trips: {e}")
+        return {}
+    finally:
+        conn.close()
+
+
+def _blocks_without_index(conn, day):
+    """Blocks running on `day` straight from trips/calendar, for databases loaded
+    before `active_blocks` existed."""
+    service_date = day.strftime("%Y%m%d")
+    running = (
+        f"SELECT service_id FROM calendar WHERE {WEEKDAYS[day.weekday()]} = 1 "
+        "AND start_date <= :date AND end_date >= :date"
+    )
+    if _table_exists(conn, "calendar_dates"):
+        running += (
+            " UNION SELECT service_id FROM calendar_dates WHERE date = :date AND exception_type = 1"
+            " EXCEPT SELECT service_id FROM calendar_dates WHERE date = :date AND exception_type = 2"
+        )
+    return conn.execute(
+        f"SELECT DISTINCT block_id FROM trips WHERE service_id IN ({running}) ORDER BY block_id",
+        {"date": service_date},
+    ).fetchall()
+
+
+def get_realtime_queries(day=None):
+    """Return the block IDs running on `day` (default: today) for real-time schedule queries."""
+    day = day or date.today()
+    conn = get_db_connection()
+    if not conn:
+        return []
+
+    try:
+        if _table_exists(conn, "active_blocks"):
+            result = conn.execute(
+                "SELECT block_id FROM active_blocks WHERE date = ? ORDER BY block_id", (day.strftime("%Y%m%d"),)
+            ).fetchall()
+        else:
+            logger.warning("No active_blocks table; reload GTFS to build it. Querying trips directly.")
+            result = _blocks_without_index(conn, day)
+        output = [str(row[0]) for row in result]
+
+        logger.info(f"Found {len(output)} blocks running on {day}.")
+        return output
+
+    except Exception as e:
+        logger.error(f"Error fetching real-time queries: {e}")
+        return []
+    finally:
+        conn.close()
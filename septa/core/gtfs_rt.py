@@ -0,0 +1,89 @@
+from datetime import datetime
+
+from google.protobuf.message import DecodeError
+from google.transit import gtfs_realtime_pb2
+
+from septa.core.database import db_datetime
+
+# Wire tag of FeedMessage.header (field 1, length-delimited).
+_HEADER_TAG = 0x0A
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        result |= (byte & 0x7F) << shift
+        pos += 1
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def feed_header_timestamp(payload):
+    """Return the header timestamp of a serialized `FeedMessage`, or None.
+
+    Producers serialize the header first, so only its bytes are decoded and
+    the entities are never parsed; other layouts fall back to a full parse.
+    """
+    try:
+        if payload[:1] == bytes((_HEADER_TAG,)):
+            length, start = _read_varint(payload, 1)
+            header = gtfs_realtime_pb2.FeedHeader()
+            header.ParseFromString(payload[start:start + length])
+        else:
+            message = gtfs_realtime_pb2.FeedMessage()
+            message.ParseFromString(payload)
+            header = message.header
+    except (DecodeError, IndexError):
+        return None
+    return header.timestamp if header.HasField("timestamp") else None
+
+
+def trip_update_rows(feed, fetched_at):
+    """Flatten a GTFS-RT `FeedMessage` into `trip_updates` row tuples.
+
+    Fields are read straight from the protobuf objects, and each trip
+    update timestamp is converted once per entity rather than per stop.
+    """
+    fetched = db_datetime(fetched_at)
+    fallback = db_datetime(fetched_at.replace(microsecond=0))
+    converted = {}
+    rows = []
+    append = rows.append
+
+    for entity in feed.entity:
+        if not entity.HasField("trip_update"):
+            continue
+
+        trip_update = entity.trip_update
+        trip = trip_update.trip
+        trip_id = trip.trip_id if trip.HasField("trip_id") else None
+
+        if trip_update.HasField("timestamp"):
+            feed_timestamp = trip_update.timestamp
+            update_timestamp = converted.get(feed_timestamp)
+            if update_timestamp is None:
+                update_timestamp = converted[feed_timestamp] = db_datetime(datetime.utcfromtimestamp(feed_timestamp))
+        else:
+            update_timestamp = fallback
+
+        for stop in trip_update.stop_time_update:
+            if stop.HasField("arrival"):
+                arrival = stop.arrival
+                delay = arrival.delay if arrival.HasField("delay") else None
+                uncertainty = arrival.uncertainty if arrival.HasField("uncertainty") else None
+            else:
+                delay = uncertainty = None
+
+            append((
+                fetched,
+                trip_id,
+                stop.stop_id if stop.HasField("stop_id") else None,
+                stop.stop_sequence if stop.HasField("stop_sequence") else None,
+                delay,
+                uncertainty,
+                update_timestamp,
+            ))
+
+    return rows
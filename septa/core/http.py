@@ -0,0 +1,247 @@
+"""Shared HTTP client for every SEPTA feed.
+
+`get(feed, url)` sends through one process-wide `requests.Session` whose
+adapters keep `HTTP_POOL_SIZE` keep-alive connections per host, and
+`async_session(feed)` opens an aiohttp session with the same settings for
+the concurrent RRSchedules fetch (`get_async`). Both ask for gzip, and for
+brotli when the `brotli` package is installed, use the per-feed timeout
+from `HTTP_TIMEOUTS`, and go through a per-feed `CircuitBreaker`: after
+`HTTP_BREAKER_FAILURES` consecutive connection errors, timeouts or 5xx
+answers the feed fails fast with `CircuitOpen` until a cooldown has
+passed, then a single probe decides whether it closes again.
+
+Latency goes to the `http_request` metrics stage, and every request counts
+towards `http_requests{feed,status}` and `http_connections{feed,kind}`
+(kind "new" or "reused").
+"""
+import asyncio
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from septa.core.metrics import increment, stage
+from config import (
+    HTTP_TIMEOUTS, HTTP_DEFAULT_TIMEOUT, HTTP_POOL_SIZE, HTTP_BREAKER_FAILURES, HTTP_BREAKER_COOLDOWN,
+    HTTP_BREAKER_MAX_COOLDOWN,
+)
+
+logger = logging.getLogger("http")
+
+
+class CircuitOpen(requests.exceptions.RequestException):
+    """The feed's circuit breaker is open; the request was not sent."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a doubling cooldown between probes."""
+
+    def __init__(self, feed, failures=None, cooldown=None, max_cooldown=None):
+        self.feed = feed
+        self.threshold = failures or HTTP_BREAKER_FAILURES
+        self.base_cooldown = cooldown or HTTP_BREAKER_COOLDOWN
+        self.max_cooldown = max_cooldown or HTTP_BREAKER_MAX_COOLDOWN
+        self.cooldown = self.base_cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self):
+        """True if a request may be sent; lets one probe through per elapsed cooldown."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            # Other callers keep failing fast while the probe is in flight.
+            self.opened_at = time.monotonic()
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"{self.feed} circuit closed.")
+            self.failures = 0
+            self.opened_at = None
+            self.cooldown = self.base_cooldown
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures < self.threshold:
+                return
+            if self.opened_at is not None:
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            self.opened_at = time.monotonic()
+            logger.warning(f"{self.feed} circuit open for {self.cooldown}s after {self.failures} failures.")
+
+
+_breakers = {}
+_session = None
+_lock = threading.Lock()
+# Connections opened so far per urllib3 pool, to tell new connections from reused ones.
+_pool_connections = {}
+
+
+def breaker(feed):
+    """Return the circuit breaker of `feed`."""
+    with _lock:
+        if feed not in _breakers:
+            _breakers[feed] = CircuitBreaker(feed)
+        return _breakers[feed]
+
+
+def timeout_for(feed):
+    return HTTP_TIMEOUTS.get(feed, HTTP_DEFAULT_TIMEOUT)
+
+
+def accept_encoding():
+    """Accept-Encoding value covering the codings this process can decode."""
+    for module in ("brotli", "brotlicffi"):
+        try:
+            __import__(module)
+            return "gzip, deflate, br"
+        except ImportError:
+            pass
+    return "gzip, deflate"
+
+
+def get_session():
+    """Return the process-wide pooled `requests.Session`, creating it on first use."""
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["Accept-Encoding"] = accept_encoding()
+            _session = session
+        return _session
+
+
+def close():
+    """Close the shared session and its pooled connections."""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+        _pool_connections.clear()
+
+
+def _count_connection(feed, response):
+    # The urllib3 pool that served the response; its num_connections only
+    # grows when a request had to open a new connection.
+    pool = getattr(getattr(response, "raw", None), "_pool", None)
+    if pool is None:
+        return
+    with _lock:
+        opened = pool.num_connections - _pool_connections.get(id(pool), 0)
+        _pool_connections[id(pool)] = pool.num_connections
+    increment("http_connections", feed=feed, kind="new" if opened > 0 else "reused")
+
+
+def _check_circuit(feed):
+    circuit = breaker(feed)
+    if not circuit.allow():
+        increment("http_requests", feed=feed, status="short_circuited")
+        raise CircuitOpen(f"{feed} circuit is open; not requesting it for now")
+    return circuit
+
+
+def get(feed, url, session=None, timeout=None, **kwargs):
+    """GET `url` for `feed` through the shared pool and `feed`'s circuit breaker.
+
+    Raises `CircuitOpen` (a `RequestException`) while the circuit is open.
+    A 5xx answer is returned like any other but counts as a failure.
+    """
+    circuit = _check_circuit(feed)
+    session = session or get_session()
+    with stage("http_request", feed=feed) as timing:
+        try:
+            response = session.get(url, timeout=timeout or timeout_for(feed), **kwargs)
+        except requests.exceptions.RequestException:
+            circuit.record_failure()
+            increment("http_requests", feed=feed, status="error")
+            raise
+        if response.status_code >= 500:
+            circuit.record_failure()
+            timing.failed = True
+        else:
+            circuit.record_success()
+        if not kwargs.get("stream"):
+            timing.bytes = len(response.content)
+    _count_connection(feed, response)
+    increment("http_requests", feed=feed, status=str(response.status_code))
+    return response
+
+
+def async_session(feed, limit=None):
+    """Open an aiohttp session with a keep-alive pool and connection-reuse tracing."""
+    import aiohttp
+
+    async def on_connection_create_end(session, context, params):
+        increment("http_connections", feed=feed, kind="new")
+
+    async def on_connection_reuseconn(session, context, params):
+        increment("http_connections", feed=feed, kind="reused")
+
+    trace = aiohttp.TraceConfig()
+    trace.on_connection_create_end.append(on_connection_create_end)
+    trace.on_connection_reuseconn.append(on_connection_reuseconn)
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=limit or HTTP_POOL_SIZE),
+        headers={"Accept-Encoding": accept_encoding()},
+        timeout=aiohttp.ClientTimeout(total=timeout_for(feed)),
+        trace_configs=[trace],
+    )
+
+
+async def get_async(session, feed, url, record=True):
+    """GET `url` on an `async_session`; return (response, body).
+
+    Raises `CircuitOpen` while `feed`'s circuit is open; connection errors
+    and timeouts propagate after counting against the circuit. Callers that
+    retry pass `record=False` and report the request's final outcome to
+    `breaker(feed)` themselves, so retries of one request count once.
+    """
+    import aiohttp
+
+    circuit = _check_circuit(feed)
+    with stage("http_request", feed=feed) as timing:
+        try:
+            async with session.get(url) as response:
+                body = await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if record:
+                circuit.record_failure()
+            increment("http_requests", feed=feed, status="error")
+            raise
+        if response.status >= 500:
+            if record:
+                circuit.record_failure()
+            timing.failed = True
+        elif record:
+            circuit.record_success()
+        timing.bytes = len(body)
+    increment("http_requests", feed=feed, status=str(response.status))
+    return response, body
+
+
+def stats():
+    """Circuit state, consecutive failures and cooldown per feed seen so far."""
+    with _lock:
+        breakers = list(_breakers.values())
+    return {
+        circuit.feed: {"state": circuit.state, "failures": circuit.failures, "cooldown": circuit.cooldown}
+        for circuit in breakers
+    }
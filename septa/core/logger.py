@@ -1,26 +1,74 @@
+import atexit
 import logging
 import os
-from septa.core.utils import get_today_date, create_dir
+import queue
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 
+from septa.core.utils import create_dir
 
-def setup_logging(module_name):
-    log_dir = os.path.join("../logs", module_name, get_today_date())
-    create_dir(log_dir)
 
-    # Fixed log filename
-    log_filename = os.path.join(log_dir, f"{module_name}.log")
+class DailyFileHandler(logging.FileHandler):
+    """File handler for `<root>/<module>/<YYYY-MM-DD>/<module>.log`.
+
+    The dated path is re-resolved when a record falls on a new local day, so
+    a long-running process such as the daemon moves on to the next day's file.
+    """
+
+    def __init__(self, root, module_name):
+        self.root = os.path.abspath(root)
+        self.module_name = module_name
+        self.day = datetime.now().strftime("%Y-%m-%d")
+        super().__init__(self._path(self.day), delay=True)
+
+    def _path(self, day):
+        log_dir = os.path.join(self.root, self.module_name, day)
+        create_dir(log_dir)
+        return os.path.join(log_dir, f"{self.module_name}.log")
+
+    def emit(self, record):
+        day = datetime.fromtimestamp(record.created).strftime("%Y-%m-%d")
+        if day != self.day:
+            # Runs under the handler lock; FileHandler.emit reopens the stream.
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+            self.baseFilename = self._path(day)
+            self.day = day
+        super().emit(record)
+
 
+# Loggers of the septa.core modules, which use `logging.getLogger` and rely
+# on the entry module's `setup_logging` for their handlers.
+CORE_LOGGERS = ("api", "database", "fetcher", "gtfs", "http", "recorder")
+
+
+def setup_logging(module_name):
     logger = logging.getLogger(module_name)
     logger.setLevel(logging.INFO)
 
     # Prevent duplicate handlers
     if not logger.hasHandlers():
-        file_handler = logging.FileHandler(log_filename)
+        file_handler = DailyFileHandler("../logs", module_name)
         file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
-        logger.addHandler(file_handler)
 
         console_handler = logging.StreamHandler()
         console_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
-        logger.addHandler(console_handler)
+
+        # Callers only enqueue records; a listener thread does the file and
+        # console I/O, so logging never blocks a fetch or a commit.
+        log_queue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+        queue_handler = QueueHandler(log_queue)
+        logger.addHandler(queue_handler)
+
+        # Core modules log through the first entry module set up.
+        for name in CORE_LOGGERS:
+            core_logger = logging.getLogger(name)
+            if not core_logger.handlers:
+                core_logger.setLevel(logging.INFO)
+                core_logger.addHandler(queue_handler)
 
     return logger
@@ -0,0 +1,164 @@
+"""In-process pipeline metrics with Prometheus text-file and JSON export.
+
+Wrap a pipeline step in `stage` to record its latency, rows, payload bytes
+and failures, and use `increment` for plain counters::
+
+    with stage("store_train_view", step="commit") as timing:
+        ...
+        timing.rows = len(rows)
+
+`write_metrics(job)` writes everything recorded so far to
+`METRICS_DIR/<job>.prom` (for node_exporter's textfile collector) and
+`METRICS_DIR/<job>.json`.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from septa.core.utils import create_dir
+from config import METRICS_DIR
+
+_lock = threading.Lock()
+_stages = {}
+_counters = {}
+
+
+class StageTiming:
+    """Per-run values a `stage` block can fill in before it exits."""
+
+    __slots__ = ("rows", "bytes", "failed")
+
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+        self.failed = False
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+@contextmanager
+def stage(name, **labels):
+    """Time the block as one run of stage `name`; an exception counts as a failure."""
+    timing = StageTiming()
+    started = time.perf_counter()
+    try:
+        yield timing
+    except BaseException:
+        timing.failed = True
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        with _lock:
+            entry = _stages.setdefault(_key(name, labels), {
+                "runs": 0, "failures": 0, "seconds": 0.0, "max_seconds": 0.0,
+                "last_seconds": 0.0, "rows": 0, "bytes": 0,
+            })
+            entry["runs"] += 1
+            entry["failures"] += timing.failed
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            entry["last_seconds"] = seconds
+            entry["rows"] += timing.rows
+            entry["bytes"] += timing.bytes
+
+
+def increment(name, amount=1, **labels):
+    """Add `amount` to counter `name`."""
+    with _lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+def summary():
+    """Return the recorded stages and counters as JSON-serialisable dicts."""
+    with _lock:
+        stages = [
+            {
+                "stage": name, "labels": dict(labels), **entry,
+                "mean_seconds": entry["seconds"] / entry["runs"],
+                "rows_per_second": entry["rows"] / entry["seconds"] if entry["seconds"] else None,
+            }
+            for (name, labels), entry in sorted(_stages.items())
+        ]
+        counters = [
+            {"counter": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in sorted(_counters.items())
+        ]
+    return {"stages": stages, "counters": counters}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(values):
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in values) + "}"
+
+
+# Prometheus metric name, type and help text per stage field.
+_STAGE_METRICS = (
+    ("runs", "septa_stage_runs_total", "counter", "Completed runs of the stage."),
+    ("failures", "septa_stage_failures_total", "counter", "Runs that raised or were marked failed."),
+    ("seconds", "septa_stage_seconds_total", "counter", "Wall-clock seconds spent in the stage."),
+    ("max_seconds", "septa_stage_seconds_max", "gauge", "Slowest run of the stage."),
+    ("last_seconds", "septa_stage_last_seconds", "gauge", "Duration of the latest run."),
+    ("rows", "septa_stage_rows_total", "counter", "Rows handled by the stage."),
+    ("bytes", "septa_stage_bytes_total", "counter", "Payload bytes handled by the stage."),
+)
+
+
+def render_prometheus():
+    """Return the recorded metrics in the Prometheus text exposition format."""
+    with _lock:
+        stages = sorted(_stages.items())
+        counters = sorted(_counters.items())
+
+    lines = []
+    for field, metric, kind, help_text in _STAGE_METRICS:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for (name, labels), entry in stages:
+            lines.append(f"{metric}{_labels((('stage', name), *labels))} {entry[field]}")
+
+    for name in sorted({name for (name, _), _ in counters}):
+        lines.append(f"# TYPE septa_{name}_total counter")
+        for (counter, labels), value in counters:
+            if counter == name:
+                lines.append(f"septa_{name}_total{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _write_atomic(path, content):
+    # A temp file per write: the daemon's feed threads write the same job concurrently.
+    with tempfile.NamedTemporaryFile(
+        "w", dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.", suffix=".tmp", delete=False
+    ) as f:
+        f.write(content)
+    try:
+        os.chmod(f.name, 0o644)
+        os.replace(f.name, path)
+    except OSError:
+        os.unlink(f.name)
+        raise
+
+
+def write_metrics(job, metrics_dir=None):
+    """Write `<job>.prom` and `<job>.json` so scrapers never see a partial file."""
+    metrics_dir = metrics_dir or METRICS_DIR
+    create_dir(metrics_dir)
+    _write_atomic(os.path.join(metrics_dir, f"{job}.prom"), render_prometheus())
+    _write_atomic(
+        os.path.join(metrics_dir, f"{job}.json"),
+        json.dumps({"job": job, "written_at": time.time(), **summary()}, indent=2),
+    )
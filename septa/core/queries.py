@@ -0,0 +1,193 @@
+"""Read-side queries over the stored train positions and trip updates.
+
+Every query is shaped to be answered from an index declared on the models:
+`train_view(train_id, timestamp)` and `train_view(timestamp)` for
+positions (the `train_view_compact` key and `ts` index in compact mode), `trip_updates(trip_id, stop_id, fetched_at)` and
+`trip_updates(stop_id, fetched_at)` for delays, and the
+`rr_schedule_stops` primary key for RRSchedules. Times are naive UTC
+datetimes, like the stored columns.
+
+Positions and delays are read through `train_view_source()` and
+`trip_updates_source()`, so the compact and delta storage modes are
+answered from the `train_view_decoded` and `trip_updates_replayed` views.
+"""
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+from septa.core.database import db_datetime, get_engine, train_view_source, trip_updates_source
+
+LATEST_POSITION_SQL = """
+SELECT * FROM {source}
+WHERE train_id = :train_id
+ORDER BY {time} DESC
+LIMIT 1
+"""
+
+# SQLite returns the other columns from the row holding MAX(time). The
+# unary + keeps the planner on the time range instead of walking the
+# whole (train_id, time) index to satisfy the GROUP BY.
+LATEST_SNAPSHOT_SQL = """
+SELECT *, MAX({time}) AS latest FROM {source}
+WHERE {time} >= :since
+GROUP BY +train_id
+"""
+
+TRAJECTORY_SQL = """
+SELECT timestamp, lat, lon, heading, current_stop, next_stop, late FROM {source}
+WHERE train_id = :train_id AND {time} >= :start AND {time} < :end
+ORDER BY {time}
+"""
+
+RECENT_POSITIONS_SQL = """
+SELECT train_id, timestamp, lat, lon, heading, current_stop, next_stop, late FROM {source}
+WHERE {time} >= :since
+ORDER BY {time}
+"""
+
+TRIP_STOP_DELAY_HISTORY_SQL = """
+SELECT fetched_at, trip_id, stop_id, stop_sequence, delay, uncertainty FROM {source}
+WHERE trip_id = :trip_id AND stop_id = :stop_id AND fetched_at >= :start AND fetched_at < :end
+ORDER BY fetched_at
+"""
+
+TRIP_DELAY_HISTORY_SQL = """
+SELECT fetched_at, trip_id, stop_id, stop_sequence, delay, uncertainty FROM {source}
+WHERE trip_id = :trip_id AND fetched_at >= :start AND fetched_at < :end
+ORDER BY fetched_at, stop_sequence
+"""
+
+STOP_DELAY_HISTORY_SQL = """
+SELECT fetched_at, trip_id, stop_id, stop_sequence, delay, uncertainty FROM {source}
+WHERE stop_id = :stop_id AND fetched_at >= :start AND fetched_at < :end
+ORDER BY fetched_at
+"""
+
+# Delta-mode predictions in force at :at; matches the expression index on
+# COALESCE(valid_to, ...). The trip_updates_replayed view does the same per poll.
+TRIP_UPDATES_AT_SQL = """
+SELECT trip_id, stop_id, stop_sequence, delay, uncertainty, update_timestamp, valid_from FROM trip_update_intervals
+WHERE coalesce(valid_to, '9999-12-31') > :at AND valid_from <= :at
+ORDER BY trip_id, stop_sequence
+"""
+
+# Stops whose scheduled or estimated time differs from the previous service
+# date, plus stops only one of the two days has. Both sides walk the
+# (service_date, block_id, station) primary key.
+RR_SCHEDULE_CHANGES_SQL = """
+SELECT c.block_id, c.station, c.stop_index,
+       p.sched_tm AS previous_sched_tm, c.sched_tm, p.est_tm AS previous_est_tm, c.est_tm,
+       CASE WHEN p.station IS NULL THEN 'added' ELSE 'changed' END AS change
+FROM rr_schedule_stops c
+LEFT JOIN rr_schedule_stops p
+  ON p.service_date = :previous AND p.block_id = c.block_id AND p.station = c.station
+WHERE c.service_date = :current
+  AND (p.station IS NULL OR c.sched_tm IS NOT p.sched_tm OR c.est_tm IS NOT p.est_tm)
+UNION ALL
+SELECT p.block_id, p.station, p.stop_index, p.sched_tm, NULL, p.est_tm, NULL, 'removed'
+FROM rr_schedule_stops p
+WHERE p.service_date = :previous
+  AND NOT EXISTS (
+    SELECT 1 FROM rr_schedule_stops c
+    WHERE c.service_date = :current AND c.block_id = p.block_id AND c.station = p.station
+  )
+ORDER BY 1, 3
+"""
+
+# Recent enough for a train that is still reporting positions.
+SNAPSHOT_MAX_AGE = timedelta(minutes=30)
+
+
+def _rows(database, sql, params):
+    with get_engine(database).connect() as conn:
+        return [dict(row._mapping) for row in conn.execute(text(sql), params)]
+
+
+def _window(start, end, bound=db_datetime):
+    return {
+        "start": bound(start or datetime(1970, 1, 1)),
+        "end": bound(end or datetime.utcnow() + timedelta(days=1)),
+    }
+
+
+def _train_view_rows(sql, params):
+    """Run a train_view query in the configured storage mode.
+
+    `sql` names the relation `{source}` and the time column `{time}`;
+    `params` maps parameter names to datetimes or other values.
+    """
+    source, time_column, bound = train_view_source()
+    params = {name: bound(value) if isinstance(value, datetime) else value for name, value in params.items()}
+    rows = _rows("train_view", sql.format(source=source, time=time_column), params)
+    if time_column != "timestamp":
+        for row in rows:
+            row.pop(time_column, None)
+    return rows
+
+
+def latest_position(train_id):
+    """Most recent stored row for `train_id`, or None."""
+    rows = _train_view_rows(LATEST_POSITION_SQL, {"train_id": train_id})
+    return rows[0] if rows else None
+
+
+def latest_snapshot(max_age=SNAPSHOT_MAX_AGE, now=None):
+    """Latest row of every train seen within `max_age`."""
+    since = (now or datetime.utcnow()) - max_age
+    rows = _train_view_rows(LATEST_SNAPSHOT_SQL, {"since": since})
+    for row in rows:
+        row.pop("latest")
+    return rows
+
+
+def trajectory(train_id, start=None, end=None):
+    """Positions of `train_id` in [start, end), oldest first."""
+    return _train_view_rows(TRAJECTORY_SQL, {
+        "train_id": train_id,
+        "start": start or datetime(1970, 1, 1),
+        "end": end or datetime.utcnow() + timedelta(days=1),
+    })
+
+
+def recent_positions(since):
+    """Positions of every train since `since`, oldest first."""
+    return _train_view_rows(RECENT_POSITIONS_SQL, {"since": since})
+
+
+def delay_history(trip_id=None, stop_id=None, start=None, end=None):
+    """Delay observations in [start, end) for a trip, a stop, or a trip at a stop."""
+    params = {"trip_id": trip_id, "stop_id": stop_id, **_window(start, end)}
+    if trip_id is not None and stop_id is not None:
+        sql = TRIP_STOP_DELAY_HISTORY_SQL
+    elif trip_id is not None:
+        sql = TRIP_DELAY_HISTORY_SQL
+    elif stop_id is not None:
+        sql = STOP_DELAY_HISTORY_SQL
+    else:
+        raise ValueError("delay_history needs a trip_id, a stop_id or both")
+    return _rows("trip_updates", sql.format(source=trip_updates_source()), params)
+
+
+def late_trains(line=None, min_late=1, max_age=SNAPSHOT_MAX_AGE, now=None):
+    """Trains currently at least `min_late` minutes late, optionally on one line."""
+    return [
+        row for row in latest_snapshot(max_age, now)
+        if row["late"] is not None and row["late"] >= min_late and (line is None or row["line"] == line)
+    ]
+
+
+def trip_updates_at(at):
+    """Full trip-update snapshot in force at `at`, rebuilt from delta-mode intervals."""
+    return _rows("trip_updates", TRIP_UPDATES_AT_SQL, {"at": db_datetime(at)})
+
+
+def rr_schedule_changes(service_date, previous_date=None):
+    """RRSchedules stops whose times changed since `previous_date` (default: the day before).
+
+    Each row has the previous and current `sched_tm`/`est_tm` and a
+    `change` of "added", "changed" or "removed".
+    """
+    service_date = date.fromisoformat(str(service_date))
+    previous_date = previous_date or service_date - timedelta(days=1)
+    params = {"current": service_date.isoformat(), "previous": str(previous_date)}
+    return _rows("rr_schedules", RR_SCHEDULE_CHANGES_SQL, params)
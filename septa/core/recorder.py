@@ -0,0 +1,104 @@
+"""Append-only recordings of raw feed responses.
+
+Each feed is recorded under `RECORD_DIR/<feed>/` as segment files named
+after the UTC time of their first record. A record is a big-endian header
+(fetch time in microseconds since the epoch as int64, payload length as
+uint32) followed by the payload, written as its own gzip member. Appending
+never rewrites earlier records, and a record cut short by a crash is
+dropped when the segment is read back. A new segment starts once the
+current one reaches `RECORD_SEGMENT_BYTES` or the UTC day changes.
+"""
+import gzip
+import logging
+import os
+import struct
+from datetime import datetime, timedelta
+
+from septa.core.utils import create_dir
+from config import RECORD_DIR, RECORD_FEEDS, RECORD_SEGMENT_BYTES
+
+logger = logging.getLogger("recorder")
+
+RECORD_HEADER = struct.Struct(">qI")
+SEGMENT_SUFFIX = ".seg.gz"
+_EPOCH = datetime(1970, 1, 1)
+
+# Segment currently appended to, per (record dir, feed).
+_segments = {}
+
+
+def _micros(timestamp):
+    delta = timestamp - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def _segment_path(feed, fetched_at, record_dir):
+    """Return the segment to append to, starting a new one when due."""
+    current = _segments.get((record_dir, feed))
+    if current is not None:
+        path, day = current
+        if day == fetched_at.date() and os.path.getsize(path) < RECORD_SEGMENT_BYTES:
+            return path
+
+    feed_dir = os.path.join(record_dir, feed)
+    create_dir(feed_dir)
+    path = os.path.join(feed_dir, f"{fetched_at:%Y%m%dT%H%M%S%f}{SEGMENT_SUFFIX}")
+    _segments[(record_dir, feed)] = (path, fetched_at.date())
+    return path
+
+
+def record(feed, payload, fetched_at, record_dir=None):
+    """Append one raw `payload` fetched at `fetched_at` (naive UTC) if `feed` is recorded."""
+    if record_dir is None:
+        if feed not in RECORD_FEEDS:
+            return
+        record_dir = RECORD_DIR
+    try:
+        path = _segment_path(feed, fetched_at, record_dir)
+        with gzip.open(path, "ab", compresslevel=6) as f:
+            f.write(RECORD_HEADER.pack(_micros(fetched_at), len(payload)) + payload)
+    except OSError as e:
+        logger.error(f"Failed to record {feed} payload: {e}")
+
+
+def segments(feed, record_dir=None):
+    """Return the segment paths of `feed` in recording order."""
+    feed_dir = os.path.join(record_dir or RECORD_DIR, feed)
+    if not os.path.isdir(feed_dir):
+        return []
+    return [
+        os.path.join(feed_dir, name)
+        for name in sorted(os.listdir(feed_dir))
+        if name.endswith(SEGMENT_SUFFIX)
+    ]
+
+
+def read_segment(path):
+    """Yield (fetched_at, payload) for every complete record in the segment at `path`."""
+    with gzip.open(path, "rb") as f:
+        while True:
+            try:
+                header = f.read(RECORD_HEADER.size)
+                if not header:
+                    return
+                if len(header) < RECORD_HEADER.size:
+                    raise EOFError
+                micros, length = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length:
+                    raise EOFError
+            except EOFError:
+                logger.warning(f"Dropping truncated record at the end of {path}.")
+                return
+            yield _EPOCH + timedelta(microseconds=micros), payload
+
+
+def read_records(feed, start=None, end=None, record_dir=None):
+    """Yield (fetched_at, payload) of `feed` in order, optionally within [start, end)."""
+    for path in segments(feed, record_dir):
+        for fetched_at, payload in read_segment(path):
+            if start is not None and fetched_at < start:
+                continue
+            if end is not None and fetched_at >= end:
+                return
+            yield fetched_at, payload
@@ -0,0 +1,49 @@
+"""SQLite engine profile shared by every database the scrapers read or write.
+
+Each new connection gets the pragmas from `config.SQLITE_PRAGMAS` (WAL,
+`synchronous=NORMAL`, busy timeout, mmap and page cache). In WAL mode
+readers work from a snapshot and never block the writer, and the busy
+timeout makes writers queue behind each other instead of failing with
+"database is locked".
+
+Pooled connections also remember the inode of their database file. When a
+file is swapped underneath them (the GTFS loader replaces septa.sqlite
+atomically), the pool drops the stale connection and reconnects on
+checkout.
+"""
+import os
+
+from sqlalchemy import create_engine, event, exc
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def _inode(path):
+    try:
+        return os.stat(path).st_ino
+    except OSError:
+        return None
+
+
+def create_sqlite_engine(url, pragmas):
+    """Create a pooled SQLite engine whose connections use `pragmas`."""
+    engine = create_engine(url, echo=False, connect_args={"check_same_thread": False})
+    path = engine.url.database
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, pragmas)
+        connection_record.info["inode"] = _inode(path)
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        inode = _inode(path)
+        if inode is not None and connection_record.info.get("inode") not in (None, inode):
+            raise exc.DisconnectionError(f"{path} was replaced")
+
+    return engine
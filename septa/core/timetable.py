@@ -0,0 +1,176 @@
+"""Compact GTFS timetable stored as memory-mappable NumPy arrays.
+
+`build_timetable` turns `stop_times` into flat arrays sorted by (trip,
+stop_sequence) and writes them as `.npy` files, with the trip and stop IDs
+in `ids.json`. Each build goes to its own version directory and becomes
+visible when `CURRENT` is switched to it, so readers never see a mix of
+two builds. `Timetable` opens the arrays with `mmap_mode="r"`: processes
+share the pages through the OS cache instead of each holding a copy.
+
+Times are seconds after midnight of the service day (GTFS times may pass
+24:00:00); -1 marks a missing time.
+"""
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+from config import GTFS_DB_PATH
+
+ARRAYS = ("trip_offsets", "key", "stop", "sequence", "arrival", "departure")
+# Bits reserved for stop_sequence in `key` (trip index << SEQUENCE_BITS | sequence).
+SEQUENCE_BITS = 20
+KEEP_VERSIONS = 2
+
+
+def timetable_dir(db_path=None):
+    """Directory holding the timetable builds for the GTFS database at `db_path`."""
+    return f"{os.path.splitext(db_path or GTFS_DB_PATH)[0]}_timetable"
+
+
+def _seconds(times):
+    """GTFS HH:MM:SS strings to seconds, -1 where missing."""
+    parts = times.fillna("").str.strip().str.split(":", expand=True)
+    if parts.shape[1] < 3:
+        return np.full(len(times), -1, dtype="int32")
+    numbers = parts.iloc[:, :3].apply(pd.to_numeric, errors="coerce")
+    seconds = numbers[0] * 3600 + numbers[1] * 60 + numbers[2]
+    return seconds.fillna(-1).astype("int32").to_numpy()
+
+
+def build_timetable(conn, directory):
+    """Write a new timetable build from the `stop_times` table of `conn`; return its path.
+
+    The build is only published by `publish_timetable`.
+    """
+    stop_times = pd.read_sql(
+        "SELECT trip_id, stop_id, stop_sequence, arrival_time, departure_time FROM stop_times",
+        conn,
+    )
+    stop_times = stop_times.dropna(subset=["trip_id", "stop_sequence"])
+    trip_codes, trip_ids = pd.factorize(stop_times["trip_id"], sort=True)
+    stop_codes, stop_ids = pd.factorize(stop_times["stop_id"], sort=True)
+    sequence = stop_times["stop_sequence"].astype("int64").to_numpy()
+    order = np.lexsort((sequence, trip_codes))
+
+    trip = trip_codes[order].astype("int64")
+    arrays = {
+        "trip_offsets": np.searchsorted(trip, np.arange(len(trip_ids) + 1)).astype("int64"),
+        "key": (trip << SEQUENCE_BITS) | sequence[order],
+        "stop": stop_codes[order].astype("int32"),
+        "sequence": sequence[order].astype("int32"),
+        "arrival": _seconds(stop_times["arrival_time"])[order],
+        "departure": _seconds(stop_times["departure_time"])[order],
+    }
+
+    path = os.path.join(directory, f"v{time.time_ns()}")
+    os.makedirs(path)
+    for name, values in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), values)
+    with open(os.path.join(path, "ids.json"), "w") as f:
+        json.dump({"trip_ids": list(trip_ids), "stop_ids": list(stop_ids)}, f)
+    return path
+
+
+def publish_timetable(path):
+    """Point `CURRENT` at the build in `path` and drop all but the newest builds."""
+    directory = os.path.dirname(path)
+    tmp_path = os.path.join(directory, "CURRENT.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(os.path.basename(path))
+    os.replace(tmp_path, os.path.join(directory, "CURRENT"))
+
+    # Readers that already mapped an older build keep their open files.
+    builds = sorted(name for name in os.listdir(directory) if name.startswith("v"))
+    for name in builds[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+class Timetable:
+    """Read-only view of one timetable build."""
+
+    def __init__(self, path):
+        self.path = path
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+        with open(os.path.join(path, "ids.json")) as f:
+            ids = json.load(f)
+        self.trip_ids = ids["trip_ids"]
+        self.stop_ids = ids["stop_ids"]
+        self.trip_index = {trip_id: index for index, trip_id in enumerate(self.trip_ids)}
+        self.stop_index = {stop_id: index for index, stop_id in enumerate(self.stop_ids)}
+
+    @classmethod
+    def open(cls, directory=None):
+        """Open the published build in `directory` (default: next to septa.sqlite)."""
+        directory = directory or timetable_dir()
+        with open(os.path.join(directory, "CURRENT")) as f:
+            return cls(os.path.join(directory, f.read().strip()))
+
+    def _position(self, trip_id, stop_sequence=None, stop_id=None):
+        trip = self.trip_index.get(trip_id)
+        if trip is None:
+            return None
+        if stop_sequence is not None:
+            key = (trip << SEQUENCE_BITS) | int(stop_sequence)
+            position = int(np.searchsorted(self.key, key))
+            return position if position < len(self.key) and self.key[position] == key else None
+
+        stop = self.stop_index.get(stop_id)
+        if stop is None:
+            return None
+        start, end = int(self.trip_offsets[trip]), int(self.trip_offsets[trip + 1])
+        matches = np.flatnonzero(self.stop[start:end] == stop)
+        return start + int(matches[0]) if len(matches) else None
+
+    def scheduled(self, trip_id, stop_sequence=None, stop_id=None):
+        """Scheduled (arrival, departure) seconds of a trip at a stop, or None.
+
+        Pass `stop_sequence` for a binary search, or `stop_id` to scan the
+        trip's own stops (its first visit wins on loops).
+        """
+        position = self._position(trip_id, stop_sequence, stop_id)
+        if position is None:
+            return None
+        return int(self.arrival[position]), int(self.departure[position])
+
+    def arrivals(self, trip_ids, stop_sequences):
+        """Vectorised scheduled arrival seconds for parallel arrays; -1 where unknown."""
+        trips = np.array([self.trip_index.get(trip_id, -1) for trip_id in trip_ids], dtype="int64")
+        keys = (np.maximum(trips, 0) << SEQUENCE_BITS) | np.asarray(stop_sequences, dtype="int64")
+        positions = np.minimum(np.searchsorted(self.key, keys), max(len(self.key) - 1, 0))
+        found = (trips >= 0) & (len(self.key) > 0) & (self.key[positions] == keys)
+        return np.where(found, self.arrival[positions], -1)
+
+    def trip_stops(self, trip_id):
+        """(stop_id, stop_sequence, arrival, departure) rows of one trip, in order."""
+        trip = self.trip_index.get(trip_id)
+        if trip is None:
+            return []
+        start, end = int(self.trip_offsets[trip]), int(self.trip_offsets[trip + 1])
+        return [
+            (self.stop_ids[stop], int(sequence), int(arrival), int(departure))
+            for stop, sequence, arrival, departure in zip(
+                self.stop[start:end], self.sequence[start:end], self.arrival[start:end], self.departure[start:end]
+            )
+        ]
+
+
+_cache = {}
+
+
+def get_timetable(directory=None):
+    """Return the published timetable, reopening it after a new build is published."""
+    directory = directory or timetable_dir()
+    current = os.path.join(directory, "CURRENT")
+    try:
+        version = os.stat(current).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _cache.get(directory)
+    if cached is None or cached[0] != version:
+        cached = _cache[directory] = (version, Timetable.open(directory))
+    return cached[1]
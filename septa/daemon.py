@@ -0,0 +1,92 @@
+"""Long-running scraper that polls every feed from one event loop.
+
+Run with `python -m septa.daemon`. The shared HTTP pool and database
+engines stay warm between ticks, each feed follows its own schedule from
+`config.DAEMON_SCHEDULES`, and SIGINT/SIGTERM let in-flight runs finish
+before exiting. With `API_ENABLED` the read API of `septa.api` is served
+from the same loop.
+"""
+import asyncio
+import signal
+from datetime import datetime
+
+from septa.core import http
+from septa.core.logger import setup_logging
+from septa.core.database import init_db, init_trip_updates_db
+from septa.core.metrics import write_metrics
+from septa.train_view import fetch_and_store_train_view
+from septa.trip_updates import fetch_trip_updates
+from config import DAEMON_SCHEDULES, API_ENABLED
+
+logger = setup_logging("daemon")
+
+
+def poll_interval(schedule, now=None):
+    """Return the polling interval in seconds that `schedule` sets for `now`."""
+    hour = (now or datetime.now()).hour
+    for start, end, seconds in schedule["windows"]:
+        if start <= hour < end:
+            return seconds
+    return schedule["default"]
+
+
+async def run_feed(name, job, schedule, stop):
+    """Run `job` in a worker thread on `schedule` until `stop` is set.
+
+    The next run is only scheduled once the previous one has returned, so
+    runs of the same feed never overlap.
+    """
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        try:
+            await asyncio.to_thread(job)
+        except Exception as e:
+            logger.error(f"{name} run failed: {e}")
+        try:
+            await asyncio.to_thread(write_metrics, "daemon")
+        except OSError as e:
+            logger.error(f"Writing metrics failed: {e}")
+
+        delay = max(0.0, poll_interval(schedule) - (loop.time() - started))
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    logger.info(f"{name} poller stopped.")
+
+
+async def main():
+    init_db()
+    init_trip_updates_db()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    jobs = {
+        "train_view": fetch_and_store_train_view,
+        "trip_updates": fetch_trip_updates,
+    }
+
+    runner = None
+    if API_ENABLED:
+        from septa import api
+        runner = await api.start()
+
+    logger.info(f"Starting scraper daemon for {', '.join(DAEMON_SCHEDULES)}.")
+    try:
+        await asyncio.gather(*(
+            run_feed(name, jobs[name], schedule, stop) for name, schedule in DAEMON_SCHEDULES.items()
+        ))
+    finally:
+        if runner is not None:
+            await api.stop(runner)
+        http.close()
+        logger.info("Scraper daemon stopped.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
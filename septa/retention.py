@@ -0,0 +1,337 @@
+"""Retention tiers, hourly summaries and incremental vacuum for the history databases.
+
+Run with `python -m septa.retention` (hourly from cron). For each feed in
+`RETENTION_TIERS`, rows older than a tier's age are thinned to one row per
+train (trip_updates: per trip and stop) per interval, or deleted once a
+tier has no interval. Before anything is thinned:
+
+- train_view rows are folded into `train_view_hourly`, one row per
+  (UTC hour, train) with sample counts and lateness sums;
+- trip_updates are rolled up into the per-stop delay tables of
+  septa.analytics, and no row newer than the rollup high-water mark is
+  ever touched. In delta storage mode the same holds for the intervals
+  and polls behind `trip_updates_replayed`, which the rollups read.
+
+Deletes run in `RETENTION_BATCH_ROWS` batches, each in its own short
+transaction, so the scrapers only ever wait for one batch. Freed pages are
+returned to the file system with `PRAGMA incremental_vacuum`, a few pages
+at a time within `RETENTION_VACUUM_SECONDS`. That needs
+`auto_vacuum=INCREMENTAL`, which new databases get from `SQLITE_PRAGMAS`;
+older files are converted once with `--convert` (a full VACUUM).
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, Integer, String
+
+from septa.core.database import Base, db_datetime, get_engine, init_db, init_trip_updates_db
+from septa.core.logger import setup_logging
+from septa.core.metrics import stage, write_metrics
+from config import (
+    RETENTION_TIERS, RETENTION_BATCH_ROWS, RETENTION_BATCH_PAUSE, RETENTION_VACUUM_PAGES,
+    RETENTION_VACUUM_SECONDS,
+)
+
+logger = setup_logging("retention")
+
+_EPOCH = datetime(1970, 1, 1)
+THIN_WINDOW = timedelta(hours=1)
+
+
+class RetentionState(Base):
+    __tablename__ = "retention_state"
+
+    name = Column(String, primary_key=True)
+    high_water = Column(String, nullable=False)  # thinned/summarised up to, as stored
+
+
+class TrainViewHourly(Base):
+    """Per-train summary of one UTC hour of train_view snapshots."""
+    __tablename__ = "train_view_hourly"
+
+    hour = Column(String, primary_key=True)
+    train_id = Column(String, primary_key=True)
+    line = Column(String)
+    samples = Column(Integer, nullable=False)
+    late_samples = Column(Integer, nullable=False)
+    late_sum = Column(Integer, nullable=False)
+    late_max = Column(Integer)
+
+    __table_args__ = ({"sqlite_with_rowid": False},)
+
+
+# History tables per feed. `key` identifies rows for batched deletes, `time`
+# is the (indexed) age column and `group` the rows a thinned interval keeps
+# one of; tables without a group are only ever deleted.
+TABLES = {
+    "train_view": [
+        {"table": "train_view", "key": ("id",), "time": "timestamp", "group": ("train_id",)},
+        {"table": "train_view_compact", "key": ("train_id", "ts"), "time": "ts", "group": ("train_id",),
+         "epoch": True},
+    ],
+    "trip_updates": [
+        {"table": "trip_updates", "key": ("id",), "time": "fetched_at", "group": ("trip_id", "stop_id"),
+         "rolled_up": True},
+        # Delta mode. Closed intervals only; matches the expression index on
+        # valid_to. An interval ending at or before the rollup high-water mark
+        # only served polls that were rolled up.
+        {"table": "trip_update_intervals", "key": ("id",), "time": "coalesce(valid_to, '9999-12-31')",
+         "rolled_up": True},
+        {"table": "trip_update_polls", "key": ("fetched_at",), "time": "fetched_at", "rolled_up": True},
+    ],
+}
+
+_HOURLY_UPSERT = (
+    "ON CONFLICT (hour, train_id) DO UPDATE SET "
+    "line = coalesce(excluded.line, line), samples = samples + excluded.samples, "
+    "late_samples = late_samples + excluded.late_samples, late_sum = late_sum + excluded.late_sum, "
+    "late_max = max(coalesce(late_max, excluded.late_max), coalesce(excluded.late_max, late_max))"
+)
+_COLUMNS = "(hour, train_id, line, samples, late_samples, late_sum, late_max)"
+HOURLY_SQL = (
+    f"INSERT INTO train_view_hourly {_COLUMNS} "
+    "SELECT substr(timestamp, 1, 13) || ':00:00', train_id, max(line), count(*), count(late), "
+    "coalesce(sum(late), 0), max(late) FROM train_view "
+    f"WHERE timestamp >= ? AND timestamp < ? GROUP BY 1, 2 {_HOURLY_UPSERT}",
+    f"INSERT INTO train_view_hourly {_COLUMNS} "
+    "SELECT strftime('%Y-%m-%d %H:00:00', c.ts, 'unixepoch'), c.train_id, max(s.value), count(*), "
+    "count(c.late), coalesce(sum(c.late), 0), max(c.late) FROM train_view_compact c "
+    "LEFT JOIN train_view_strings s ON s.id = c.line_key "
+    f"WHERE c.ts >= ? AND c.ts < ? GROUP BY 1, 2 {_HOURLY_UPSERT}",
+)
+
+
+def init_retention():
+    init_db()
+    init_trip_updates_db()
+    Base.metadata.create_all(
+        bind=get_engine("train_view"), tables=[RetentionState.__table__, TrainViewHourly.__table__]
+    )
+    Base.metadata.create_all(bind=get_engine("trip_updates"), tables=[RetentionState.__table__])
+
+
+def _bound(spec, moment):
+    """`moment` in the stored format of the spec's time column."""
+    if spec.get("epoch"):
+        return int((moment - _EPOCH).total_seconds())
+    return db_datetime(moment)
+
+
+def _from_stored(spec, value):
+    if spec.get("epoch"):
+        return _EPOCH + timedelta(seconds=value)
+    return datetime.fromisoformat(value)
+
+
+def _high_water(database, name):
+    with get_engine(database).connect() as conn:
+        value = conn.exec_driver_sql("SELECT high_water FROM retention_state WHERE name = ?", (name,)).scalar()
+    return datetime.fromisoformat(value) if value else None
+
+
+def _set_high_water(conn, name, moment):
+    conn.exec_driver_sql(
+        "INSERT INTO retention_state (name, high_water) VALUES (?, ?) "
+        "ON CONFLICT (name) DO UPDATE SET high_water = excluded.high_water",
+        (name, db_datetime(moment)),
+    )
+
+
+def _oldest(database, spec):
+    with get_engine(database).connect() as conn:
+        value = conn.exec_driver_sql(f"SELECT min({spec['time']}) FROM {spec['table']}").scalar()
+    return _from_stored(spec, value) if value is not None else None
+
+
+def _delete_in_batches(database, sql, params):
+    """Run a `LIMIT ?`-bounded DELETE until it removes less than a batch; return the total."""
+    total = 0
+    while True:
+        with get_engine(database).begin() as conn:
+            deleted = conn.exec_driver_sql(sql, (*params, RETENTION_BATCH_ROWS)).rowcount
+        total += deleted
+        if deleted < RETENTION_BATCH_ROWS:
+            return total
+        time.sleep(RETENTION_BATCH_PAUSE)
+
+
+def _key_filter(spec):
+    key = ", ".join(spec["key"])
+    return f"DELETE FROM {spec['table']} WHERE ({key}) IN ", ", ".join(f"t.{column}" for column in spec["key"])
+
+
+def expire(database, spec, cutoff):
+    """Delete the rows of one table older than `cutoff`; return the count."""
+    prefix, key = _key_filter(spec)
+    sql = f"{prefix}(SELECT {key} FROM {spec['table']} t WHERE {spec['time']} < ? LIMIT ?)"
+    with stage("retention", table=spec["table"], step="expire") as timing:
+        timing.rows = _delete_in_batches(database, sql, (_bound(spec, cutoff),))
+    return timing.rows
+
+
+def thin(database, spec, step, cutoff):
+    """Keep the first row per group and `step`-second interval before `cutoff`; return the count.
+
+    Work resumes from the high-water mark of the last run and walks the
+    range one `THIN_WINDOW` at a time.
+    """
+    name = f"thin:{spec['table']}:{step}"
+    start = _high_water(database, name) or _oldest(database, spec)
+    if start is None or start >= cutoff:
+        return 0
+
+    time_column = spec["time"]
+    if spec.get("epoch"):
+        bucket = f"(t.{time_column} / {step}) * {step}"
+    else:
+        bucket = f"datetime((CAST(strftime('%s', t.{time_column}) AS INTEGER) / {step}) * {step}, 'unixepoch')"
+    same_group = " AND ".join(f"p.{column} = t.{column}" for column in spec["group"])
+    prefix, key = _key_filter(spec)
+    sql = (
+        f"{prefix}(SELECT {key} FROM {spec['table']} t "
+        f"WHERE t.{time_column} >= ? AND t.{time_column} < ? AND EXISTS ("
+        f"SELECT 1 FROM {spec['table']} p WHERE {same_group} "
+        f"AND p.{time_column} < t.{time_column} AND p.{time_column} >= {bucket}) LIMIT ?)"
+    )
+
+    total = 0
+    with stage("retention", table=spec["table"], step="thin") as timing:
+        while start < cutoff:
+            end = min(start + THIN_WINDOW, cutoff)
+            total += _delete_in_batches(database, sql, (_bound(spec, start), _bound(spec, end)))
+            with get_engine(database).begin() as conn:
+                _set_high_water(conn, name, end)
+            start = end
+        timing.rows = total
+    return total
+
+
+def summarise_train_view(until):
+    """Fold complete UTC hours of train_view before `until` into train_view_hourly."""
+    until = until.replace(minute=0, second=0, microsecond=0)
+    specs = TABLES["train_view"]
+    start = _high_water("train_view", "train_view_hourly")
+    if start is None:
+        oldest = [moment for moment in (_oldest("train_view", spec) for spec in specs) if moment]
+        if not oldest:
+            return 0
+        start = min(oldest).replace(minute=0, second=0, microsecond=0)
+
+    hours = 0
+    with stage("retention", table="train_view_hourly", step="summary") as timing:
+        while start < until:
+            end = start + timedelta(hours=1)
+            with get_engine("train_view").begin() as conn:
+                for spec, sql in zip(specs, HOURLY_SQL):
+                    conn.exec_driver_sql(sql, (_bound(spec, start), _bound(spec, end)))
+                _set_high_water(conn, "train_view_hourly", end)
+            hours += 1
+            start = end
+        timing.rows = hours
+    return hours
+
+
+def _rollup_high_water():
+    """Newest trip_updates fetched_at folded into the analytics rollups, or None."""
+    from septa.analytics import update_rollups
+
+    try:
+        update_rollups()
+        with get_engine("analytics").connect() as conn:
+            value = conn.exec_driver_sql("SELECT high_water FROM rollup_state WHERE name = 'trip_updates'").scalar()
+    except Exception as e:
+        logger.error(f"Delay rollup failed; keeping raw trip updates: {e}")
+        return None
+    return datetime.fromisoformat(value) if value else None
+
+
+def apply_retention(feed, tiers=None, now=None):
+    """Summarise, thin and expire the history tables of `feed`; return rows deleted."""
+    tiers = sorted(tiers or RETENTION_TIERS[feed], key=lambda tier: tier[0])
+    if not tiers:
+        return 0
+    now = now or datetime.utcnow()
+    youngest = now - timedelta(days=tiers[0][0])
+
+    if feed == "train_view":
+        summarised = summarise_train_view(youngest)
+        logger.info(f"Summarised {summarised} hours of train_view into train_view_hourly.")
+    rolled_up = _rollup_high_water() if feed == "trip_updates" else None
+
+    deleted = 0
+    for spec in TABLES[feed]:
+        limit = None
+        if spec.get("rolled_up"):
+            if rolled_up is None:
+                logger.warning(f"Skipping {spec['table']}: nothing rolled up yet.")
+                continue
+            limit = rolled_up + timedelta(microseconds=1)
+
+        # Oldest tier first, so thinning never works on rows about to expire.
+        for days, step in reversed(tiers):
+            cutoff = now - timedelta(days=days)
+            cutoff = min(cutoff, limit) if limit else cutoff
+            if step is None:
+                count = expire(feed, spec, cutoff)
+            elif spec.get("group"):
+                count = thin(feed, spec, step, cutoff)
+            else:
+                continue
+            if count:
+                logger.info(f"Removed {count} {spec['table']} rows older than {days} days.")
+            deleted += count
+    return deleted
+
+
+def vacuum(database, seconds=None, pages=None):
+    """Free up to `seconds` worth of pages with incremental_vacuum; return pages freed."""
+    seconds = RETENTION_VACUUM_SECONDS if seconds is None else seconds
+    pages = pages or RETENTION_VACUUM_PAGES
+    deadline = time.monotonic() + seconds
+    freed = 0
+
+    with stage("retention", table=database, step="vacuum") as timing, get_engine(database).connect() as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+            logger.warning(f"{database} is not in auto_vacuum=INCREMENTAL mode; run with --convert once.")
+            return 0
+        # executescript steps the pragma to completion; execute() frees one page.
+        raw = conn.connection.driver_connection
+        while time.monotonic() < deadline:
+            before = raw.execute("PRAGMA freelist_count").fetchone()[0]
+            if before == 0:
+                break
+            raw.executescript(f"PRAGMA incremental_vacuum({pages})")
+            freed += before - raw.execute("PRAGMA freelist_count").fetchone()[0]
+        raw.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        timing.rows = freed
+    return freed
+
+
+def convert(database):
+    """Switch an existing database to auto_vacuum=INCREMENTAL with one full VACUUM."""
+    with get_engine(database).connect() as conn:
+        raw = conn.connection.driver_connection
+        raw.executescript("PRAGMA auto_vacuum=INCREMENTAL; VACUUM;")
+    logger.info(f"Converted {database} to auto_vacuum=INCREMENTAL.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--feeds", nargs="+", choices=TABLES, default=list(RETENTION_TIERS))
+    parser.add_argument("--convert", action="store_true", help="run a one-off full VACUUM to enable incremental vacuum")
+    parser.add_argument("--vacuum-seconds", type=float, help=f"default: {RETENTION_VACUUM_SECONDS}")
+    args = parser.parse_args(argv)
+
+    init_retention()
+    for feed in args.feeds:
+        if args.convert:
+            convert(feed)
+        deleted = apply_retention(feed)
+        freed = vacuum(feed, args.vacuum_seconds)
+        logger.info(f"{feed}: removed {deleted} rows, freed {freed} pages.")
+    write_metrics("retention")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,120 +1,219 @@
+import contextlib
+import gzip
 import json
 import os
+import random
 import asyncio
+from datetime import date, datetime
+
 import aiohttp
 import requests
-import zipfile
-import feedparser
-from datetime import datetime, timedelta
 
+from septa.core import http
 from septa.core.logger import setup_logging
 from septa.core.utils import create_dir
-from septa.core.database import update_database, get_realtime_queries
-from config import API_URLS, GTFS_ZIP_PATH, DATA_DIR, RR_SCHEDULES_JSON, RR_SCHEDULES_DIR
+from septa.core.database import db_datetime, init_rr_schedules_db, store_rr_schedule_rows
+from septa.core.gtfs import load_gtfs_zip, get_realtime_queries
+from septa.core.metrics import stage, write_metrics
+from config import (
+    API_URLS, GTFS_ZIP_PATH, GTFS_DB_PATH, GTFS_STATE_PATH, GTFS_FEED_MEMBER, DATA_DIR, SCRAPING_DIR,
+    RR_SCHEDULES_CONCURRENCY, RR_SCHEDULES_POOL_SIZE,
+    RR_SCHEDULES_RETRIES, RR_SCHEDULES_BACKOFF, get_rr_schedules_path,
+)
 
 logger = setup_logging("rr_schedules")
-create_dir(RR_SCHEDULES_DIR)
 
 
-def check_gtfs_update() -> bool:
-    """Check if GTFS data has been updated in the last 24 hours."""
+def _load_gtfs_state() -> dict:
     try:
-        feed = feedparser.parse(API_URLS["rss_url"])
-        if not feed.entries:
-            logger.warning("RSS feed is empty. Skipping GTFS update check.")
-            return False
+        with open(GTFS_STATE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-        latest_update = feed["entries"][0].get("updated", None)
-        if not latest_update:
-            logger.warning("RSS feed has no 'updated' timestamp. Skipping GTFS update check.")
-            return False
 
-        update_datetime = datetime.strptime(latest_update, "%Y-%m-%dT%H:%M:%SZ")
-        one_day_ago = datetime.utcnow() - timedelta(days=1)
+def _save_gtfs_state(state) -> None:
+    tmp_path = f"{GTFS_STATE_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=4)
+    os.replace(tmp_path, GTFS_STATE_PATH)
 
-        return one_day_ago <= update_datetime <= datetime.utcnow()
-    except Exception as e:
-        logger.error(f"Failed to check GTFS update: {e}")
-        return False
 
+def refresh_gtfs() -> bool:
+    """Refresh the GTFS database, reloading only tables whose source changed.
+
+    The download is conditional on the ETag/Last-Modified of the previous
+    refresh, so an unchanged feed costs one 304 round trip. Returns True if
+    any table was reloaded.
+    """
+    state = _load_gtfs_state() if os.path.exists(GTFS_DB_PATH) else {}
+    headers = {}
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
 
-def download_and_extract_gtfs() -> None:
-    """Download and extract the latest GTFS data."""
     try:
-        logger.info("Downloading GTFS ZIP file...")
-        with requests.get(API_URLS["gtfs_public"], stream=True, timeout=10) as response:
+        logger.info("Checking GTFS feed for updates...")
+        with http.get("gtfs_public", API_URLS["gtfs_public"], headers=headers, stream=True) as response:
+            if response.status_code == 304:
+                logger.info("GTFS feed not modified.")
+                return False
             response.raise_for_status()
-            with open(GTFS_ZIP_PATH, "wb") as file:
-                for chunk in response.iter_content(chunk_size=8192):
-                    file.write(chunk)
-
-        logger.info("Extracting GTFS ZIP file...")
-        with zipfile.ZipFile(GTFS_ZIP_PATH, "r") as zip_ref:
-            zip_ref.extractall(DATA_DIR)
 
-        os.remove(GTFS_ZIP_PATH)
-        logger.info("GTFS extraction completed.")
+            create_dir(DATA_DIR)
+            # Only a complete download replaces GTFS_ZIP_PATH.
+            tmp_path = f"{GTFS_ZIP_PATH}.tmp"
+            try:
+                with open(tmp_path, "wb") as file:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        file.write(chunk)
+                os.replace(tmp_path, GTFS_ZIP_PATH)
+            finally:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(tmp_path)
+            validators = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
 
     except requests.exceptions.Timeout:
         logger.error("GTFS download timed out.")
+        return False
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed to process GTFS data: {e}")
+        return False
 
-
-async def fetch_rr_schedule(session, query):
-    """Fetch real-time schedule data."""
-    url = f"{API_URLS['rr_schedules']}{query}"
     try:
-        async with session.get(url) as response:
-            data = await response.json()
-            return {query: data}
+        hashes, changed = load_gtfs_zip(GTFS_ZIP_PATH, state.get("members", {}), member=GTFS_FEED_MEMBER)
+        _save_gtfs_state({**validators, "members": hashes})
+        if changed:
+            logger.info(f"GTFS tables reloaded: {', '.join(changed)}")
+        else:
+            logger.info("GTFS feed downloaded but no table changed.")
+        return bool(changed)
+
     except Exception as e:
-        logger.error(f"Error fetching schedule for {query}: {e}")
-        return {query: None}
+        logger.error(f"GTFS database update failed: {e}")
+        return False
+    finally:
+        os.remove(GTFS_ZIP_PATH)
 
 
-async def fetch_all_rr_schedules(queries):
-    """Fetch all schedules asynchronously."""
-    async with aiohttp.ClientSession() as session:
-        tasks = [fetch_rr_schedule(session, q) for q in queries]
-        return await asyncio.gather(*tasks)
+class RetryableResponse(Exception):
+    """A 5xx answer worth retrying."""
 
 
-def save_to_json(data) -> None:
-    """Save fetched schedule data to JSON."""
-    try:
-        with open(RR_SCHEDULES_JSON, "w") as f:
-            json.dump(data, f, indent=4)
-        logger.info(f"Schedule data saved at {RR_SCHEDULES_JSON}")
-    except Exception as e:
-        logger.error(f"Failed to save JSON: {e}")
+async def fetch_rr_schedule(session, query):
+    """Fetch real-time schedule data, retrying transient failures with jittered backoff.
+
+    The circuit breaker sees one outcome per block, after the retries.
+    """
+    url = f"{API_URLS['rr_schedules']}{query}"
+    circuit = http.breaker("rr_schedules")
+
+    with stage("fetch_rr_schedule") as timing:
+        for attempt in range(RR_SCHEDULES_RETRIES + 1):
+            try:
+                response, body = await http.get_async(session, "rr_schedules", url, record=False)
+                if response.status >= 500:
+                    raise RetryableResponse(f"HTTP {response.status}")
+                circuit.record_success()
+                response.raise_for_status()
+                timing.bytes = len(body)
+                return {query: json.loads(body)}
+
+            except http.CircuitOpen as e:
+                logger.error(f"Skipping schedule for {query}: {e}")
+                timing.failed = True
+                return {query: None}
+
+            except (RetryableResponse, asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+                if attempt == RR_SCHEDULES_RETRIES:
+                    circuit.record_failure()
+                    logger.error(f"Giving up on schedule for {query} after {attempt + 1} attempts: {e!r}")
+                    timing.failed = True
+                    return {query: None}
+                await asyncio.sleep(random.uniform(0, RR_SCHEDULES_BACKOFF * 2 ** attempt))
+
+            except Exception as e:
+                logger.error(f"Error fetching schedule for {query}: {e}")
+                timing.failed = True
+                return {query: None}
+
+
+def _time(value):
+    return None if value in (None, "", "na") else value
+
+
+def schedule_rows(block_id, stops, service_date, fetched_at):
+    """Flatten one RRSchedules response into `rr_schedule_stops` tuples."""
+    if not isinstance(stops, list):
+        return []
+    fetched_at = db_datetime(fetched_at)
+    return [
+        (service_date.isoformat(), block_id, stop["station"], index,
+         _time(stop.get("sched_tm")), _time(stop.get("est_tm")), _time(stop.get("act_tm")), fetched_at)
+        for index, stop in enumerate(stops)
+        if isinstance(stop, dict) and stop.get("station")
+    ]
+
+
+async def fetch_all_rr_schedules(queries, path, service_date=None):
+    """Fetch all schedules and append each result to `path` as gzip NDJSON.
+
+    A fixed pool of `RR_SCHEDULES_CONCURRENCY` workers pulls block IDs from
+    a shared iterator, so memory does not grow with the number of blocks
+    and a slow block only occupies its own worker. Returns the number of
+    results written and their `rr_schedule_stops` rows for `service_date`
+    (default: today).
+    """
+    service_date = service_date or date.today()
+    pending = iter(queries)
+    written = 0
+    rows = []
+
+    with stage("fetch_all_rr_schedules") as timing:
+        async with http.async_session("rr_schedules", limit=RR_SCHEDULES_POOL_SIZE) as session:
+            with gzip.open(path, "wt", encoding="utf-8") as f:
+
+                async def worker():
+                    nonlocal written
+                    for query in pending:
+                        result = await fetch_rr_schedule(session, query)
+                        f.write(json.dumps(result) + "\n")
+                        written += 1
+                        rows.extend(schedule_rows(query, result[query], service_date, datetime.utcnow()))
+
+                await asyncio.gather(*(worker() for _ in range(RR_SCHEDULES_CONCURRENCY)))
+        timing.rows = written
+
+    return written, rows
 
 
 if __name__ == "__main__":
     logger.info("Starting rail schedules processing...")
 
-    # Step 1: Check for GTFS updates and update database if needed
-    if check_gtfs_update():
-        logger.info("New GTFS update found. Processing...")
-        download_and_extract_gtfs()
-        update_database(DATA_DIR)
-    else:
-        logger.info("No new GTFS updates found.")
+    # Step 1: Reload any GTFS tables that changed since the last refresh
+    refresh_gtfs()
 
     # Step 2: Fetch real-time schedules using database queries
     try:
-        output = get_realtime_queries()
+        service_date = date.today()
+        output = get_realtime_queries(service_date)
         if output:
-            loop = asyncio.get_event_loop()
-            if loop.is_closed():
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-
-            data = loop.run_until_complete(fetch_all_rr_schedules(output))
-            save_to_json(data)
+            create_dir(SCRAPING_DIR)
+            path = get_rr_schedules_path()
+            count, rows = asyncio.run(fetch_all_rr_schedules(output, path, service_date))
+            logger.info(f"Schedule data for {count} blocks saved at {path}")
+
+            # Step 3: One bulk insert of the flattened stops for day-over-day diffs
+            init_rr_schedules_db()
+            store_rr_schedule_rows(rows)
             logger.info("Rail schedules fetching completed.")
         else:
             logger.warning("No valid queries found for real-time schedule fetching.")
 
     except Exception as e:
         logger.critical(f"Critical error occurred: {e}", exc_info=True)
+    write_metrics("rrschedules")
@@ -0,0 +1,41 @@
+from datetime import datetime
+
+import pytest
+
+from septa import analytics
+from septa.core import database
+
+
+@pytest.fixture
+def databases(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "_engines", {})
+    for name in ("trip_updates", "analytics"):
+        monkeypatch.setitem(database.DATABASE_URLS, name, f"sqlite:///{tmp_path / f'{name}.db'}")
+    monkeypatch.setattr(analytics, "trip_routes", lambda: {"T1": "PAO", "T2": "AIR"})
+    database.init_trip_updates_db()
+
+
+def _store(fetched_at, delays):
+    fetched = database.db_datetime(fetched_at)
+    database.store_trip_update_rows([
+        (fetched, trip_id, stop_id, 1, delay, 0, fetched) for trip_id, stop_id, delay in delays
+    ])
+
+
+def test_rollups_are_incremental(databases):
+    _store(datetime(2025, 3, 3, 8, 5), [("T1", "A", 0), ("T1", "B", 120), ("T2", "A", 600)])
+    assert analytics.update_rollups() == 3
+    assert analytics.update_rollups() == 0
+
+    _store(datetime(2025, 3, 3, 9, 5), [("T1", "A", 420), ("T1", "B", None)])
+    assert analytics.update_rollups() == 2
+
+    stats = analytics.delay_stats(by=("route_id",)).set_index("route_id")
+    assert stats.loc["PAO", "observations"] == 3
+    assert stats.loc["PAO", "mean_delay"] == 180
+    assert stats.loc["PAO", "on_time_share"] == pytest.approx(2 / 3)
+    assert stats.loc["PAO", "p50"] == 120
+    assert stats.loc["AIR", "p95"] == 600
+
+    by_hour = analytics.delay_stats(by=("hour_of_day",)).set_index("hour_of_day")
+    assert by_hour["observations"].to_dict() == {8: 3, 9: 1}
@@ -0,0 +1,110 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from septa import api
+from septa.core import database
+
+START = datetime(2025, 3, 3, 12, 0)
+
+
+def _train(trainno, line, late):
+    return {
+        "trainno": trainno, "lat": "39.95", "lon": "-75.16", "service": "LOCAL", "dest": "Paoli",
+        "currentstop": "A", "nextstop": "B", "line": line, "consist": "", "heading": "90",
+        "late": str(late), "SOURCE": "", "TRACK": "", "TRACK_CHANGE": "",
+    }
+
+
+@pytest.fixture
+def stores(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "_engines", {})
+    monkeypatch.setattr(database, "DATABASE_URLS", dict(database.DATABASE_URLS))
+    monkeypatch.setattr(database, "_store_listeners", {"train_view": [], "trip_updates": []})
+    database.configure_engines(
+        train_view=f"sqlite:///{tmp_path / 'train_view.db'}",
+        trip_updates=f"sqlite:///{tmp_path / 'trip_updates.db'}",
+    )
+    database.init_db()
+    database.init_trip_updates_db()
+    monkeypatch.setattr(api, "_snapshot", api.Snapshot())
+    monkeypatch.setattr(api, "_cache", api.ResponseCache(ttl=60))
+    api.install()
+
+
+def _get(path):
+    async def scenario():
+        async with TestClient(TestServer(api.make_app())) as client:
+            response = await client.get(path)
+            return response.status, (await response.json() if response.status == 200 else None)
+
+    return asyncio.run(scenario())
+
+
+def test_snapshot_follows_stores_without_reading_databases(stores, monkeypatch):
+    for minute, late in enumerate((2, 5)):
+        database.store_train_view(
+            [_train("1001", "Paoli/Thorndale", late), _train("2002", "Trenton", 0)],
+            START + timedelta(minutes=minute),
+        )
+    database.store_trip_update_rows([
+        (database.db_datetime(START), "T1", "90001", 1, 120, 0, database.db_datetime(START)),
+        (database.db_datetime(START), "T2", "90001", 3, 60, 0, database.db_datetime(START)),
+    ])
+    assert api.current().version == 3
+
+    def no_database(name="train_view"):
+        raise AssertionError("read traffic touched the database")
+    monkeypatch.setattr(database, "get_engine", no_database)
+
+    status, body = _get("/positions")
+    assert status == 200
+    assert body["as_of"] == "2025-03-03T12:01:00"
+    assert sorted(train["train_id"] for train in body["trains"]) == ["1001", "2002"]
+
+    _, body = _get("/delays/lines")
+    assert body["lines"][0] == {"line": "Paoli/Thorndale", "trains": 1, "mean_late": 5, "max_late": 5}
+
+    _, body = _get("/delays/stops")
+    assert body["stops"] == [{"stop_id": "90001", "predictions": 2, "mean_delay": 90, "max_delay": 120}]
+
+    _, body = _get("/trains/1001/history")
+    assert [point["late"] for point in body["positions"]] == [2, 5]
+    assert _get("/trains/9999/history")[0] == 404
+
+
+def test_bodies_are_cached_per_snapshot_version(stores):
+    database.store_train_view([_train("1001", "Paoli/Thorndale", 2)], START)
+    first = api.cached_body("positions", api.positions_body)
+    assert api.cached_body("positions", api.positions_body)[1] is first[1]
+
+    database.store_train_view([_train("1001", "Paoli/Thorndale", 3)], START + timedelta(minutes=1))
+    snapshot, body = api.cached_body("positions", api.positions_body)
+    assert snapshot.version == first[0].version + 1
+    assert body is not first[1]
+
+
+def test_warm_seeds_positions_and_history(stores):
+    for minute in range(3):
+        database.store_train_view([_train("1001", "Paoli/Thorndale", minute)], START + timedelta(minutes=minute))
+    api._snapshot = api.Snapshot()
+
+    api.warm(now=START + timedelta(minutes=5))
+
+    snapshot = api.current()
+    assert [row["late"] for row in snapshot.positions] == [2]
+    assert snapshot.position_time == START + timedelta(minutes=2)
+    assert len(snapshot.history["1001"]) == 3
+
+
+def test_response_cache_expires_and_evicts():
+    cache = api.ResponseCache(ttl=0, size=2)
+    cache.put("a", b"1")
+    assert cache.get("a") is None
+
+    cache = api.ResponseCache(ttl=60, size=2)
+    for key in "abc":
+        cache.put(key, key.encode())
+    assert cache.get("a") is None and cache.get("c") == b"c"
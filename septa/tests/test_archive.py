@@ -0,0 +1,49 @@
+import os
+from datetime import date, datetime
+
+from septa import archive
+from septa.core import database
+
+
+def _train(trainno, line):
+    return {
+        "trainno": trainno, "lat": "39.95", "lon": "-75.16", "service": "LOCAL", "dest": "Paoli",
+        "currentstop": "Suburban Station", "nextstop": "30th Street Station", "line": line,
+        "consist": "", "heading": "270", "late": "3", "SOURCE": "Thorndale", "TRACK": "", "TRACK_CHANGE": "",
+    }
+
+
+def test_compact_and_read_prunes_by_date_and_line(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "_engines", {})
+    monkeypatch.setitem(database.DATABASE_URLS, "train_view", f"sqlite:///{tmp_path / 'train_view.db'}")
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    database.init_db()
+
+    database.store_train_view([_train("1", "Paoli/Thorndale"), _train("2", "Airport")], datetime(2025, 3, 1, 9))
+    database.store_train_view([_train("1", "Paoli/Thorndale")], datetime(2025, 3, 2, 9))
+    database.store_train_view([_train("1", "Paoli/Thorndale")], datetime(2025, 3, 3, 9))
+
+    archive.compact(feeds=("train_view",), until=date(2025, 3, 3))
+    assert archive.archived_days("train_view") == [date(2025, 3, 1), date(2025, 3, 2)]
+
+    df = archive.read_archive("train_view", date(2025, 3, 1), date(2025, 3, 31),
+                              lines=["Paoli/Thorndale"], columns=["train_id", "timestamp", "line"])
+    assert sorted(df["timestamp"].dt.day) == [1, 2]
+    assert set(df["line"]) == {"Paoli/Thorndale"}
+    assert list(df.columns) == ["train_id", "timestamp", "line"]
+
+
+def test_rearchiving_a_day_replaces_it(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "_engines", {})
+    monkeypatch.setitem(database.DATABASE_URLS, "train_view", f"sqlite:///{tmp_path / 'train_view.db'}")
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    database.init_db()
+    database.store_train_view([_train("1", "Paoli/Thorndale")], datetime(2025, 3, 1, 9))
+
+    assert archive.compact_day("train_view", date(2025, 3, 1)) == 1
+    database.store_train_view([_train("2", "Airport")], datetime(2025, 3, 1, 10))
+    assert archive.compact_day("train_view", date(2025, 3, 1)) == 2
+
+    df = archive.read_archive("train_view", date(2025, 3, 1), date(2025, 3, 1))
+    assert sorted(df["train_id"]) == ["1", "2"]
+    assert sorted(os.listdir(tmp_path / "archive" / "train_view")) == ["date=2025-03-01"]
@@ -0,0 +1,112 @@
+import gzip
+import json
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from septa import backfill
+from septa.core import database
+from septa.core.recorder import record
+
+DAYS = (date(2025, 3, 3), date(2025, 3, 4))
+
+
+def _snapshot(trains):
+    return json.dumps([
+        {
+            "trainno": trainno, "lat": "39.95", "lon": "-75.16", "service": "LOCAL", "dest": "Paoli",
+            "currentstop": "A", "nextstop": "B", "line": "Paoli/Thorndale", "consist": "", "heading": "90",
+            "late": "2", "SOURCE": "", "TRACK": "", "TRACK_CHANGE": "",
+        }
+        for trainno in trains
+    ]).encode()
+
+
+@pytest.fixture
+def inputs(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "_engines", {})
+    monkeypatch.setattr(database, "DATABASE_URLS", dict(database.DATABASE_URLS))
+    monkeypatch.setattr(database, "DATABASE_PRAGMAS", dict(database.DATABASE_PRAGMAS))
+    for name in ("train_view", "rr_schedules"):
+        database.configure_engines(**{name: f"sqlite:///{tmp_path / f'{name}.db'}"})
+
+    for day in DAYS:
+        for minute in range(3):
+            fetched_at = datetime.combine(day, datetime.min.time()) + timedelta(hours=12, minutes=minute)
+            record("train_view", _snapshot(["1001", "1002"]), fetched_at, record_dir=str(tmp_path / "recordings"))
+
+    scraping = tmp_path / "scraping"
+    scraping.mkdir()
+    with gzip.open(scraping / "rr_schedules_2025-03-03-05-00-00.ndjson.gz", "wt") as f:
+        f.write(json.dumps({"1001": [{"station": "Paoli", "sched_tm": "8:00 am", "est_tm": "8:02 am"}]}) + "\n")
+        f.write(json.dumps({"1002": None}) + "\n")
+
+    return backfill.find_inputs(backfill.FEEDS, record_dir=str(tmp_path / "recordings"), scraping_dir=str(scraping))
+
+
+def _count(name, table):
+    with database.get_engine(name).connect() as conn:
+        return conn.exec_driver_sql(f"SELECT COUNT(*) FROM {table}").scalar()
+
+
+def test_find_inputs_groups_by_feed_and_day(inputs):
+    assert sorted(inputs) == [("rr_schedules", DAYS[0]), ("train_view", DAYS[0]), ("train_view", DAYS[1])]
+
+
+def test_backfill_builds_merges_and_resumes(inputs, tmp_path):
+    work_dir = str(tmp_path / "backfill")
+    targets = dict(database.DATABASE_URLS)
+
+    # A run that crashed after building the first day's shard.
+    paths = inputs[("train_view", DAYS[0])]
+    shard_path = backfill._shard_path(work_dir, "train_view", DAYS[0])
+    backfill.build_shard("train_view", DAYS[0], paths, shard_path, backfill._fingerprint(paths))
+    database.configure_engines(train_view=targets["train_view"])
+
+    stats = backfill.backfill(inputs, work_dir, jobs=2)
+
+    assert stats == {"built": 2, "merged": 3, "records": 4, "failed": 0}
+    assert _count("train_view", "train_view") == 12
+    assert _count("rr_schedules", "rr_schedule_stops") == 1
+    assert backfill.merged_shards("train_view") == {"train_view/2025-03-03", "train_view/2025-03-04"}
+
+    assert backfill.backfill(inputs, work_dir, jobs=2) == {"built": 0, "merged": 0, "records": 0, "failed": 0}
+    assert _count("train_view", "train_view") == 12
+
+
+def test_trip_updates_shard_supersedes_only_its_own_stretch(monkeypatch, tmp_path):
+    from septa import analytics
+
+    monkeypatch.setattr(database, "_engines", {})
+    monkeypatch.setattr(database, "_open_intervals", {})
+    monkeypatch.setattr(database, "DATABASE_URLS", dict(database.DATABASE_URLS))
+    monkeypatch.setattr(database, "TRIP_UPDATES_STORAGE_MODE", "delta")
+    monkeypatch.setattr(analytics, "trip_routes", lambda: {"T1": "PAO"})
+    database.configure_engines(analytics=f"sqlite:///{tmp_path / 'analytics.db'}")
+
+    def store(url, day, delay):
+        database.configure_engines(trip_updates=url)
+        database.init_trip_updates_db()
+        fetched = database.db_datetime(datetime.combine(day, datetime.min.time()) + timedelta(hours=8))
+        database.store_trip_update_rows([(fetched, "T1", "A", 1, delay, 0, fetched)])
+
+    target = f"sqlite:///{tmp_path / 'trip_updates.db'}"
+    store(target, date(2025, 3, 2), 0)
+    store(target, date(2025, 3, 4), 0)
+    assert analytics.update_rollups() == 2
+    shard_path = str(tmp_path / "shard.db")
+    store(f"sqlite:///{shard_path}", DAYS[0], 60)
+    database.get_engine("trip_updates").dispose()
+    database.configure_engines(trip_updates=target)
+    backfill.merged_shards("trip_updates")
+
+    backfill.merge_shard("trip_updates", DAYS[0], shard_path, "fingerprint")
+
+    with database.get_engine("trip_updates").connect() as conn:
+        delays = conn.exec_driver_sql("SELECT delay FROM trip_updates_replayed ORDER BY fetched_at").scalars().all()
+    assert delays == [0, 60, 0]
+    # The merged day lies behind the high-water mark and is rolled up on merge.
+    with database.get_engine("analytics").connect() as conn:
+        assert conn.exec_driver_sql("SELECT SUM(observations) FROM delay_rollup").scalar() == 3
+    with pytest.raises(ValueError):
+        backfill.merge_shard("trip_updates", DAYS[0], shard_path, "fingerprint")
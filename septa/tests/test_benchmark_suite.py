@@ -0,0 +1,44 @@
+import sqlite3
+
+from septa.benchmarks import suite
+from septa.benchmarks.synthetic import gtfs_zip
+from septa.core import database, gtfs
+
+
+def test_suite_covers_every_benchmark(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "_engines", {})
+    monkeypatch.setattr(database, "DATABASE_URLS", dict(database.DATABASE_URLS))
+    monkeypatch.setitem(suite.SCALES, "tiny", {
+        "trains": 5, "trips": 4, "stops_per_trip": 3, "gtfs_trips_per_route": 2, "history": 500,
+    })
+
+    document = suite.run(scales=("tiny",), repeat=2, workdir=str(tmp_path))
+
+    cases = {(result["benchmark"], result["history_rows"]) for result in document["results"]}
+    assert cases == {
+        ("store_train_view", 0), ("store_trip_updates", 0), ("store_trip_update_rows", 0),
+        ("store_train_view", 500), ("store_trip_updates", 500), ("store_trip_update_rows", 500),
+        ("update_database", 0), ("get_realtime_queries", 0),
+    }
+    assert all(result["median_s"] > 0 for result in document["results"])
+
+    slower = {"results": [dict(result, median_s=result["median_s"] * 2) for result in document["results"]]}
+    assert all(row[-1] for row in suite.compare(document, slower))
+    assert not any(row[-1] for row in suite.compare(document, document))
+
+
+def test_synthetic_gtfs_zip_loads(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "_engines", {})
+    monkeypatch.setattr(database, "DATABASE_URLS", dict(database.DATABASE_URLS))
+    zip_path = gtfs_zip(str(tmp_path / "gtfs_public.zip"), routes=2, trips_per_route=3, stops_per_trip=4)
+    db_path = str(tmp_path / "septa.sqlite")
+
+    _, changed = gtfs.load_gtfs_zip(zip_path, {}, db_path, member="google_rail.zip")
+    database.configure_engines(gtfs=f"sqlite:///{db_path}")
+    assert gtfs.get_realtime_queries(suite.GTFS_SERVICE_DATE)
+
+    conn = sqlite3.connect(db_path)
+    stop_times = conn.execute("SELECT COUNT(*) FROM stop_times").fetchone()[0]
+    conn.close()
+    assert "calendar_dates" in changed and "trips" in changed
+    assert stop_times == 2 * 3 * 4
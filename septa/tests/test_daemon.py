@@ -0,0 +1,37 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+
+from septa import daemon
+from septa.daemon import poll_interval, run_feed
+
+SCHEDULE = {"default": 60, "windows": [(6, 10, 30), (1, 5, 600)]}
+
+
+def test_poll_interval_follows_windows():
+    assert poll_interval(SCHEDULE, datetime(2025, 3, 3, 7, 30)) == 30
+    assert poll_interval(SCHEDULE, datetime(2025, 3, 3, 3, 0)) == 600
+    assert poll_interval(SCHEDULE, datetime(2025, 3, 3, 12, 0)) == 60
+
+
+def test_run_feed_never_overlaps_and_stops(monkeypatch):
+    monkeypatch.setattr(daemon, "write_metrics", lambda job: None)
+    running = threading.Lock()
+    runs = []
+
+    def job():
+        assert running.acquire(blocking=False), "runs overlapped"
+        time.sleep(0.01)
+        runs.append(1)
+        running.release()
+
+    async def scenario():
+        stop = asyncio.Event()
+        task = asyncio.create_task(run_feed("test", job, {"default": 0, "windows": []}, stop))
+        await asyncio.sleep(0.1)
+        stop.set()
+        await asyncio.wait_for(task, timeout=1)
+
+    asyncio.run(scenario())
+    assert len(runs) > 1
@@ -0,0 +1,78 @@
+import pytest
+
+from septa.core import fetcher, metrics
+from septa.core.gtfs_rt import feed_header_timestamp
+from septa.benchmarks.synthetic import trip_updates_feed
+
+
+class FakeResponse:
+    def __init__(self, content, status_code=200, headers=None):
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.sent_headers = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.sent_headers.append(headers)
+        return self.responses.pop(0)
+
+
+@pytest.fixture(autouse=True)
+def fetch_state(monkeypatch, tmp_path):
+    monkeypatch.setattr(fetcher, "FETCH_STATE_PATH", str(tmp_path / "fetch_state.json"))
+    monkeypatch.setattr(fetcher, "_feed_state", None)
+    monkeypatch.setattr(fetcher, "_pending", {})
+    metrics.reset()
+
+
+def _skips():
+    return {
+        counter["labels"]["reason"]: counter["value"]
+        for counter in metrics.summary()["counters"] if counter["counter"] == "fetch_skipped"
+    }
+
+
+def test_unchanged_payload_is_skipped_only_after_it_was_stored():
+    session = FakeSession(*(FakeResponse(b"[1]") for _ in range(3)))
+
+    assert fetcher.fetch_if_changed("train_view", "url", session) == b"[1]"
+    # Not marked stored (e.g. the write failed), so the same payload comes back.
+    assert fetcher.fetch_if_changed("train_view", "url", session) == b"[1]"
+    fetcher.mark_stored("train_view")
+    assert fetcher.fetch_if_changed("train_view", "url", session) is None
+    assert _skips() == {"same_payload": 1}
+
+
+def test_conditional_request_and_state_survive_restart(monkeypatch):
+    session = FakeSession(
+        FakeResponse(b"[1]", headers={"ETag": '"v1"'}),
+        FakeResponse(b"", status_code=304),
+    )
+    fetcher.fetch_if_changed("train_view", "url", session)
+    fetcher.mark_stored("train_view")
+    monkeypatch.setattr(fetcher, "_feed_state", None)
+
+    assert fetcher.fetch_if_changed("train_view", "url", session) is None
+    assert session.sent_headers == [{}, {"If-None-Match": '"v1"'}]
+    assert _skips() == {"not_modified": 1}
+
+
+def test_same_feed_header_timestamp_is_skipped():
+    first = trip_updates_feed(3, 2, seed=1)
+    second = trip_updates_feed(3, 2, seed=2)
+    second.header.timestamp = first.header.timestamp
+    session = FakeSession(FakeResponse(first.SerializeToString()), FakeResponse(second.SerializeToString()))
+
+    assert fetcher.fetch_if_changed("trip_updates", "url", session, version=feed_header_timestamp)
+    fetcher.mark_stored("trip_updates")
+    assert fetcher.fetch_if_changed("trip_updates", "url", session, version=feed_header_timestamp) is None
+    assert feed_header_timestamp(first.SerializeToString()) == first.header.timestamp
+    assert _skips() == {"same_version": 1}
@@ -0,0 +1,132 @@
+import io
+import os
+import sqlite3
+import zipfile
+from datetime import date
+
+import pytest
+
+from septa.core import gtfs
+
+GTFS_FILES = {
+    "trips.txt": "route_id,service_id,trip_id,trip_headsign,block_id,direction_id\n"
+                 "PAO,M1,PAO_1001,Thorndale,1001,0\n"
+                 "PAO,S1,PAO_1002,Thorndale,1002,1\n",
+    "calendar.txt": "service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date\n"
+                    "M1,1,1,1,1,1,0,0,20250101,20251231\n"
+                    "S1,0,0,0,0,0,1,1,20250101,20251231\n",
+    "stop_times.txt": "trip_id,arrival_time,departure_time,stop_id,stop_sequence\n"
+                      "PAO_1001,08:00:00,08:00:00,90004,1\n"
+                      "PAO_1001,25:10:00,25:10:00,90005,2\n",
+    "feed_info.txt": "feed_publisher_name,feed_version\n",
+}
+
+
+def _write_feed(directory):
+    for name, content in GTFS_FILES.items():
+        (directory / name).write_text(content)
+
+
+def test_update_database_loads_typed_indexed_tables(tmp_path):
+    feed_dir = tmp_path / "feed"
+    feed_dir.mkdir()
+    _write_feed(feed_dir)
+    db_path = str(tmp_path / "septa.sqlite")
+
+    gtfs.update_database(str(feed_dir), db_path)
+
+    conn = sqlite3.connect(db_path)
+    columns = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(stop_times)")}
+    indexes = {row[1] for row in conn.execute("PRAGMA index_list(stop_times)")}
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    block = conn.execute("SELECT block_id, typeof(block_id) FROM trips WHERE service_id = 'M1'").fetchone()
+    conn.close()
+
+    assert columns["stop_sequence"] == "INTEGER" and columns["stop_id"] == "TEXT"
+    assert "ix_stop_times_trip_id_stop_sequence" in indexes
+    assert tables == {"trips", "calendar", "stop_times", "active_service", "active_blocks"}
+    assert block == ("1001", "text")
+
+
+def test_failed_load_keeps_previous_database(tmp_path):
+    db_path = str(tmp_path / "septa.sqlite")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE trips (trip_id TEXT)")
+    conn.commit()
+    conn.close()
+
+    def broken():
+        raise OSError("truncated download")
+
+    with pytest.raises(OSError):
+        gtfs.load_gtfs({"trips": broken}, db_path)
+
+    conn = sqlite3.connect(db_path)
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+    conn.close()
+    assert tables == ["trips"]
+    assert not (tmp_path / "septa.sqlite.loading").exists()
+
+
+def _write_public_zip(path, files):
+    rail = io.BytesIO()
+    with zipfile.ZipFile(rail, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("google_rail.zip", rail.getvalue())
+        archive.writestr("google_bus.zip", b"")
+
+
+def test_load_gtfs_zip_reloads_only_changed_tables(tmp_path):
+    zip_path = str(tmp_path / "gtfs_public.zip")
+    db_path = str(tmp_path / "septa.sqlite")
+    _write_public_zip(zip_path, GTFS_FILES)
+
+    hashes, changed = gtfs.load_gtfs_zip(zip_path, {}, db_path, member="google_rail.zip")
+    assert changed == ["calendar", "feed_info", "stop_times", "trips"]
+
+    mtime = os.stat(db_path).st_mtime_ns
+    assert gtfs.load_gtfs_zip(zip_path, hashes, db_path, member="google_rail.zip") == (hashes, [])
+    assert os.stat(db_path).st_mtime_ns == mtime
+
+    files = dict(GTFS_FILES, **{"trips.txt": GTFS_FILES["trips.txt"] + "PAO,M1,PAO_1003,Paoli,1003,0\n"})
+    _write_public_zip(zip_path, files)
+    _, changed = gtfs.load_gtfs_zip(zip_path, hashes, db_path, member="google_rail.zip")
+
+    conn = sqlite3.connect(db_path)
+    trips = conn.execute("SELECT COUNT(*) FROM trips").fetchone()[0]
+    stop_times = conn.execute("SELECT COUNT(*) FROM stop_times").fetchone()[0]
+    conn.close()
+    assert changed == ["trips"]
+    assert (trips, stop_times) == (3, 2)
+
+
+def test_active_blocks_apply_calendar_dates(tmp_path, monkeypatch):
+    feed_dir = tmp_path / "feed"
+    feed_dir.mkdir()
+    _write_feed(feed_dir)
+    # Memorial Day: weekday service replaced by the Sunday one.
+    (feed_dir / "calendar_dates.txt").write_text(
+        "service_id,date,exception_type\nM1,20250526,2\nS1,20250526,1\n"
+    )
+    db_path = str(tmp_path / "septa.sqlite")
+    gtfs.update_database(str(feed_dir), db_path)
+    monkeypatch.setattr(gtfs, "get_db_connection", lambda: sqlite3.connect(db_path))
+
+    assert gtfs.get_realtime_queries(date(2025, 5, 19)) == ["1001"]
+    assert gtfs.get_realtime_queries(date(2025, 5, 26)) == ["1002"]
+    assert gtfs.get_realtime_queries(date(2025, 5, 25)) == ["1002"]
+    assert gtfs.get_realtime_queries(date(2026, 1, 5)) == []
+
+    conn = sqlite3.connect(db_path)
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT block_id FROM active_blocks WHERE date = '20250519'"
+    ).fetchall()
+    conn.execute("DROP TABLE active_blocks")
+    conn.commit()
+    conn.close()
+    assert "USING PRIMARY KEY" in plan[0][-1]
+    # Databases loaded before active_blocks existed fall back to the join.
+    assert gtfs.get_realtime_queries(date(2025, 5, 26)) == ["1002"]
+    assert gtfs.get_realtime_queries(date(2025, 5, 19)) == ["1001"]
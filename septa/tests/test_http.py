@@ -0,0 +1,128 @@
+import asyncio
+import gzip
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from septa.core import http, metrics
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        status = 503 if self.path == "/down" else 200
+        self.send_response(status)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_client(monkeypatch):
+    monkeypatch.setattr(http, "_breakers", {})
+    http.close()
+    metrics.reset()
+    yield
+    http.close()
+
+
+def _counters(name):
+    return {
+        tuple(sorted(counter["labels"].items())): counter["value"]
+        for counter in metrics.summary()["counters"] if counter["counter"] == name
+    }
+
+
+def test_shared_session_reuses_connections_and_decodes_gzip(server):
+    for _ in range(3):
+        assert http.get("train_view", f"{server}/feed").json() == {"ok": True}
+
+    assert _counters("http_connections") == {
+        (("feed", "train_view"), ("kind", "new")): 1,
+        (("feed", "train_view"), ("kind", "reused")): 2,
+    }
+    assert "gzip" in http.get_session().headers["Accept-Encoding"]
+
+
+def test_async_session_reports_reuse(server):
+    async def scenario():
+        async with http.async_session("rr_schedules", limit=1) as session:
+            for _ in range(2):
+                response, body = await http.get_async(session, "rr_schedules", f"{server}/feed")
+                assert response.status == 200 and body == b'{"ok": true}'
+
+    asyncio.run(scenario())
+    assert _counters("http_connections") == {
+        (("feed", "rr_schedules"), ("kind", "new")): 1,
+        (("feed", "rr_schedules"), ("kind", "reused")): 1,
+    }
+
+
+def test_breaker_opens_after_failures_and_probes_after_cooldown(server, monkeypatch):
+    monkeypatch.setattr(http, "HTTP_BREAKER_FAILURES", 2)
+    monkeypatch.setattr(http, "HTTP_BREAKER_COOLDOWN", 10)
+    now = [1000.0]
+    monkeypatch.setattr(http.time, "monotonic", lambda: now[0])
+
+    for _ in range(2):
+        assert http.get("trip_updates", f"{server}/down").status_code == 503
+    with pytest.raises(http.CircuitOpen):
+        http.get("trip_updates", f"{server}/feed")
+    assert http.stats()["trip_updates"]["state"] == "open"
+
+    # A failed probe doubles the cooldown; a successful one closes the circuit.
+    now[0] += 10
+    http.get("trip_updates", f"{server}/down")
+    assert http.stats()["trip_updates"] == {"state": "open", "failures": 3, "cooldown": 20}
+    now[0] += 20
+    assert http.get("trip_updates", f"{server}/feed").status_code == 200
+    assert http.stats()["trip_updates"] == {"state": "closed", "failures": 0, "cooldown": 10}
+    assert _counters("http_requests")[(("feed", "trip_updates"), ("status", "short_circuited"))] == 1
+
+
+def test_connection_errors_count_against_the_circuit(monkeypatch):
+    monkeypatch.setattr(http, "HTTP_BREAKER_FAILURES", 1)
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        http.get("gtfs_public", "http://127.0.0.1:9/", timeout=1)
+    with pytest.raises(http.CircuitOpen):
+        http.get("gtfs_public", "http://127.0.0.1:9/")
+
+
+def test_rr_schedule_retries_count_once_against_the_circuit(server, monkeypatch):
+    from septa import rrschedules
+
+    monkeypatch.setattr(http, "HTTP_BREAKER_FAILURES", 2)
+    monkeypatch.setattr(rrschedules, "API_URLS", {"rr_schedules": f"{server}/"})
+    monkeypatch.setattr(rrschedules, "RR_SCHEDULES_RETRIES", 3)
+    monkeypatch.setattr(rrschedules, "RR_SCHEDULES_BACKOFF", 0)
+
+    async def scenario():
+        async with http.async_session("rr_schedules") as session:
+            assert await rrschedules.fetch_rr_schedule(session, "down") == {"down": None}
+            assert http.stats()["rr_schedules"]["state"] == "closed"
+            assert await rrschedules.fetch_rr_schedule(session, "feed") == {"feed": {"ok": True}}
+            assert http.stats()["rr_schedules"]["failures"] == 0
+
+    asyncio.run(scenario())
+    assert _counters("http_requests")[(("feed", "rr_schedules"), ("status", "503"))] == 4
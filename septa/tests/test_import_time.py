@@ -0,0 +1,12 @@
+import pytest
+
+from septa.benchmarks.import_time import ENTRY_POINTS, HEAVY_MODULES, IMPORT_BUDGET_US, measure_import
+
+
+@pytest.mark.parametrize("module", ENTRY_POINTS)
+def test_entry_point_startup_stays_light(module):
+    runs = [measure_import(module) for _ in range(3)]
+    total = min(total for _, total in runs)
+
+    assert not [name for timings, _ in runs for name in HEAVY_MODULES if name in timings]
+    assert total < IMPORT_BUDGET_US, f"{module} took {total / 1000:.0f} ms to import"
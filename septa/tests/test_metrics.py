@@ -0,0 +1,95 @@
+import json
+import logging.handlers
+import threading
+
+import pytest
+
+from septa.core import metrics
+from septa.core.logger import CORE_LOGGERS, DailyFileHandler, setup_logging
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_stage_records_latency_rows_bytes_and_failures():
+    with metrics.stage("store_train_view", step="commit") as timing:
+        timing.rows = 250
+        timing.bytes = 4096
+    with pytest.raises(ValueError):
+        with metrics.stage("store_train_view", step="commit"):
+            raise ValueError("locked")
+    metrics.increment("fetch_skipped", feed="train_view")
+
+    summary = metrics.summary()
+    [stage] = summary["stages"]
+    assert stage["stage"] == "store_train_view" and stage["labels"] == {"step": "commit"}
+    assert (stage["runs"], stage["failures"], stage["rows"], stage["bytes"]) == (2, 1, 250, 4096)
+    assert stage["max_seconds"] <= stage["seconds"]
+    assert summary["counters"] == [{"counter": "fetch_skipped", "labels": {"feed": "train_view"}, "value": 1}]
+
+
+def test_write_metrics_exports_prometheus_and_json(tmp_path):
+    with metrics.stage("fetch_data", url='https://example.com/"q"') as timing:
+        timing.bytes = 10
+
+    metrics.write_metrics("daemon", str(tmp_path))
+
+    text = (tmp_path / "daemon.prom").read_text()
+    assert "# TYPE septa_stage_runs_total counter" in text
+    assert 'septa_stage_bytes_total{stage="fetch_data",url="https://example.com/\\"q\\""} 10' in text
+    document = json.loads((tmp_path / "daemon.json").read_text())
+    assert document["job"] == "daemon" and document["stages"][0]["bytes"] == 10
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["daemon.json", "daemon.prom"]
+
+
+def test_concurrent_writes_leave_whole_files(tmp_path):
+    metrics.increment("polls", feed="train_view")
+    threads = [
+        threading.Thread(target=lambda: [metrics.write_metrics("daemon", str(tmp_path)) for _ in range(20)])
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert json.loads((tmp_path / "daemon.json").read_text())["job"] == "daemon"
+    assert (tmp_path / "daemon.prom").read_text().endswith('septa_polls_total{feed="train_view"} 1\n')
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["daemon.json", "daemon.prom"]
+
+
+def test_setup_logging_only_enqueues(tmp_path, monkeypatch):
+    # Log files go to ../logs relative to the working directory.
+    (tmp_path / "work").mkdir()
+    monkeypatch.chdir(tmp_path / "work")
+    # pytest's capture handler on the root logger would make setup_logging skip.
+    monkeypatch.setattr(logging.getLogger(), "handlers", [])
+    for name in CORE_LOGGERS:
+        monkeypatch.setattr(logging.getLogger(name), "handlers", [])
+        monkeypatch.setattr(logging.getLogger(name), "level", logging.getLogger(name).level)
+    core = logging.getLogger("database")
+
+    logger = setup_logging("metrics_test")
+
+    assert [type(handler) for handler in logger.handlers] == [logging.handlers.QueueHandler]
+    # Core modules such as the store functions log through the same queue.
+    assert core.handlers == logger.handlers and core.level == logging.INFO
+
+
+def test_daily_file_handler_moves_to_the_new_day(tmp_path):
+    handler = DailyFileHandler(str(tmp_path), "daemon")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    record = logging.LogRecord("daemon", logging.INFO, __file__, 1, "first", None, None)
+    handler.handle(record)
+    tomorrow = logging.LogRecord("daemon", logging.INFO, __file__, 1, "second", None, None)
+    tomorrow.created += 86400
+    handler.handle(tomorrow)
+    handler.close()
+
+    days = sorted(path.name for path in (tmp_path / "daemon").iterdir())
+    assert len(days) == 2
+    assert [(tmp_path / "daemon" / day / "daemon.log").read_text() for day in days] == ["first\n", "second\n"]
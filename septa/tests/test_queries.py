@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from septa.core import database, queries
+
+NOW = datetime(2025, 3, 3, 9, 0)
+
+
+def _train(trainno, late, line="Paoli/Thorndale"):
+    return {
+        "trainno": trainno, "lat": "39.95", "lon": "-75.16", "service": "LOCAL", "dest": "Paoli",
+        "currentstop": "A", "nextstop": "B", "line": line, "consist": "", "heading": "90", "late": late,
+        "SOURCE": "", "TRACK": "", "TRACK_CHANGE": "",
+    }
+
+
+@pytest.fixture
+def history(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "_engines", {})
+    for name in ("train_view", "trip_updates"):
+        monkeypatch.setitem(database.DATABASE_URLS, name, f"sqlite:///{tmp_path / f'{name}.db'}")
+    database.init_db()
+    database.init_trip_updates_db()
+
+    for minutes, late in ((20, "0"), (10, "3"), (0, "6")):
+        database.store_train_view([_train("1234", late), _train("9", "0", "Airport")], NOW - timedelta(minutes=minutes))
+        fetched = database.db_datetime(NOW - timedelta(minutes=minutes))
+        database.store_trip_update_rows([(fetched, "T1", "S1", 1, int(late) * 60, 0, fetched)])
+
+
+def test_position_queries(history):
+    assert queries.latest_position("1234")["late"] == 6
+    assert [row["late"] for row in queries.trajectory("1234", NOW - timedelta(minutes=15), NOW)] == [3]
+    assert {row["train_id"]: row["late"] for row in queries.latest_snapshot(now=NOW)} == {"1234": 6, "9": 0}
+    assert [row["train_id"] for row in queries.late_trains("Paoli/Thorndale", min_late=5, now=NOW)] == ["1234"]
+
+
+def test_delay_history(history):
+    assert [row["delay"] for row in queries.delay_history("T1", "S1")] == [0, 180, 360]
+    assert len(queries.delay_history(stop_id="S1", start=NOW - timedelta(minutes=5))) == 1
+    with pytest.raises(ValueError):
+        queries.delay_history()
+
+
+@pytest.mark.parametrize("database_name, sql, index", [
+    ("train_view", queries.LATEST_POSITION_SQL, "ix_train_view_train_id_timestamp"),
+    ("train_view", queries.LATEST_SNAPSHOT_SQL, "ix_train_view_timestamp"),
+    ("train_view", queries.TRAJECTORY_SQL, "ix_train_view_train_id_timestamp"),
+    ("trip_updates", queries.TRIP_STOP_DELAY_HISTORY_SQL, "ix_trip_updates_trip_stop_fetched_at"),
+    ("trip_updates", queries.TRIP_DELAY_HISTORY_SQL, "ix_trip_updates_trip_stop_fetched_at"),
+    ("trip_updates", queries.STOP_DELAY_HISTORY_SQL, "ix_trip_updates_stop_fetched_at"),
+])
+def test_queries_use_indexes(history, database_name, sql, index):
+    params = {"train_id": "1", "trip_id": "T", "stop_id": "S", "since": "", "start": "", "end": ""}
+    with database.get_engine(database_name).connect() as conn:
+        explain = text(f"EXPLAIN QUERY PLAN {sql.format(source=database_name, time='timestamp')}")
+        plan = " ".join(row[3] for row in conn.execute(explain, params))
+    assert index in plan
@@ -0,0 +1,56 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from septa import replay
+from septa.benchmarks.synthetic import train_view_snapshot, trip_updates_feed
+from septa.core import database, recorder
+
+FETCHED = datetime(2025, 3, 3, 23, 58, 0, 123456)
+
+
+def test_segments_rotate_and_drop_truncated_tail(monkeypatch, tmp_path):
+    monkeypatch.setattr(recorder, "_segments", {})
+    monkeypatch.setattr(recorder, "RECORD_SEGMENT_BYTES", 200)
+    payloads = [os.urandom(150) for _ in range(3)] + [b"next day"]
+    times = [FETCHED, FETCHED + timedelta(seconds=30), FETCHED + timedelta(seconds=60), FETCHED + timedelta(minutes=3)]
+    for fetched_at, payload in zip(times, payloads):
+        recorder.record("train_view", payload, fetched_at, str(tmp_path))
+
+    paths = recorder.segments("train_view", str(tmp_path))
+    assert len(paths) == 4  # each random payload fills a segment; the last starts a new day
+    assert list(recorder.read_records("train_view", record_dir=str(tmp_path))) == list(zip(times, payloads))
+
+    with open(paths[-1], "ab") as f:
+        f.write(b"\x1f\x8b\x08\x00partial")
+    assert [payload for _, payload in recorder.read_segment(paths[-1])] == [b"next day"]
+
+
+def test_replay_rebuilds_history(monkeypatch, tmp_path):
+    monkeypatch.setattr(recorder, "_segments", {})
+    monkeypatch.setattr(database, "_engines", {})
+    monkeypatch.setattr(database, "DATABASE_URLS", dict(database.DATABASE_URLS))
+    record_dir = str(tmp_path / "recordings")
+    for tick in range(3):
+        fetched_at = FETCHED + timedelta(minutes=tick)
+        recorder.record("train_view", json.dumps(train_view_snapshot(5, seed=tick)).encode(), fetched_at, record_dir)
+        feed = trip_updates_feed(3, 4, timestamp=fetched_at)
+        recorder.record("trip_updates", feed.SerializeToString(), fetched_at, record_dir)
+
+    replay.main([
+        "--record-dir", record_dir,
+        "--train-view-url", f"sqlite:///{tmp_path / 'train_view.db'}",
+        "--trip-updates-url", f"sqlite:///{tmp_path / 'trip_updates.db'}",
+        "--start", (FETCHED + timedelta(minutes=1)).isoformat(),
+    ])
+
+    with database.get_engine("train_view").connect() as conn:
+        snapshots = conn.execute(text("SELECT timestamp, COUNT(*) FROM train_view GROUP BY timestamp")).fetchall()
+    with database.get_engine("trip_updates").connect() as conn:
+        polls = conn.execute(text("SELECT COUNT(DISTINCT fetched_at), COUNT(*) FROM trip_updates")).fetchone()
+    assert snapshots == [
+        (database.db_datetime(FETCHED + timedelta(minutes=tick)), 5) for tick in (1, 2)
+    ]
+    assert tuple(polls) == (2, 2 * 3 * 4)
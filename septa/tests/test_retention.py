@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from septa import retention
+from septa.core import database
+
+NOW = datetime(2025, 3, 31, 12, 0)
+
+
+def _train(late):
+    return {
+        "trainno": "1001", "lat": "39.95", "lon": "-75.16", "service": "LOCAL", "dest": "Paoli",
+        "currentstop": "A", "nextstop": "B", "line": "Paoli/Thorndale", "consist": "", "heading": "90",
+        "late": str(late), "SOURCE": "", "TRACK": "", "TRACK_CHANGE": "",
+    }
+
+
+def _hour(days_ago):
+    start = (NOW - timedelta(days=days_ago)).replace(minute=0)
+    return [start + timedelta(minutes=minute) for minute in range(60)]
+
+
+@pytest.fixture
+def history(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "_engines", {})
+    monkeypatch.setattr(retention, "RETENTION_BATCH_ROWS", 7)
+    monkeypatch.setattr(retention, "RETENTION_BATCH_PAUSE", 0)
+    for name in ("train_view", "trip_updates", "analytics"):
+        monkeypatch.setitem(database.DATABASE_URLS, name, f"sqlite:///{tmp_path / f'{name}.db'}")
+    retention.init_retention()
+
+    for days_ago in (40, 10, 1):
+        for minute, moment in enumerate(_hour(days_ago)):
+            database.store_train_view([_train(minute % 5)], moment)
+            fetched = database.db_datetime(moment)
+            database.store_trip_update_rows([(fetched, "T1", "S1", 1, 60, 0, fetched)])
+
+
+def _count(name, sql):
+    with database.get_engine(name).connect() as conn:
+        return conn.exec_driver_sql(sql).scalar()
+
+
+def test_tiers_summarise_thin_and_expire(history):
+    tiers = ((7, 600), (30, None))
+    assert retention.apply_retention("train_view", tiers, NOW) == 60 + 54
+    assert retention.apply_retention("trip_updates", tiers, NOW) == 60 + 54
+
+    for name, table in (("train_view", "train_view"), ("trip_updates", "trip_updates")):
+        assert _count(name, f"SELECT COUNT(*) FROM {table}") == 6 + 60
+    thinned = database.db_datetime(_hour(10)[0])
+    with database.get_engine("train_view").connect() as conn:
+        minutes = [row[0][14:16] for row in conn.exec_driver_sql(
+            f"SELECT timestamp FROM train_view WHERE timestamp < '{database.db_datetime(_hour(1)[0])}' ORDER BY 1"
+        )]
+        hourly = conn.exec_driver_sql("SELECT hour, samples, late_sum, late_max FROM train_view_hourly ORDER BY hour").fetchall()
+    assert minutes == ["00", "10", "20", "30", "40", "50"]
+    assert [row[1:] for row in hourly] == [(60, 120, 4), (60, 120, 4)]
+    assert hourly[1][0] == thinned[:13] + ":00:00"
+    assert _count("analytics", "SELECT SUM(observations) FROM delay_rollup") == 180
+
+    assert retention.apply_retention("train_view", tiers, NOW) == 0
+    assert retention.apply_retention("trip_updates", tiers, NOW) == 0
+
+
+def test_delta_mode_keeps_intervals_until_rolled_up(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "_engines", {})
+    monkeypatch.setattr(database, "_open_intervals", {})
+    monkeypatch.setattr(database, "TRIP_UPDATES_STORAGE_MODE", "delta")
+    monkeypatch.setattr(retention, "RETENTION_BATCH_PAUSE", 0)
+    for name in ("train_view", "trip_updates", "analytics"):
+        monkeypatch.setitem(database.DATABASE_URLS, name, f"sqlite:///{tmp_path / f'{name}.db'}")
+    retention.init_retention()
+    moments = _hour(40) + _hour(1)
+    for minute, moment in enumerate(moments):
+        fetched = database.db_datetime(moment)
+        database.store_trip_update_rows([(fetched, "T1", "S1", 1, 60 * (minute % 2), 0, fetched)])
+    tiers = ((30, None),)
+
+    # A rollup that stopped at the 30th poll: nothing newer may go.
+    rollup_high_water = retention._rollup_high_water
+    monkeypatch.setattr(retention, "_rollup_high_water", lambda: moments[29])
+    assert retention.apply_retention("trip_updates", tiers, NOW) == 29 + 30
+    assert _count("trip_updates", "SELECT COUNT(*) FROM trip_updates_replayed") == 90
+
+    monkeypatch.setattr(retention, "_rollup_high_water", rollup_high_water)
+    assert retention.apply_retention("trip_updates", tiers, NOW) == 30 + 30
+    assert _count("trip_updates", "SELECT COUNT(*) FROM trip_updates_replayed") == 60
+    assert _count("analytics", "SELECT SUM(observations) FROM delay_rollup") == 90
+
+
+def test_incremental_vacuum_returns_free_pages(history):
+    retention.apply_retention("train_view", ((0, None),), NOW + timedelta(days=1))
+
+    assert _count("train_view", "PRAGMA auto_vacuum") == 2
+    assert _count("train_view", "PRAGMA freelist_count") > 0
+    assert retention.vacuum("train_view", seconds=5, pages=1) > 0
+    assert _count("train_view", "PRAGMA freelist_count") == 0
+
+
+def test_tiers_are_ordered_by_age_only(history):
+    # Equal ages must not compare a None interval with a number.
+    assert retention.apply_retention("train_view", ((30, None), (7, None), (7, 600)), NOW) == 120
+    assert _count("train_view", "SELECT COUNT(*) FROM train_view") == 60
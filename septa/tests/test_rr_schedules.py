@@ -0,0 +1,92 @@
+from datetime import date, datetime
+
+import pytest
+import requests
+
+from septa import rrschedules
+from septa.core import database, queries
+
+FETCHED = datetime(2025, 3, 3, 6, 0)
+
+
+def _stops(*times):
+    return [
+        {"station": station, "sched_tm": sched, "est_tm": est, "act_tm": "na"}
+        for station, sched, est in times
+    ]
+
+
+@pytest.fixture
+def schedules_db(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "_engines", {})
+    monkeypatch.setitem(database.DATABASE_URLS, "rr_schedules", f"sqlite:///{tmp_path / 'rr_schedules.db'}")
+    database.init_rr_schedules_db()
+
+
+def test_schedule_rows_flatten_response():
+    rows = rrschedules.schedule_rows("1001", _stops(("Paoli", "8:00 am", "na")), date(2025, 3, 3), FETCHED)
+
+    assert rows == [("2025-03-03", "1001", "Paoli", 0, "8:00 am", None, None, database.db_datetime(FETCHED))]
+    assert rrschedules.schedule_rows("1001", None, date(2025, 3, 3), FETCHED) == []
+    assert rrschedules.schedule_rows("1001", {"error": "No data"}, date(2025, 3, 3), FETCHED) == []
+
+
+def test_changes_since_previous_day(schedules_db):
+    monday, tuesday = date(2025, 3, 3), date(2025, 3, 4)
+    rows = (
+        rrschedules.schedule_rows("1001", _stops(
+            ("Paoli", "8:00 am", "8:00 am"), ("Bryn Mawr", "8:10 am", "8:12 am"), ("Ardmore", "8:15 am", "8:15 am"),
+        ), monday, FETCHED)
+        + rrschedules.schedule_rows("1001", _stops(
+            ("Paoli", "8:00 am", "8:00 am"), ("Bryn Mawr", "8:10 am", "8:10 am"), ("Overbrook", "8:25 am", "8:25 am"),
+        ), tuesday, FETCHED)
+    )
+    assert database.store_rr_schedule_rows(rows) is True
+
+    changes = {row["station"]: row for row in queries.rr_schedule_changes(tuesday)}
+
+    assert set(changes) == {"Bryn Mawr", "Ardmore", "Overbrook"}
+    assert (changes["Bryn Mawr"]["change"], changes["Bryn Mawr"]["previous_est_tm"], changes["Bryn Mawr"]["est_tm"]) == (
+        "changed", "8:12 am", "8:10 am"
+    )
+    assert changes["Ardmore"]["change"] == "removed"
+    assert changes["Overbrook"]["change"] == "added"
+    assert queries.rr_schedule_changes("2025-03-04", monday) == queries.rr_schedule_changes(tuesday)
+
+
+def test_rerun_replaces_same_day_rows(schedules_db):
+    monday = date(2025, 3, 3)
+    database.store_rr_schedule_rows(rrschedules.schedule_rows("1001", _stops(("Paoli", "8:00 am", "8:05 am")), monday, FETCHED))
+    database.store_rr_schedule_rows(rrschedules.schedule_rows("1001", _stops(("Paoli", "8:00 am", "8:09 am")), monday, FETCHED))
+
+    with database.get_engine("rr_schedules").connect() as conn:
+        assert conn.exec_driver_sql("SELECT est_tm FROM rr_schedule_stops").fetchall() == [("8:09 am",)]
+
+
+def test_interrupted_gtfs_download_leaves_no_zip(monkeypatch, tmp_path):
+    class Response:
+        status_code = 200
+        headers = {}
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def raise_for_status(self):
+            pass
+
+        def iter_content(self, chunk_size):
+            yield b"PK partial"
+            raise requests.exceptions.ChunkedEncodingError("connection dropped")
+
+    zip_path = tmp_path / "septa_gtfs.zip"
+    monkeypatch.setattr(rrschedules, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(rrschedules, "GTFS_ZIP_PATH", str(zip_path))
+    monkeypatch.setattr(rrschedules, "GTFS_DB_PATH", str(tmp_path / "septa.sqlite"))
+    monkeypatch.setattr(rrschedules.http, "get", lambda *args, **kwargs: Response())
+    monkeypatch.setattr(rrschedules, "load_gtfs_zip", lambda *args, **kwargs: pytest.fail("loaded a partial zip"))
+
+    assert rrschedules.refresh_gtfs() is False
+    assert list(tmp_path.iterdir()) == []
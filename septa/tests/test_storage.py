@@ -0,0 +1,47 @@
+import os
+import sqlite3
+
+from sqlalchemy import text
+
+from config import SQLITE_PRAGMAS
+from septa.core.storage import create_sqlite_engine
+
+
+def test_connections_get_profile_pragmas(tmp_path):
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'a.db'}", SQLITE_PRAGMAS)
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == SQLITE_PRAGMAS["busy_timeout"]
+
+
+def test_reader_does_not_block_writer(tmp_path):
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'a.db'}", dict(SQLITE_PRAGMAS, busy_timeout=0))
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (x INTEGER)"))
+        conn.execute(text("INSERT INTO t VALUES (1)"))
+
+    with engine.connect() as reader:
+        reader.exec_driver_sql("BEGIN")
+        assert reader.execute(text("SELECT COUNT(*) FROM t")).scalar() == 1
+        with engine.begin() as writer:
+            writer.execute(text("INSERT INTO t VALUES (2)"))
+        assert reader.execute(text("SELECT COUNT(*) FROM t")).scalar() == 1
+
+
+def test_pool_reconnects_after_file_swap(tmp_path):
+    path = tmp_path / "septa.sqlite"
+    for target, version in ((path, 1), (tmp_path / "new.sqlite", 2)):
+        conn = sqlite3.connect(target)
+        conn.execute("CREATE TABLE feed_info (version INTEGER)")
+        conn.execute(f"INSERT INTO feed_info VALUES ({version})")
+        conn.commit()
+        conn.close()
+
+    engine = create_sqlite_engine(f"sqlite:///{path}", dict(SQLITE_PRAGMAS, journal_mode="DELETE"))
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT version FROM feed_info")).scalar() == 1
+
+    os.replace(tmp_path / "new.sqlite", path)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT version FROM feed_info")).scalar() == 2
@@ -0,0 +1,56 @@
+from datetime import datetime
+
+from sqlalchemy import text
+
+from septa.core import database
+
+
+def _train(trainno, late="0", lat="39.95"):
+    return {
+        "trainno": trainno, "lat": lat, "lon": "-75.16", "service": "LOCAL", "dest": "Paoli",
+        "currentstop": "Suburban Station", "nextstop": "30th Street Station", "line": "Paoli/Thorndale",
+        "consist": "123,124", "heading": "270", "late": late, "SOURCE": "Thorndale",
+        "TRACK": "1", "TRACK_CHANGE": "",
+    }
+
+
+def _use_temp_database(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "_engines", {})
+    monkeypatch.setitem(database.DATABASE_URLS, "train_view", f"sqlite:///{tmp_path / 'train_view.db'}")
+    return database.get_engine("train_view")
+
+
+def test_store_train_view_upserts_snapshot(monkeypatch, tmp_path):
+    engine = _use_temp_database(monkeypatch, tmp_path)
+    database.init_db()
+    timestamp = datetime(2025, 3, 3, 8, 0)
+
+    database.store_train_view([_train("1234"), _train("5678")], timestamp)
+    database.store_train_view([_train("1234", late="4")], timestamp)
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT train_id, late FROM train_view ORDER BY train_id")).fetchall()
+    assert rows == [("1234", 4), ("5678", 0)]
+
+
+def test_init_db_deduplicates_before_unique_index(monkeypatch, tmp_path):
+    engine = _use_temp_database(monkeypatch, tmp_path)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE train_view (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp DATETIME NOT NULL, "
+            "train_id VARCHAR NOT NULL, lat FLOAT, lon FLOAT, service VARCHAR, destination VARCHAR, "
+            "current_stop VARCHAR, next_stop VARCHAR, line VARCHAR, consist VARCHAR, heading FLOAT, "
+            "late INTEGER, source VARCHAR, track VARCHAR, track_change VARCHAR)"
+        ))
+        for late in (1, 2):
+            conn.execute(text(
+                "INSERT INTO train_view (timestamp, train_id, late) VALUES ('2025-03-03 08:00:00.000000', '1234', :late)"
+            ), {"late": late})
+
+    database.init_db()
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT train_id, late FROM train_view")).fetchall()
+        indexes = conn.execute(text("PRAGMA index_list(train_view)")).fetchall()
+    assert rows == [("1234", 2)]
+    assert any(index[1] == "ix_train_view_train_id_timestamp" and index[2] for index in indexes)
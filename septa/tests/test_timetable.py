@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+
+from septa.core import gtfs
+from septa.core.timetable import Timetable, get_timetable, timetable_dir
+
+STOP_TIMES = (
+    "trip_id,arrival_time,departure_time,stop_id,stop_sequence\n"
+    "PAO_1002,09:00:00,09:01:00,90004,1\n"
+    "PAO_1001,25:10:00,25:11:00,90005,20\n"
+    "PAO_1001,08:00:00,08:00:30,90004,3\n"
+    "PAO_1002,,,90005,2\n"
+)
+
+
+def _load(tmp_path, stop_times=STOP_TIMES):
+    feed_dir = tmp_path / "feed"
+    feed_dir.mkdir(exist_ok=True)
+    (feed_dir / "stop_times.txt").write_text(stop_times)
+    db_path = str(tmp_path / "septa.sqlite")
+    gtfs.load_gtfs({"stop_times": lambda: open(feed_dir / "stop_times.txt", "rb")}, db_path)
+    return timetable_dir(db_path)
+
+
+def test_load_gtfs_publishes_sorted_memory_mapped_timetable(tmp_path):
+    timetable = Timetable.open(_load(tmp_path))
+
+    assert isinstance(timetable.arrival, np.memmap)
+    assert timetable.trip_stops("PAO_1001") == [
+        ("90004", 3, 8 * 3600, 8 * 3600 + 30),
+        ("90005", 20, 25 * 3600 + 600, 25 * 3600 + 660),
+    ]
+    assert timetable.scheduled("PAO_1001", stop_sequence=20) == (25 * 3600 + 600, 25 * 3600 + 660)
+    assert timetable.scheduled("PAO_1002", stop_id="90004") == (9 * 3600, 9 * 3600 + 60)
+    assert timetable.scheduled("PAO_1002", stop_sequence=2) == (-1, -1)
+    assert timetable.scheduled("PAO_1001", stop_sequence=4) is None
+    assert timetable.scheduled("PAO_9999", stop_id="90004") is None
+
+    arrivals = timetable.arrivals(["PAO_1001", "PAO_1002", "PAO_9999", "PAO_1001"], [3, 1, 1, 99])
+    assert arrivals.tolist() == [8 * 3600, 9 * 3600, -1, -1]
+
+
+def test_reload_switches_readers_to_new_build(tmp_path):
+    directory = _load(tmp_path)
+    first = get_timetable(directory)
+
+    _load(tmp_path, STOP_TIMES.replace("09:00:00", "09:05:00"))
+    second = get_timetable(directory)
+
+    assert second is not first
+    assert first.scheduled("PAO_1002", stop_sequence=1)[0] == 9 * 3600
+    assert second.scheduled("PAO_1002", stop_sequence=1)[0] == 9 * 3600 + 300
+    assert len([name for name in os.listdir(directory) if name.startswith("v")]) == 2
@@ -0,0 +1,79 @@
+from datetime import datetime
+
+from sqlalchemy import text
+
+from septa.core import database
+from septa.tests.test_store_train_view import _train, _use_temp_database
+
+
+def test_compact_rows_decode_to_wide_shape(monkeypatch, tmp_path):
+    engine = _use_temp_database(monkeypatch, tmp_path)
+    monkeypatch.setattr(database, "TRAIN_VIEW_STORAGE_MODE", "compact")
+    monkeypatch.setattr(database, "_string_keys", {})
+    database.init_db()
+
+    first = datetime(2025, 3, 3, 8, 0, 0, 250000)
+    database.store_train_view([_train("1234"), _train("5678", lat="39.12345")], first)
+    database.store_train_view([_train("1234", late="4")], datetime(2025, 3, 3, 8, 10))
+    # Restarting with an empty cache reuses the stored dictionary keys.
+    monkeypatch.setattr(database, "_string_keys", {})
+    database.store_train_view([_train("1234", late="5")], datetime(2025, 3, 3, 8, 10))
+
+    with engine.connect() as conn:
+        strings = conn.execute(text("SELECT COUNT(*) FROM train_view_strings")).scalar()
+        wide = conn.execute(text("SELECT COUNT(*) FROM train_view")).scalar()
+        rows = conn.execute(text(
+            "SELECT timestamp, train_id, lat, lon, line, current_stop, track_change, heading, late "
+            "FROM train_view_decoded ORDER BY timestamp, train_id"
+        )).fetchall()
+
+    assert wide == 0
+    assert strings == 9
+    assert rows == [
+        ("2025-03-03 08:00:00.000000", "1234", 39.95, -75.16, "Paoli/Thorndale", "Suburban Station", "", 270.0, 0),
+        ("2025-03-03 08:00:00.000000", "5678", 39.12345, -75.16, "Paoli/Thorndale", "Suburban Station", "", 270.0, 0),
+        ("2025-03-03 08:10:00.000000", "1234", 39.95, -75.16, "Paoli/Thorndale", "Suburban Station", "", 270.0, 5),
+    ]
+
+
+def test_readers_see_compact_mode_rows(monkeypatch, tmp_path):
+    from septa import api, archive
+    from septa.core import queries
+
+    _use_temp_database(monkeypatch, tmp_path)
+    monkeypatch.setattr(database, "TRAIN_VIEW_STORAGE_MODE", "compact")
+    monkeypatch.setattr(database, "_string_keys", {})
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    monkeypatch.setattr(api, "_snapshot", api.Snapshot())
+    database.init_db()
+    for minute, late in ((0, "1"), (10, "4")):
+        database.store_train_view([_train("1234", late=late)], datetime(2025, 3, 3, 8, minute))
+
+    now = datetime(2025, 3, 3, 8, 15)
+    latest = queries.latest_position("1234")
+    assert latest["late"] == 4 and "ts" not in latest
+    assert [row["late"] for row in queries.latest_snapshot(now=now)] == [4]
+    assert [row["late"] for row in queries.trajectory("1234")] == [1, 4]
+
+    api.warm(now=now)
+    assert [point["late"] for point in api.current().history["1234"]] == [1, 4]
+
+    assert archive.compact_day("train_view", now.date()) == 2
+    assert "ts" not in archive.read_archive("train_view", now.date(), now.date()).columns
+
+
+def test_compact_range_reads_use_the_ts_index(monkeypatch, tmp_path):
+    from septa.core import queries
+
+    engine = _use_temp_database(monkeypatch, tmp_path)
+    monkeypatch.setattr(database, "TRAIN_VIEW_STORAGE_MODE", "compact")
+    database.init_db()
+
+    source, time_column, _ = database.train_view_source()
+    params = {"train_id": "1", "since": 0, "start": 0, "end": 0}
+    for sql in (queries.LATEST_SNAPSHOT_SQL, queries.TRAJECTORY_SQL, queries.RECENT_POSITIONS_SQL):
+        with engine.connect() as conn:
+            explain = text(f"EXPLAIN QUERY PLAN {sql.format(source=source, time=time_column)}")
+            plan = " ".join(row[3] for row in conn.execute(explain, params))
+        assert "SCAN c" not in plan
+        assert "ix_train_view_compact_ts" in plan or "PRIMARY KEY" in plan
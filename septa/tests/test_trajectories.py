@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from septa import trajectories
+from septa.trajectories import METERS_PER_DEGREE, GridIndex, RailNetwork, build_trajectories, dwell_events
+
+START = datetime(2025, 3, 3, 13, 0)  # 8am in Philadelphia
+
+
+def _network():
+    # A straight east-west line with a stop every ~850 m and a shape point every ~85 m.
+    stops = pd.DataFrame({
+        "stop_id": ["90001", "90002", "90003"],
+        "stop_lat": [39.95, 39.95, 39.95],
+        "stop_lon": [-75.20, -75.19, -75.18],
+    })
+    lon = np.linspace(-75.20, -75.18, 21)
+    shapes = pd.DataFrame({
+        "shape_id": "PAO", "shape_pt_lat": 39.95, "shape_pt_lon": lon, "shape_pt_sequence": range(1, 22),
+    })
+    return RailNetwork(stops, shapes)
+
+
+def test_grid_index_finds_items_across_cell_borders():
+    x = np.array([0.0, 950.0, 5000.0])
+    index = GridIndex(x, x * 0, x, x * 0, 1000.0)
+
+    queries, items = index.candidates(np.array([1020.0]), np.array([0.0]))
+
+    assert sorted(items[queries == 0]) == [0, 1]
+
+
+def test_trajectory_speed_dwell_and_snapping():
+    # Train 1234 leaves 90001, stops at 90002 for two minutes, then moves on.
+    lons = [-75.20, -75.196, -75.19, -75.19, -75.19, -75.18]
+    positions = pd.DataFrame({
+        "timestamp": [START + timedelta(minutes=minute) for minute in range(6)],
+        "train_id": "1234",
+        "lat": 39.95 + 0.0002,  # ~22 m north of the track
+        "lon": lons,
+    })
+
+    trajectory = build_trajectories(positions, _network())
+
+    assert trajectory["service_day"].unique().tolist() == [START.date()]
+    assert np.isnan(trajectory["speed_mps"][0])
+    assert abs(trajectory["distance_m"][1] - 0.004 * trajectories._LON_SCALE) < 1
+    assert trajectory["stopped"].tolist() == [False, False, False, True, True, False]
+    assert trajectory["dwell_s"].tolist() == [0, 0, 0, 60, 120, 0]
+    assert trajectory["stop_id"].tolist() == ["90001", "90001", "90002", "90002", "90002", "90003"]
+    assert (abs(trajectory["shape_offset"] - 0.0002 * METERS_PER_DEGREE) < 1).all()
+    assert abs(trajectory["shape_dist"][2] - 0.01 * trajectories._LON_SCALE) < 1
+
+    [event] = dwell_events(trajectory).to_dict("records")
+    assert event["stop_id"] == "90002" and event["dwell_s"] == 120
+    assert event["arrival"] == START + timedelta(minutes=2)
+
+
+def test_far_positions_are_not_snapped():
+    snapped = _network().snap(np.array([40.5]), np.array([-75.19]))
+
+    assert snapped["stop_id"].tolist() == [None] and snapped["shape_id"].tolist() == [None]
+    assert np.isnan(snapped["stop_distance"][0])
+
+
+def test_load_positions_reads_compact_storage(monkeypatch, tmp_path):
+    from septa.core import database
+    from septa.tests.test_store_train_view import _train, _use_temp_database
+
+    _use_temp_database(monkeypatch, tmp_path)
+    monkeypatch.setattr(database, "TRAIN_VIEW_STORAGE_MODE", "compact")
+    monkeypatch.setattr(database, "_string_keys", {})
+    database.init_db()
+    for minute in range(3):
+        database.store_train_view([_train("1234")], START + timedelta(minutes=minute))
+
+    positions = trajectories.load_positions(START, START + timedelta(minutes=2))
+    assert list(positions["train_id"]) == ["1234", "1234"]
+    assert positions["timestamp"].iloc[1] == pd.Timestamp(START + timedelta(minutes=1))
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from septa.core import database, queries
+
+POLL = datetime(2025, 3, 3, 8, 0)
+
+
+def _poll(minutes, delays):
+    fetched = database.db_datetime(POLL + timedelta(minutes=minutes))
+    return [(fetched, trip_id, stop_id, 1, delay, 0, fetched) for trip_id, stop_id, delay in delays]
+
+
+@pytest.fixture
+def delta_database(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "_engines", {})
+    monkeypatch.setattr(database, "_open_intervals", {})
+    monkeypatch.setattr(database, "TRIP_UPDATES_STORAGE_MODE", "delta")
+    monkeypatch.setitem(database.DATABASE_URLS, "trip_updates", f"sqlite:///{tmp_path / 'trip_updates.db'}")
+    database.init_trip_updates_db()
+    return database.get_engine("trip_updates")
+
+
+def test_only_changes_are_written_and_snapshots_rebuild(delta_database):
+    polls = [
+        _poll(0, [("T1", "A", 0), ("T1", "B", 0), ("T2", "A", 60)]),
+        _poll(1, [("T1", "A", 0), ("T1", "B", 0), ("T2", "A", 60)]),
+        _poll(2, [("T1", "A", 0), ("T1", "B", 120), ("T2", "A", 60)]),
+        _poll(3, [("T1", "B", 120), ("T2", "A", 60)]),
+    ]
+    for rows in polls:
+        database.store_trip_update_rows(rows)
+
+    with delta_database.connect() as conn:
+        intervals = conn.execute(text("SELECT COUNT(*) FROM trip_update_intervals")).scalar()
+        replayed = conn.execute(text(
+            "SELECT fetched_at, trip_id, stop_id, delay FROM trip_updates_replayed ORDER BY fetched_at, trip_id, stop_id"
+        )).fetchall()
+    assert intervals == 4
+    assert replayed == [(row[0], row[1], row[2], row[4]) for rows in polls for row in sorted(rows)]
+
+    snapshot = queries.trip_updates_at(POLL + timedelta(minutes=2, seconds=30))
+    assert [(row["trip_id"], row["stop_id"], row["delay"]) for row in snapshot] == [
+        ("T1", "A", 0), ("T1", "B", 120), ("T2", "A", 60),
+    ]
+
+
+def test_state_survives_restart(delta_database, monkeypatch):
+    database.store_trip_update_rows(_poll(0, [("T1", "A", 0)]))
+    monkeypatch.setattr(database, "_open_intervals", {})
+    database.store_trip_update_rows(_poll(1, [("T1", "A", 0)]))
+
+    with delta_database.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM trip_update_intervals")).scalar() == 1
+
+
+def test_readers_see_delta_mode_rows(delta_database, monkeypatch, tmp_path):
+    from septa import analytics, archive
+
+    monkeypatch.setitem(database.DATABASE_URLS, "analytics", f"sqlite:///{tmp_path / 'analytics.db'}")
+    monkeypatch.setattr(analytics, "trip_routes", lambda: {"T1": "PAO"})
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    for minutes, delay in ((0, 0), (1, 0), (2, 120)):
+        database.store_trip_update_rows(_poll(minutes, [("T1", "A", delay)]))
+
+    assert [row["delay"] for row in queries.delay_history("T1", "A")] == [0, 0, 120]
+    assert analytics.update_rollups() == 3
+    assert archive._first_day("trip_updates") == POLL.date()
+    assert archive.compact_day("trip_updates", POLL.date(), {"T1": "PAO"}) == 3
+
+
+def test_missing_open_index_keeps_closed_intervals(delta_database):
+    for minutes, delay in ((0, 0), (1, 60), (2, 120)):
+        database.store_trip_update_rows(_poll(minutes, [("T1", "A", delay)]))
+    with delta_database.begin() as conn:
+        conn.execute(text("DROP INDEX ix_trip_update_intervals_open"))
+
+    database.init_trip_updates_db()
+
+    with delta_database.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM trip_update_intervals")).scalar() == 3
+        indexes = {row[1] for row in conn.execute(text("PRAGMA index_list(trip_update_intervals)"))}
+    assert "ix_trip_update_intervals_open" in indexes
+
+
+def test_range_reads_are_bounded_by_an_interval_index(delta_database):
+    for columns, start_op, end_op in ((None, ">=", "<"), (("fetched_at", "delay"), ">", "<=")):
+        sql = database.trip_updates_range_sql(columns, start_op, end_op)
+        with delta_database.connect() as conn:
+            explain = text(f"EXPLAIN QUERY PLAN {sql}")
+            plan = " ".join(row[3] for row in conn.execute(explain, {"start": "", "end": ""}))
+        assert "SCAN i" not in plan
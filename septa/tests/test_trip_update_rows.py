@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from google.protobuf.json_format import MessageToDict
+from sqlalchemy import text
+
+from septa.benchmarks.synthetic import trip_updates_feed
+from septa.core import database
+from septa.core.gtfs_rt import trip_update_rows
+
+
+def test_protobuf_rows_match_dict_path(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "_engines", {})
+    monkeypatch.setitem(database.DATABASE_URLS, "trip_updates", f"sqlite:///{tmp_path / 'trip_updates.db'}")
+    engine = database.get_engine("trip_updates")
+    database.init_trip_updates_db()
+
+    feed = trip_updates_feed(trips=5, stops_per_trip=3)
+    feed.entity[0].trip_update.stop_time_update[0].ClearField("arrival")
+    timestamp = datetime(2025, 3, 3, 8, 0, 12, 345)
+
+    database.store_trip_updates(MessageToDict(feed)["entity"], timestamp)
+    database.store_trip_update_rows(trip_update_rows(feed, timestamp))
+
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT fetched_at, trip_id, stop_id, stop_sequence, delay, uncertainty, update_timestamp "
+            "FROM trip_updates ORDER BY id"
+        )).fetchall()
+    assert len(rows) == 30
+    assert rows[:15] == rows[15:]
+    assert rows[0][4] is None and rows[0][5] is None
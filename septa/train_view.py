@@ -1,30 +1,47 @@
+import json
 from datetime import datetime
 
-from septa.core.fetcher import fetch_data
+from septa.core.fetcher import fetch_if_changed, mark_stored
 from septa.core.logger import setup_logging
-from septa.core.utils import create_dir
+from septa.core.recorder import record
 from septa.core.database import store_train_view, init_db
-from config import API_URLS, TRAIN_VIEW_LOG_DIR
+from septa.core.metrics import write_metrics
+from config import API_URLS
 
 logger = setup_logging("train_view")
-create_dir(TRAIN_VIEW_LOG_DIR)
 
 
-def fetch_and_store_train_view():
+def process_train_view(payload, timestamp):
+    """Parse one raw TrainView response and store it as the snapshot at `timestamp`.
+
+    Returns True unless storing failed.
+    """
+    data = json.loads(payload)
+    if not data:
+        logger.warning("Received empty Train View data.")
+        return True
+    if not store_train_view(data, timestamp):
+        return False
+    logger.info(f"Train View data stored.")
+    return True
+
+
+def fetch_and_store_train_view(session=None):
     try:
         logger.info("Starting Train View scraper...")
-        data = fetch_data(API_URLS["train_view"])
-        if not data:
-            logger.warning("Received empty Train View data.")
+        payload = fetch_if_changed("train_view", API_URLS["train_view"], session=session)
+        if payload is None:
             return
         timestamp = datetime.utcnow()
-        init_db()
-        store_train_view(data, timestamp)
-        logger.info(f"Train View data stored.")
+        record("train_view", payload, timestamp)
+        if process_train_view(payload, timestamp):
+            mark_stored("train_view")
 
     except Exception as e:
         logger.error(f"Failed to fetch or store Train View data: {e}")
 
 
 if __name__ == "__main__":
+    init_db()
     fetch_and_store_train_view()
+    write_metrics("train_view")
@@ -0,0 +1,303 @@
+"""Train trajectories from `train_view` snapshots, snapped to the GTFS network.
+
+Run with `python -m septa.trajectories [YYYY-MM-DD]` to print per-train
+movement and stopped-time totals for one service day (default: yesterday).
+
+Positions are grouped by train and service day, then get the time and
+distance since the previous snapshot, a speed and, while stopped, a dwell
+time. Each position is snapped to the nearest GTFS stop and to the nearest
+segment of a GTFS shape through `GridIndex`, a uniform grid over a local
+metric projection, so a day of snapshots for the whole network is a few
+vectorised passes instead of a distance scan per point.
+"""
+import math
+import sys
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from septa.core.database import get_engine, train_view_source
+from septa.core.logger import setup_logging
+
+logger = setup_logging("trajectories")
+
+# Equirectangular projection around Philadelphia; good to a few metres
+# across the regional rail network.
+REFERENCE_LAT = 40.0
+METERS_PER_DEGREE = 111_320.0
+_LON_SCALE = METERS_PER_DEGREE * math.cos(math.radians(REFERENCE_LAT))
+
+STOP_CELL_METERS = 1000.0     # also the farthest a position snaps to a stop
+SHAPE_CELL_METERS = 100.0     # also the farthest a position snaps to a shape
+AT_STOP_METERS = 150.0        # within this of a stop counts as being at it
+STOPPED_SPEED_MPS = 1.0       # slower than this counts as stopped
+MAX_GAP_SECONDS = 600         # longer gaps start a new trajectory segment
+SNAP_CHUNK = 100_000          # positions per vectorised snapping pass
+
+SERVICE_TIMEZONE = "America/New_York"
+SERVICE_DAY_START_HOUR = 4    # trips before 4am local belong to the previous day
+
+
+def project(lat, lon):
+    """Project degrees to metres (x east, y north) around REFERENCE_LAT."""
+    return np.asarray(lon, dtype="float64") * _LON_SCALE, np.asarray(lat, dtype="float64") * METERS_PER_DEGREE
+
+
+class GridIndex:
+    """Uniform grid over items with a bounding box, for radius-limited nearest lookups.
+
+    Each item is listed in every cell its bounding box touches, and a query
+    looks at the 3x3 block of cells around it, so every item within
+    `cell_size` of the query is a candidate.
+    """
+
+    _OFFSET = 1 << 20
+
+    def __init__(self, min_x, min_y, max_x, max_y, cell_size):
+        self.cell_size = cell_size
+        x0, y0 = self._cell(min_x), self._cell(min_y)
+        x1, y1 = self._cell(max_x), self._cell(max_y)
+        spans = (x1 - x0 + 1) * (y1 - y0 + 1)
+
+        item = np.repeat(np.arange(len(spans)), spans)
+        within = np.arange(len(item)) - np.repeat(np.cumsum(spans) - spans, spans)
+        height = np.repeat(y1 - y0 + 1, spans)
+        keys = self._key(np.repeat(x0, spans) + within // height, np.repeat(y0, spans) + within % height)
+
+        order = np.argsort(keys, kind="stable")
+        self.items = item[order]
+        # Occupied cells, sorted, with the slice of `items` listed in each.
+        self.cells, self.cell_start, self.cell_count = np.unique(
+            keys[order], return_index=True, return_counts=True
+        )
+
+    def _cell(self, value):
+        return np.floor(np.asarray(value) / self.cell_size).astype("int64")
+
+    def _key(self, cx, cy):
+        return ((cx + self._OFFSET) << 22) | (cy + self._OFFSET)
+
+    def candidates(self, x, y):
+        """Return (query index, item index) pairs for the items near each query point."""
+        if not len(self.cells):
+            return np.empty(0, dtype="int64"), np.empty(0, dtype="int64")
+        cx, cy = self._cell(x), self._cell(y)
+        queries, items = [], []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                key = self._key(cx + dx, cy + dy)
+                cell = np.minimum(np.searchsorted(self.cells, key), len(self.cells) - 1)
+                occupied = self.cells[cell] == key
+                start = self.cell_start[cell]
+                count = np.where(occupied, self.cell_count[cell], 0)
+                query = np.repeat(np.arange(len(key)), count)
+                offset = np.arange(len(query)) - np.repeat(np.cumsum(count) - count, count)
+                queries.append(query)
+                items.append(self.items[np.repeat(start, count) + offset])
+        return np.concatenate(queries), np.concatenate(items)
+
+
+def _nearest(queries, items, distances, count, max_distance):
+    """Per query, the closest candidate within `max_distance`; -1/NaN when none."""
+    best_distance = np.full(count, np.inf)
+    np.minimum.at(best_distance, queries, distances)
+    best_distance[best_distance > max_distance] = np.nan
+
+    best_item = np.full(count, -1, dtype="int64")
+    hit = distances == best_distance[queries]
+    best_item[queries[hit]] = items[hit]
+    return best_item, best_distance
+
+
+class RailNetwork:
+    """GTFS stops and shape segments with grid indexes, built once per GTFS load."""
+
+    def __init__(self, stops, shapes):
+        self.stop_ids = stops["stop_id"].to_numpy()
+        self.stop_x, self.stop_y = project(stops["stop_lat"], stops["stop_lon"])
+        self.stop_index = GridIndex(self.stop_x, self.stop_y, self.stop_x, self.stop_y, STOP_CELL_METERS)
+
+        shapes = shapes.sort_values(["shape_id", "shape_pt_sequence"], kind="stable")
+        x, y = project(shapes["shape_pt_lat"], shapes["shape_pt_lon"])
+        shape_ids = shapes["shape_id"].to_numpy()
+        same_shape = shape_ids[1:] == shape_ids[:-1]
+        start = np.flatnonzero(same_shape)
+
+        self.segment_shape = shape_ids[start]
+        self.ax, self.ay = x[start], y[start]
+        self.bx, self.by = x[start + 1], y[start + 1]
+        length = np.hypot(self.bx - self.ax, self.by - self.ay)
+        # Distance along the shape at each segment start.
+        new_shape = np.r_[True, self.segment_shape[1:] != self.segment_shape[:-1]]
+        cumulative = np.cumsum(length) - length
+        self.segment_offset = cumulative - np.maximum.accumulate(np.where(new_shape, cumulative, 0))
+        self.segment_length = length
+        self.shape_index = GridIndex(
+            np.minimum(self.ax, self.bx), np.minimum(self.ay, self.by),
+            np.maximum(self.ax, self.bx), np.maximum(self.ay, self.by), SHAPE_CELL_METERS,
+        )
+
+    @classmethod
+    def from_gtfs(cls):
+        """Read stops and shapes from septa.sqlite."""
+        with get_engine("gtfs").connect() as conn:
+            stops = pd.read_sql(text(
+                "SELECT stop_id, stop_lat, stop_lon FROM stops WHERE stop_lat IS NOT NULL AND stop_lon IS NOT NULL"
+            ), conn)
+            shapes = pd.read_sql(text(
+                "SELECT shape_id, shape_pt_lat, shape_pt_lon, shape_pt_sequence FROM shapes"
+            ), conn)
+        return cls(stops, shapes)
+
+    def snap(self, lat, lon):
+        """Snap positions to the network; returns a DataFrame aligned with the input.
+
+        Columns: stop_id / stop_distance of the nearest stop, and shape_id,
+        shape_dist (metres along the shape) and shape_offset (metres from
+        it) of the nearest shape segment. Positions out of range get NaN.
+        """
+        x, y = project(lat, lon)
+        parts = [self._snap_chunk(x[i:i + SNAP_CHUNK], y[i:i + SNAP_CHUNK]) for i in range(0, len(x), SNAP_CHUNK)]
+        if not parts:
+            return pd.DataFrame(columns=["stop_id", "stop_distance", "shape_id", "shape_dist", "shape_offset"])
+        return pd.concat(parts, ignore_index=True)
+
+    def _snap_chunk(self, x, y):
+        queries, stops = self.stop_index.candidates(x, y)
+        distances = np.hypot(x[queries] - self.stop_x[stops], y[queries] - self.stop_y[stops])
+        stop, stop_distance = _nearest(queries, stops, distances, len(x), STOP_CELL_METERS)
+
+        queries, segments = self.shape_index.candidates(x, y)
+        ax, ay = self.ax[segments], self.ay[segments]
+        dx, dy = self.bx[segments] - ax, self.by[segments] - ay
+        length_sq = dx * dx + dy * dy
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = np.clip(((x[queries] - ax) * dx + (y[queries] - ay) * dy) / length_sq, 0.0, 1.0)
+        t = np.nan_to_num(t)
+        distances = np.hypot(x[queries] - (ax + t * dx), y[queries] - (ay + t * dy))
+        along = self.segment_offset[segments] + t * self.segment_length[segments]
+        pair, shape_offset = _nearest(queries, np.arange(len(queries)), distances, len(x), SHAPE_CELL_METERS)
+
+        stop_id = np.full(len(x), None, dtype=object)
+        stop_id[stop >= 0] = self.stop_ids[stop[stop >= 0]]
+        found = pair >= 0
+        shape_id = np.full(len(x), None, dtype=object)
+        shape_id[found] = self.segment_shape[segments[pair[found]]]
+        shape_dist = np.full(len(x), np.nan)
+        shape_dist[found] = along[pair[found]]
+        return pd.DataFrame({
+            "stop_id": stop_id,
+            "stop_distance": stop_distance,
+            "shape_id": shape_id,
+            "shape_dist": shape_dist,
+            "shape_offset": shape_offset,
+        })
+
+
+def service_day(timestamps):
+    """Service day of naive-UTC `timestamps`: local date, with early mornings on the day before."""
+    local = pd.to_datetime(timestamps).dt.tz_localize("UTC").dt.tz_convert(SERVICE_TIMEZONE)
+    return (local - pd.Timedelta(hours=SERVICE_DAY_START_HOUR)).dt.date
+
+
+def load_positions(start, end):
+    """`train_view` rows with `timestamp` in [start, end), as a DataFrame."""
+    source, time_column, bound = train_view_source()
+    query = text(
+        f"SELECT timestamp, train_id, lat, lon, heading, late, line, next_stop FROM {source} "
+        f"WHERE {time_column} >= :start AND {time_column} < :end AND lat IS NOT NULL AND lon IS NOT NULL"
+    )
+    with get_engine("train_view").connect() as conn:
+        return pd.read_sql(query, conn, params={"start": bound(start), "end": bound(end)},
+                           parse_dates=["timestamp"])
+
+
+def build_trajectories(positions, network=None):
+    """Add movement (and, with `network`, snapping) columns to `positions`.
+
+    Rows are sorted by train, service day and time. New columns: service_day,
+    segment (a new one after a gap over MAX_GAP_SECONDS), elapsed_s and
+    distance_m since the previous snapshot, speed_mps, stopped, dwell_s
+    (time since the train stopped, 0 while moving) and the `RailNetwork.snap`
+    columns plus at_stop.
+    """
+    df = positions.copy()
+    df["service_day"] = service_day(df["timestamp"])
+    df = df.sort_values(["train_id", "service_day", "timestamp"], kind="stable").reset_index(drop=True)
+
+    x, y = project(df["lat"], df["lon"])
+    seconds = (df["timestamp"] - pd.Timestamp(0)).dt.total_seconds().to_numpy()
+    same_train = np.r_[False, (df["train_id"].to_numpy()[1:] == df["train_id"].to_numpy()[:-1])
+                       & (df["service_day"].to_numpy()[1:] == df["service_day"].to_numpy()[:-1])]
+    elapsed = np.where(same_train, np.r_[np.nan, np.diff(seconds)], np.nan)
+    continues = same_train & (elapsed <= MAX_GAP_SECONDS)
+    distance = np.where(continues, np.r_[np.nan, np.hypot(np.diff(x), np.diff(y))], np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        speed = np.where(elapsed > 0, distance / elapsed, np.nan)
+
+    df["segment"] = np.cumsum(~continues)
+    df["elapsed_s"] = np.where(continues, elapsed, np.nan)
+    df["distance_m"] = distance
+    df["speed_mps"] = speed
+    stopped = np.nan_to_num(speed, nan=np.inf) < STOPPED_SPEED_MPS
+    df["stopped"] = stopped
+
+    # Dwell: time since the snapshot before the first slow step of the run.
+    run_start = stopped & ~np.r_[False, stopped[:-1]]
+    starts = np.flatnonzero(run_start)
+    dwell = np.zeros(len(df))
+    if len(starts):
+        arrived = seconds[starts[np.maximum(np.cumsum(run_start) - 1, 0)] - 1]
+        dwell = np.where(stopped, seconds - arrived, 0.0)
+    df["dwell_s"] = dwell
+
+    if network is not None:
+        snapped = network.snap(df["lat"].to_numpy(), df["lon"].to_numpy())
+        df = pd.concat([df, snapped], axis=1)
+        df["at_stop"] = df["stop_distance"] <= AT_STOP_METERS
+    return df
+
+
+def dwell_events(trajectory):
+    """One row per stopped run at a stop: train, stop, arrival, departure and dwell seconds."""
+    stopped = trajectory[trajectory["stopped"] & trajectory["at_stop"]]
+    if stopped.empty:
+        return pd.DataFrame(columns=["train_id", "service_day", "stop_id", "arrival", "departure", "dwell_s"])
+    runs = stopped.groupby(["train_id", "service_day", "segment", "stop_id"], sort=False)
+    events = runs.agg(departure=("timestamp", "max"), dwell_s=("dwell_s", "max")).reset_index()
+    events["arrival"] = events["departure"] - pd.to_timedelta(events["dwell_s"], unit="s")
+    return events[["train_id", "service_day", "stop_id", "arrival", "departure", "dwell_s"]]
+
+
+def day_summary(day, network=None):
+    """Per-train distance, top speed and time stopped for one service day."""
+    local_start = pd.Timestamp(datetime.combine(day, time(SERVICE_DAY_START_HOUR)), tz=SERVICE_TIMEZONE)
+    start = local_start.tz_convert("UTC").tz_localize(None).to_pydatetime()
+    positions = load_positions(start, start + timedelta(days=1))
+    if positions.empty:
+        return pd.DataFrame()
+    trajectory = build_trajectories(positions, network)
+    trajectory["stopped_s"] = trajectory["elapsed_s"].where(trajectory["stopped"], 0.0)
+    summary = trajectory.groupby(["train_id", "service_day"]).agg(
+        snapshots=("timestamp", "size"),
+        distance_m=("distance_m", "sum"),
+        max_speed_mps=("speed_mps", "max"),
+        stopped_s=("stopped_s", "sum"),
+    ).reset_index()
+    return pd.DataFrame({
+        "train_id": summary["train_id"],
+        "service_day": summary["service_day"],
+        "snapshots": summary["snapshots"],
+        "distance_km": summary["distance_m"] / 1000,
+        "max_speed_kmh": summary["max_speed_mps"] * 3.6,
+        "stopped_minutes": summary["stopped_s"] / 60,
+    })
+
+
+if __name__ == "__main__":
+    day = date.fromisoformat(sys.argv[1]) if len(sys.argv) > 1 else date.today() - timedelta(days=1)
+    summary = day_summary(day, RailNetwork.from_gtfs())
+    logger.info(f"Built trajectories for {len(summary)} trains on {day}.")
+    print(summary.to_string(index=False))
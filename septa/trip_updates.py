@@ -1,40 +1,57 @@
-import requests
 from google.transit import gtfs_realtime_pb2
-from google.protobuf.json_format import MessageToDict
 from datetime import datetime
 
-from septa.core.utils import create_dir
 from septa.core.logger import setup_logging
-from septa.core.database import store_trip_updates, init_trip_updates_db
-from config import API_URLS, TRIP_UPDATES_LOG_DIR
+from septa.core.database import store_trip_update_rows, init_trip_updates_db
+from septa.core.fetcher import fetch_if_changed, mark_stored
+from septa.core.gtfs_rt import feed_header_timestamp, trip_update_rows
+from septa.core.metrics import stage, write_metrics
+from septa.core.recorder import record
+from config import API_URLS
 
 logger = setup_logging("trip_updates")
-create_dir(TRIP_UPDATES_LOG_DIR)
 
 
-def fetch_trip_updates():
+def process_trip_updates(payload, timestamp):
+    """Parse one raw GTFS-RT TripUpdates response and store it as fetched at `timestamp`.
+
+    Returns True unless storing failed.
+    """
+    with stage("fetch_trip_updates", step="parse") as timing:
+        feed = gtfs_realtime_pb2.FeedMessage()
+        feed.ParseFromString(payload)
+        timing.rows = len(feed.entity)
+        timing.bytes = len(payload)
+    if not feed.entity:
+        logger.warning("No trip updates found.")
+        return True
+
+    with stage("fetch_trip_updates", step="rows") as timing:
+        rows = trip_update_rows(feed, timestamp)
+        timing.rows = len(rows)
+    if not store_trip_update_rows(rows):
+        return False
+    logger.info(f"Stored {len(rows)} stop updates from {len(feed.entity)} trip updates in SQLite.")
+    return True
+
+
+def fetch_trip_updates(session=None):
     try:
         logger.info("Starting Trip Updates scraper...")
-        response = requests.get(API_URLS["trip_updates"], timeout=15)
-        response.raise_for_status()
-        if not response.content:
+        payload = fetch_if_changed(
+            "trip_updates", API_URLS["trip_updates"], session=session, version=feed_header_timestamp,
+        )
+        if payload is None:
+            return
+        if not payload:
             logger.warning("Received empty trip updates.")
             return
 
-        feed = gtfs_realtime_pb2.FeedMessage()
-        feed.ParseFromString(response.content)
-        data = MessageToDict(feed)
-        trip_updates = data.get("entity", [])
-        if trip_updates:
-            timestamp = datetime.utcnow()
-            store_trip_updates(trip_updates, timestamp)
-            logger.info(f"Stored {len(trip_updates)} trip updates in SQLite.")
-
-        else:
-            logger.warning("No trip updates found.")
+        timestamp = datetime.utcnow()
+        record("trip_updates", payload, timestamp)
+        if process_trip_updates(payload, timestamp):
+            mark_stored("trip_updates")
         logger.info("Trip Updates scraping completed.")
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error fetching trip updates: {e}")
     except Exception as e:
         logger.error(f"Error processing trip updates: {e}")
 
@@ -42,3 +59,4 @@ def fetch_trip_updates():
 if __name__ == "__main__":
     init_trip_updates_db()
     fetch_trip_updates()
+    write_metrics("trip_updates")